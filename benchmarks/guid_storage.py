@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Benchmark of hex (CHAR(32)) against binary (16 bytes) storage of GUID columns on SQLite.
+
+Creates the calendar, event, recur_event and shift tables in each storage, fills a few calendars with events and
+shifts, and reports the size of the GUID indexes and the latency of loading a month of events with their shifts,
+the queries behind get_events:
+
+    python benchmarks/guid_storage.py
+    python benchmarks/guid_storage.py --events 200000 --calendars 10
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.orm import Session, selectinload
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crewlog import db
+from crewlog.auth.models import Role  # noqa: F401, mapped by relationships of Calendar
+from crewlog.calendar.models import Calendar
+from crewlog.database import GUID_STORAGE_HEX, GUID_STORAGE_BINARY, set_guid_storage, uuid7
+from crewlog.event.models import Event, RecurEvent, Shift
+
+TABLES = [Calendar.__table__, RecurEvent.__table__, Event.__table__, Shift.__table__]
+
+
+def fill(engine, calendars, events):
+    calendar_ids = [uuid7() for _ in range(calendars)]
+    with engine.begin() as connection:
+        connection.execute(Calendar.__table__.insert(), [{'id': calendar_id, 'name': 'Calendar'}
+                                                         for calendar_id in calendar_ids])
+    first = datetime(2026, 1, 1)
+    random.seed(1)
+    for offset in range(0, events, 10000):
+        event_rows, shift_rows = [], []
+        for _ in range(min(10000, events - offset)):
+            event_id = uuid7()
+            start = first + timedelta(minutes=random.randrange(365 * 24 * 4) * 15)
+            event_rows.append({'id': event_id, 'title': 'Event', 'description': '', 'start': start,
+                               'end': start + timedelta(hours=2), 'all_day': False, 'init_start': start,
+                               'hide': False, 'calendar_id': random.choice(calendar_ids)})
+            shift_rows.extend({'id': uuid7(), 'person': 'person {index}'.format(index=index), 'event_id': event_id}
+                              for index in range(random.randrange(3)))
+        with engine.begin() as connection:
+            connection.execute(Event.__table__.insert(), event_rows)
+            connection.execute(Shift.__table__.insert(), shift_rows)
+    return calendar_ids
+
+
+def index_size(connection):
+    """Size in bytes of all indexes, the GUID keys and foreign keys."""
+    return connection.execute(text("SELECT sum(pgsize) FROM dbstat WHERE name IN "
+                                   "(SELECT name FROM sqlite_master WHERE type = 'index')")).scalar()
+
+
+def get_month(session, calendar_id, start):
+    end = start + timedelta(days=31)
+    return session.scalars(select(Event).options(selectinload(Event.shifts))
+                           .where(Event.calendar_id == calendar_id)
+                           .where(Event.start <= end).where(Event.end >= start)).all()
+
+
+def run(storage, calendars, events, repeat):
+    set_guid_storage(storage)
+    engine = create_engine('sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'))
+    db.metadata.create_all(engine, tables=TABLES)
+    with engine.begin() as connection:
+        # the indexes used by range reads and shift lookups
+        connection.execute(text('CREATE INDEX ix_event_calendar_start ON event (calendar_id, start)'))
+        connection.execute(text('CREATE INDEX ix_shift_event_id ON shift (event_id)'))
+    calendar_ids = fill(engine, calendars, events)
+    with engine.connect() as connection:
+        size = index_size(connection)
+    timings = []
+    with Session(engine) as session:
+        for position in range(repeat):
+            started = time.perf_counter()
+            loaded = get_month(session, calendar_ids[position % calendars], datetime(2026, 1 + position % 12, 1))
+            timings.append(time.perf_counter() - started)
+            session.expunge_all()
+    timings.sort()
+    return size, timings[len(timings) // 2], len(loaded)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calendars', type=int, default=5)
+    parser.add_argument('--events', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    print('sqlite, {events} events in {calendars} calendars'.format(events=args.events, calendars=args.calendars))
+    print('{:<8}{:>14}{:>20}{:>16}'.format('storage', 'indexes', 'month of events', 'events'))
+    for storage in (GUID_STORAGE_HEX, GUID_STORAGE_BINARY):
+        size, latency, loaded = run(storage, args.calendars, args.events, args.repeat)
+        print('{:<8}{:>11.1f} MB{:>17.1f} ms{:>16}'.format(storage, size / 1024 / 1024, latency * 1000, loaded))
+
+
+if __name__ == '__main__':
+    main()
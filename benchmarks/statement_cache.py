@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark of the per-call Python overhead of the hot DAO queries.
+
+Runs each query against a small in-memory SQLite database, so the time is spent in Python rather than in the
+database: once as an ORM query built on every call, as the DAO functions used to do, and once as the statement
+built once at import that the DAO functions execute now.
+
+    python benchmarks/statement_cache.py
+"""
+import argparse
+import os
+import sys
+import timeit
+import warnings
+from datetime import datetime
+
+os.environ['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+warnings.filterwarnings('ignore')
+
+from sqlalchemy.orm import selectinload
+
+import crewlog.main  # noqa: F401, registers all models
+from crewlog import application, db
+from crewlog.auth import auth_dao
+from crewlog.auth.models import User, Role
+from crewlog.calendar import calendar_dao
+from crewlog.calendar.models import Calendar
+from crewlog.event import event_dao
+from crewlog.event.models import Event, RecurEvent, Shift
+
+START = datetime(2026, 10, 1)
+END = datetime(2026, 11, 1)
+
+
+def fill():
+    db.create_all()
+    calendar = Calendar(name='Bench')
+    user = User(username='bench@example.com', first_name='Bench', last_name='Mark', password='-',
+                roles=[Role(type=Role.OWNER, calendar=calendar, is_default=True)])
+    db.session.add(user)
+    db.session.flush()
+    calendar_id = calendar.id
+    for day in range(1, 29, 3):
+        event = Event(title='Event', description='', start=datetime(2026, 10, day, 10),
+                      end=datetime(2026, 10, day, 12), calendar_id=calendar_id)
+        event.shifts.append(Shift(person='Volunteer'))
+        db.session.add(event)
+    db.session.add(RecurEvent(title='Weekly', description='', start=START, end=START, start_recur=START,
+                              rrule='FREQ=WEEKLY', calendar_id=calendar_id))
+    db.session.commit()
+    return user.alias_id, calendar_id
+
+
+def cases(alias_id, calendar_id):
+    """Pairs of (name, query built per call, cached statement)."""
+    range_params = {'calendar_id': calendar_id, 'start': START, 'end': END}
+    return [
+        ('events in range',
+         lambda: Event.query.options(selectinload(Event.shifts)).filter(Event.calendar_id == calendar_id)
+         .filter(Event.start <= END).filter(Event.end >= START).all(),
+         lambda: db.session.scalars(event_dao._CALENDAR_RANGE[0], range_params).all()),
+        ('recurrent events',
+         lambda: RecurEvent.query.filter(RecurEvent.calendar_id == calendar_id).filter(RecurEvent.start_recur <= END)
+         .filter((RecurEvent.end_recur >= START) | (RecurEvent.end_recur.is_(None))).all(),
+         lambda: db.session.scalars(event_dao._RECUR_EVENTS_RANGE,
+                                    {'calendar_ids': [calendar_id], 'start': START, 'end': END}).all()),
+        ('report',
+         lambda: db.session.query(Shift.person, Event.title, Event.start, Event.end, Event.id, Event.description)
+         .join(Event, Shift.event_id == Event.id).filter(Event.calendar_id == calendar_id)
+         .filter(Event.start <= END).filter(Event.end >= START).all(),
+         lambda: db.session.execute(event_dao._REPORT[Shift][0], range_params).all()),
+        ('user by id',
+         lambda: User.query.filter(User.alias_id == alias_id).first(),
+         lambda: db.session.scalars(auth_dao._USER_BY_ALIAS_ID, {'alias_id': alias_id}).first()),
+        ('shares',
+         lambda: Role.query.options(selectinload(Role.user)).filter(Role.calendar_id == calendar_id).all(),
+         lambda: db.session.scalars(calendar_dao._SHARES, {'calendar_id': calendar_id}).all()),
+    ]
+
+
+def measure(function, number):
+    # the identity map would return the loaded objects without building them again
+    def call():
+        function()
+        db.session.expunge_all()
+    call()
+    return min(timeit.repeat(call, number=number, repeat=5)) / number * 1000000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--number', type=int, default=2000, help='calls per measurement')
+    args = parser.parse_args()
+
+    with application.app_context():
+        alias_id, calendar_id = fill()
+        print('{:<20}{:>16}{:>16}{:>10}'.format('query', 'built per call', 'cached', 'saved'))
+        for name, built, cached in cases(alias_id, calendar_id):
+            before, after = measure(built, args.number), measure(cached, args.number)
+            print('{:<20}{:>13.1f} us{:>13.1f} us{:>9.0f}%'.format(name, before, after, (before - after) / before * 100))
+
+
+if __name__ == '__main__':
+    main()
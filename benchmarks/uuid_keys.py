@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Benchmark of random (uuid4) against time-ordered (uuid7) primary keys.
+
+Inserts rows keyed like events and shifts, a primary key and an indexed reference to a parent row, in batches of
+one transaction each and reports the insert throughput and the size of both indexes. Runs on SQLite by default:
+
+    python benchmarks/uuid_keys.py
+    python benchmarks/uuid_keys.py --database-uri postgresql://user@localhost/crewlog_bench --rows 1000000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+from sqlalchemy import Column, Index, MetaData, Table, create_engine, text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crewlog.database import GUID, uuid7
+
+GENERATORS = {'uuid4': uuid.uuid4, 'uuid7': uuid7}
+
+
+def create_table(engine, name):
+    table = Table(name, MetaData(),
+                  Column('id', GUID(), primary_key=True),
+                  Column('parent_id', GUID(), nullable=False),
+                  Index('ix_{name}_parent_id'.format(name=name), 'parent_id'))
+    table.drop(engine, checkfirst=True)
+    table.create(engine)
+    return table
+
+
+def index_sizes(connection, table):
+    """Get the size in bytes of the primary key and the parent index."""
+    if connection.dialect.name == 'postgresql':
+        query = text('SELECT pg_relation_size(:name)')
+        names = ['{table}_pkey'.format(table=table.name), 'ix_{table}_parent_id'.format(table=table.name)]
+    elif connection.dialect.name == 'sqlite':
+        query = text('SELECT sum(pgsize) FROM dbstat WHERE name = :name')
+        names = ['sqlite_autoindex_{table}_1'.format(table=table.name), 'ix_{table}_parent_id'.format(table=table.name)]
+    else:
+        return None, None
+    return tuple(connection.execute(query, {'name': name}).scalar() for name in names)
+
+
+def run(engine, kind, rows, batch_size):
+    generate = GENERATORS[kind]
+    table = create_table(engine, 'bench_keys_{kind}'.format(kind=kind))
+    parent_id = generate()
+    elapsed = 0.0
+    for offset in range(0, rows, batch_size):
+        batch = []
+        for position in range(min(batch_size, rows - offset)):
+            # a few rows per parent, like the shifts of an event
+            if position % 4 == 0:
+                parent_id = generate()
+            batch.append({'id': generate(), 'parent_id': parent_id})
+        started = time.perf_counter()
+        with engine.begin() as connection:
+            connection.execute(table.insert(), batch)
+        elapsed += time.perf_counter() - started
+    with engine.connect() as connection:
+        primary_key_size, parent_size = index_sizes(connection, table)
+    table.drop(engine)
+    return rows / elapsed, primary_key_size, parent_size
+
+
+def format_size(size):
+    return '-' if size is None else '{size:.1f} MB'.format(size=size / 1024 / 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-uri', help='database to run on, a temporary SQLite file by default')
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    database_uri = args.database_uri
+    if not database_uri:
+        database_uri = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    engine = create_engine(database_uri)
+    print('{dialect}, {rows} rows in batches of {batch_size}'.format(
+        dialect=engine.dialect.name, rows=args.rows, batch_size=args.batch_size))
+    print('{:<8}{:>14}{:>16}{:>16}'.format('keys', 'rows/s', 'primary key', 'parent index'))
+    for kind in GENERATORS:
+        throughput, primary_key_size, parent_size = run(engine, kind, args.rows, args.batch_size)
+        print('{:<8}{:>14.0f}{:>16}{:>16}'.format(kind, throughput, format_size(primary_key_size),
+                                                format_size(parent_size)))
+
+
+if __name__ == '__main__':
+    main()
@@ -5,6 +5,9 @@ from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 from flask_wtf.csrf import CSRFProtect
+from sqlalchemy.engine import make_url
+
+from crewlog.database import set_guid_storage
 
 # Create Flask app
 application = Flask(__name__,
@@ -33,13 +36,70 @@ if os.environ.get("SMTP_PORT"):
     application.config['SMTP_PORT'] = os.environ.get("SMTP_PORT")
 if os.environ.get("APP_URL"):
     application.config['APP_URL'] = os.environ.get("APP_URL")
+if os.environ.get("ARCHIVE_AFTER_DAYS"):
+    application.config['ARCHIVE_AFTER_DAYS'] = int(os.environ.get("ARCHIVE_AFTER_DAYS"))
+if os.environ.get("PARTITION_EVENTS"):
+    application.config['PARTITION_EVENTS'] = os.environ.get("PARTITION_EVENTS").lower() in ('1', 'true', 'yes')
+if os.environ.get("PARTITION_MONTHS_AHEAD"):
+    application.config['PARTITION_MONTHS_AHEAD'] = int(os.environ.get("PARTITION_MONTHS_AHEAD"))
+if os.environ.get("EVENT_INDEX_MIN_EVENTS"):
+    application.config['EVENT_INDEX_MIN_EVENTS'] = int(os.environ.get("EVENT_INDEX_MIN_EVENTS"))
+if os.environ.get("EVENT_INDEX_MAX_MB"):
+    application.config['EVENT_INDEX_MAX_MB'] = int(os.environ.get("EVENT_INDEX_MAX_MB"))
+if os.environ.get("OCCURRENCE_SNAPSHOT_DIR"):
+    application.config['OCCURRENCE_SNAPSHOT_DIR'] = os.environ.get("OCCURRENCE_SNAPSHOT_DIR")
+if os.environ.get("OCCURRENCE_SNAPSHOT_PAST_DAYS"):
+    application.config['OCCURRENCE_SNAPSHOT_PAST_DAYS'] = int(os.environ.get("OCCURRENCE_SNAPSHOT_PAST_DAYS"))
+if os.environ.get("OCCURRENCE_SNAPSHOT_FUTURE_DAYS"):
+    application.config['OCCURRENCE_SNAPSHOT_FUTURE_DAYS'] = int(os.environ.get("OCCURRENCE_SNAPSHOT_FUTURE_DAYS"))
+if os.environ.get("OCCURRENCE_SNAPSHOT_MIN_OCCURRENCES"):
+    application.config['OCCURRENCE_SNAPSHOT_MIN_OCCURRENCES'] = \
+        int(os.environ.get("OCCURRENCE_SNAPSHOT_MIN_OCCURRENCES"))
+if os.environ.get("PURGE_CHUNK_SIZE"):
+    application.config['PURGE_CHUNK_SIZE'] = int(os.environ.get("PURGE_CHUNK_SIZE"))
+if os.environ.get("RANGE_CACHE"):
+    application.config['RANGE_CACHE'] = None if os.environ.get("RANGE_CACHE").lower() == 'none' \
+        else os.environ.get("RANGE_CACHE").lower()
+if os.environ.get("RANGE_CACHE_SIZE"):
+    application.config['RANGE_CACHE_SIZE'] = int(os.environ.get("RANGE_CACHE_SIZE"))
+if os.environ.get("RANGE_CACHE_DIR"):
+    application.config['RANGE_CACHE_DIR'] = os.environ.get("RANGE_CACHE_DIR")
+if os.environ.get("RANGE_WARM_THREADS"):
+    application.config['RANGE_WARM_THREADS'] = int(os.environ.get("RANGE_WARM_THREADS"))
+if os.environ.get("RANGE_WARM_CPU_SHARE"):
+    application.config['RANGE_WARM_CPU_SHARE'] = float(os.environ.get("RANGE_WARM_CPU_SHARE"))
+if os.environ.get("COMPRESSION"):
+    application.config['COMPRESSION'] = os.environ.get("COMPRESSION").lower() in ('1', 'true', 'yes')
+if os.environ.get("COMPRESSION_MIN_SIZE"):
+    application.config['COMPRESSION_MIN_SIZE'] = int(os.environ.get("COMPRESSION_MIN_SIZE"))
+if os.environ.get("COMPRESSION_GZIP_LEVEL"):
+    application.config['COMPRESSION_GZIP_LEVEL'] = int(os.environ.get("COMPRESSION_GZIP_LEVEL"))
+if os.environ.get("COMPRESSION_BROTLI_QUALITY"):
+    application.config['COMPRESSION_BROTLI_QUALITY'] = int(os.environ.get("COMPRESSION_BROTLI_QUALITY"))
+if os.environ.get("INDEX_BOOTSTRAP"):
+    application.config['INDEX_BOOTSTRAP'] = os.environ.get("INDEX_BOOTSTRAP").lower() in ('1', 'true', 'yes')
+if os.environ.get("FRAGMENT_CACHE"):
+    application.config['FRAGMENT_CACHE'] = os.environ.get("FRAGMENT_CACHE").lower() in ('1', 'true', 'yes')
+if os.environ.get("JINJA_BYTECODE_CACHE"):
+    application.config['JINJA_BYTECODE_CACHE'] = os.environ.get("JINJA_BYTECODE_CACHE").lower() in ('1', 'true', 'yes')
+if os.environ.get("JINJA_BYTECODE_CACHE_DIR"):
+    application.config['JINJA_BYTECODE_CACHE_DIR'] = os.environ.get("JINJA_BYTECODE_CACHE_DIR")
+if os.environ.get("INVALIDATION_DIR"):
+    application.config['INVALIDATION_DIR'] = os.environ.get("INVALIDATION_DIR")
+if os.environ.get("INVALIDATION_MAX_AGE"):
+    application.config['INVALIDATION_MAX_AGE'] = float(os.environ.get("INVALIDATION_MAX_AGE"))
+if os.environ.get("GUID_STORAGE"):
+    application.config['GUID_STORAGE'] = os.environ.get("GUID_STORAGE").lower()
+
+set_guid_storage(application.config['GUID_STORAGE'],
+                 make_url(application.config['SQLALCHEMY_DATABASE_URI']).get_backend_name())
 
 # Enable CORS for API routes
 CORS(application,
      resources={r"/api/*": {"origins": "*"}},
      supports_credentials=True,
      allow_headers=["Content-Type", "Authorization", "X-Requested-With"],
-     methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"])
+     methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"])
 
 # Initialize CSRF protection but disable it globally
 # We'll enable it only for non-API routes
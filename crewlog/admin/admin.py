@@ -1,8 +1,11 @@
 """Admin blueprint for user management and RBAC settings."""
+import click
 import flask_login
 from flask import Blueprint, render_template, flash, redirect, url_for
 
+from crewlog import application, db
 from crewlog.admin import admin_dao
+from crewlog.database import GUID_STORAGE_HEX, GUID_STORAGE_BINARY, convert_guids
 from crewlog.admin.admin_forms import EmailConfigForm, TestEmailForm
 
 bp = Blueprint("admin", __name__, url_prefix="/admin", template_folder="templates")
@@ -94,4 +97,24 @@ def render_edit_email_config(config_id):
         return "Configuration not found", 404
     
     form = EmailConfigForm(obj=config)
-    return render_template('admin/email_config_modal.html', form=form, config=config)
\ No newline at end of file
+    return render_template('admin/email_config_modal.html', form=form, config=config)
+
+
+@application.cli.command('convert-guids')
+@click.option('--to', 'storage', type=click.Choice([GUID_STORAGE_HEX, GUID_STORAGE_BINARY]), required=True,
+              help='GUID storage to convert to')
+@click.option('--chunk-size', type=int, default=1000, help='values converted per transaction')
+def convert_guid_columns(storage, chunk_size):
+    """Convert the GUID columns of an SQLite or MySQL database to hex or binary storage.
+
+    Stop the workers first, the conversion can be interrupted and run again. Start them with GUID_STORAGE set to
+    the new storage afterwards.
+    """
+    def progress(table, column, count):
+        click.echo('  {table}.{column}: {count}'.format(table=table, column=column, count=count))
+
+    try:
+        converted = convert_guids(db.engine, db.metadata, storage, chunk_size=chunk_size, progress=progress)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo('Converted {converted} values, set GUID_STORAGE={storage}'.format(converted=converted, storage=storage))
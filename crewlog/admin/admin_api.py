@@ -3,7 +3,6 @@ import flask_login
 from flask import Blueprint, request, flash, url_for, jsonify
 from werkzeug.utils import redirect
 
-from crewlog import db
 from crewlog.admin import admin_dao
 from crewlog.auth.models import EmailConfig
 
@@ -64,21 +63,16 @@ def update_user(user_id):
                 flash(message, 'danger')
                 return redirect(url_for('admin.users_list'))
     
+    values = {}
     if 'firstName' in request.form:
-        user.first_name = request.form['firstName']
+        values['first_name'] = request.form['firstName']
     if 'lastName' in request.form:
-        user.last_name = request.form['lastName']
+        values['last_name'] = request.form['lastName']
     
-    # Handle admin checkbox
-    is_admin = 'isAdmin' in request.form
-    user.is_admin = is_admin
-    
-    # Handle verified checkbox
-    is_verified = 'isVerified' in request.form
-    user.is_verified = is_verified
-    
-    db.session.merge(user)
-    db.session.commit()
+    # Handle admin and verified checkboxes
+    values['is_admin'] = 'isAdmin' in request.form
+    values['is_verified'] = 'isVerified' in request.form
+    admin_dao.update_user(user_id, **values)
     
     flash('User updated successfully.', 'success')
     return redirect(url_for('admin.users_list'))
@@ -5,8 +5,10 @@ from functools import wraps
 import flask_login
 from flask import flash, current_app
 
-from crewlog import db
+from crewlog import db, invalidation
 from crewlog.auth.models import User, EmailConfig
+from crewlog.calendar import purge, calendar_dao
+from crewlog.calendar.models import Calendar, PurgeJob
 from crewlog.auth.email_service import get_email_service
 
 
@@ -49,6 +51,7 @@ def toggle_admin_status(user_id):
     if user:
         user.is_admin = not user.is_admin
         db.session.merge(user)
+        invalidation.user_changed(user.id)
         db.session.commit()
         return user
     return None
@@ -60,6 +63,7 @@ def set_admin_status(user_id, is_admin):
     if user:
         user.is_admin = is_admin
         db.session.merge(user)
+        invalidation.user_changed(user.id)
         db.session.commit()
         return user
     return None
@@ -71,11 +75,29 @@ def reset_user_password(user_id, new_password):
     if user:
         user.set_password(new_password)
         db.session.merge(user)
+        invalidation.user_changed(user.id)
         db.session.commit()
         return True
     return False
 
 
+def update_user(user_id, **values):
+    """Set the given first_name, last_name, is_admin and is_verified of a user (admin action)."""
+    user = get_user_by_id(user_id)
+    if user:
+        changed = {name: value for name, value in values.items() if getattr(user, name) != value}
+        for name, value in changed.items():
+            setattr(user, name, value)
+        if changed:
+            db.session.merge(user)
+            # names are part of the shares of the user's calendars
+            calendar_dao.mark_user_calendars_changed(user.id)
+            invalidation.user_changed(user.id)
+            db.session.commit()
+        return user
+    return None
+
+
 def update_user_email(user_id, new_email):
     """Update a user's email address (admin action)."""
     user = get_user_by_id(user_id)
@@ -88,6 +110,8 @@ def update_user_email(user_id, new_email):
         user.username = new_email
         user.is_verified = False  # Require re-verification
         db.session.merge(user)
+        calendar_dao.mark_user_calendars_changed(user.id)
+        invalidation.user_changed(user.id)
         db.session.commit()
         return True, "Email updated successfully"
     return False, "User not found"
@@ -101,8 +125,17 @@ def delete_user(user_id):
         if str(user.id) == str(flask_login.current_user.id):
             return False, "Cannot delete your own account"
         
+        calendar_ids = [role.calendar_id for role in user.roles]
+        calendar_dao.mark_user_calendars_changed(user.id)
+        invalidation.user_changed(user.id)
         db.session.delete(user)
+        db.session.flush()
+        # calendars nobody has access to any more are purged instead of being left behind
+        orphaned = Calendar.query.filter(Calendar.id.in_(calendar_ids)).filter(Calendar.deleted_at.is_(None)) \
+            .filter(~Calendar.roles.any()).all()
+        jobs = [purge.create_job(calendar, requested_by_id=flask_login.current_user.id) for calendar in orphaned]
         db.session.commit()
+        purge.start(jobs)
         return True, "User deleted successfully"
     return False, "User not found"
 
@@ -113,6 +146,7 @@ def verify_user(user_id):
     if user:
         user.is_verified = True
         db.session.merge(user)
+        invalidation.user_changed(user.id)
         db.session.commit()
         return True
     return False
@@ -192,6 +226,11 @@ def update_email_config(config_id, **kwargs):
     return config
 
 
+def get_purge_jobs(limit=100):
+    """Get the latest calendar purge jobs."""
+    return PurgeJob.query.order_by(PurgeJob.created_at.desc()).limit(limit).all()
+
+
 def delete_email_config(config_id):
     """Delete an email configuration."""
     try:
@@ -2,9 +2,12 @@
 import flask_login
 from flask import Blueprint, request, jsonify
 
-from crewlog import db
+from crewlog import fragments, singleflight
 from crewlog.admin import admin_dao
+from crewlog.api import batch_api, compression
 from crewlog.auth.models import EmailConfig
+from crewlog.event.range_cache import get_range_cache
+from crewlog.event.range_warmer import get_range_warmer
 
 bp = Blueprint("api_admin", __name__, url_prefix="/api/v1/admin")
 
@@ -61,17 +64,16 @@ def update_user(user_id):
             return jsonify({'message': message}), 400
     
     # Update other fields
+    values = {}
     if 'firstName' in data:
-        user.first_name = data['firstName']
+        values['first_name'] = data['firstName']
     if 'lastName' in data:
-        user.last_name = data['lastName']
+        values['last_name'] = data['lastName']
     if 'isAdmin' in data:
-        user.is_admin = data['isAdmin']
+        values['is_admin'] = data['isAdmin']
     if 'isVerified' in data:
-        user.is_verified = data['isVerified']
-    
-    db.session.merge(user)
-    db.session.commit()
+        values['is_verified'] = data['isVerified']
+    admin_dao.update_user(user_id, **values)
     
     return jsonify({'message': 'User updated successfully'})
 
@@ -130,6 +132,29 @@ def delete_user(user_id):
     return jsonify({'message': message}), 400
 
 
+@bp.route("/purges", methods=['GET'])
+@admin_dao.require_admin
+def get_purges():
+    """Get the latest calendar purge jobs."""
+    return jsonify([job.serialized for job in admin_dao.get_purge_jobs()])
+
+
+@bp.route("/metrics", methods=['GET'])
+@admin_dao.require_admin
+def get_metrics():
+    """Get the read cache and request coalescing counters of the worker that answers."""
+    range_cache = get_range_cache()
+    range_warmer = get_range_warmer()
+    return jsonify({
+        'singleFlight': singleflight.get_metrics(),
+        'rangeCache': range_cache.metrics if range_cache else None,
+        'rangeWarmer': range_warmer.metrics if range_warmer else None,
+        'compression': compression.get_metrics(),
+        'batch': batch_api.get_metrics(),
+        'fragments': fragments.get_metrics()
+    })
+
+
 # ============ Email Configuration API ============
 
 @bp.route("/email/configs", methods=['GET'])
@@ -3,6 +3,7 @@ import flask_login
 from flask import Blueprint, request, jsonify
 from flask_login import login_required, logout_user
 
+from crewlog.api.conditional import not_modified, tagged
 from crewlog.auth import auth_dao
 from crewlog.calendar import calendar_dao
 
@@ -52,15 +53,24 @@ def get_current_calendar_data(user):
     return None
 
 
+def get_me_data(user):
+    """Get the user with their calendars, as answered by /me."""
+    return {
+        'user': get_user_data(user),
+        'calendars': get_calendars_data(user),
+        'currentCalendar': get_current_calendar_data(user)
+    }
+
+
 @bp.route('/me', methods=['GET'])
 def get_current_user():
     """Get current authenticated user."""
     if flask_login.current_user.is_authenticated:
-        return jsonify({
-            'user': get_user_data(flask_login.current_user),
-            'calendars': get_calendars_data(flask_login.current_user),
-            'currentCalendar': get_current_calendar_data(flask_login.current_user)
-        })
+        etag = calendar_dao.get_user_change_stamp(flask_login.current_user)
+        unchanged = not_modified(etag)
+        if unchanged:
+            return unchanged
+        return tagged(jsonify(get_me_data(flask_login.current_user)), etag)
     return jsonify({'user': None, 'calendars': [], 'currentCalendar': None}), 401
 
 
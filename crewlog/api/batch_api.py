@@ -0,0 +1,135 @@
+"""Batch endpoint that answers several read-only API requests in one round trip.
+
+On page load the React app asks for the user, the shares, events and settings of a calendar at once, and on mobile
+links every request pays its own latency besides loading the user and their roles again. A batch runs GET requests
+of /api/v1 one after the other in request contexts nested in its own, so they share the signed in user, their roles
+and the database session loaded for the batch, and returns their statuses, ETags and bodies together. Sub-requests
+are dispatched without the after_request handlers, the batch response is compressed as a whole.
+"""
+import threading
+from urllib.parse import urlsplit
+
+from flask import Blueprint, request, jsonify, current_app
+from flask_login import login_required
+from werkzeug.test import EnvironBuilder
+
+from crewlog import db
+
+bp = Blueprint("api_batch", __name__, url_prefix="/api/v1/batch")
+
+BATCH_LIMIT = 20
+# headers of the batch that do not apply to its sub-requests
+_OWN_HEADERS = ('Content-Type', 'Content-Length', 'Content-Encoding', 'If-None-Match', 'If-Modified-Since',
+                'If-Match', 'If-Unmodified-Since', 'If-Range', 'Range')
+# headers a sub-request may set, to revalidate the representation the client holds
+_REQUEST_HEADERS = ('If-None-Match', 'If-Modified-Since')
+_RESPONSE_HEADERS = ('ETag', 'Last-Modified', 'Cache-Control')
+# GET endpoints that change data
+_WRITING_ENDPOINTS = ('api_auth.verify_email',)
+
+_lock = threading.Lock()
+_metrics = {'batches': 0, 'requests': 0}
+
+
+def parse_sub_request(sub_request):
+    """Get the path and headers of a sub-request, raise ValueError if it is invalid."""
+    if isinstance(sub_request, str):
+        sub_request = {'path': sub_request}
+    if not isinstance(sub_request, dict) or not isinstance(sub_request.get('path'), str):
+        raise ValueError('Path is required')
+    path = sub_request['path']
+    if sub_request.get('method', 'GET').upper() != 'GET':
+        raise ValueError('Only GET requests can be batched')
+    if not urlsplit(path).path.startswith('/api/v1/') or urlsplit(path).path.rstrip('/') == bp.url_prefix:
+        raise ValueError('Only API requests can be batched')
+    headers = sub_request.get('headers') or {}
+    if not isinstance(headers, dict):
+        raise ValueError('Headers must be an object')
+    return path, {name: str(value) for name, value in headers.items() if name in _REQUEST_HEADERS}
+
+
+def _build_environ(path, headers):
+    shared = [(name, value) for name, value in request.headers.items() if name not in _OWN_HEADERS]
+    builder = EnvironBuilder(path=path, base_url=request.root_url, headers=shared + list(headers.items()),
+                             environ_base={'REMOTE_ADDR': request.remote_addr})
+    try:
+        return builder.get_environ()
+    finally:
+        builder.close()
+
+
+def _dispatch():
+    app = current_app._get_current_object()
+    if request.url_rule is not None and request.url_rule.endpoint in _WRITING_ENDPOINTS:
+        return jsonify({'message': 'Only read-only requests can be batched'}), 400
+    try:
+        result = app.preprocess_request()
+        if result is None:
+            result = app.dispatch_request()
+    except Exception as error:
+        result = app.handle_user_exception(error)
+    return result
+
+
+def run_sub_request(path, headers):
+    """Get the status, headers and body of a GET request dispatched in the app context of the batch."""
+    app = current_app._get_current_object()
+    # the app context of the batch is reused by the nested request context, and with it flask_login's user and
+    # the database session
+    with app.request_context(_build_environ(path, headers)):
+        try:
+            response = app.make_response(_dispatch())
+            body = response.get_data()
+        except Exception:
+            app.logger.exception('Batched request %s failed', path)
+            db.session.rollback()
+            return {'status': 500, 'headers': {}, 'body': {'message': 'Internal server error'}}
+    if not body:
+        body = None
+    elif response.is_json:
+        body = response.get_json()
+    else:
+        body = body.decode('utf-8', 'replace')
+    return {
+        'status': response.status_code,
+        'headers': {name: response.headers[name] for name in _RESPONSE_HEADERS if name in response.headers},
+        'body': body
+    }
+
+
+@bp.route('', methods=['POST'])
+@login_required
+def batch():
+    """Answer several GET requests of the API, given as paths or objects with a path, id and headers."""
+    data = request.get_json(silent=True) or {}
+    sub_requests = data.get('requests')
+    if not isinstance(sub_requests, list) or not sub_requests:
+        return jsonify({'message': 'Requests are required'}), 400
+    if len(sub_requests) > BATCH_LIMIT:
+        return jsonify({'message': 'At most {limit} requests per batch'.format(limit=BATCH_LIMIT)}), 400
+
+    parsed = []
+    errors = []
+    for index, sub_request in enumerate(sub_requests):
+        try:
+            parsed.append(parse_sub_request(sub_request))
+        except (ValueError, AttributeError) as e:
+            errors.append({'index': index, 'status': 'error', 'message': str(e)})
+    if errors:
+        return jsonify({'message': 'Batch was not run', 'results': errors}), 400
+
+    responses = []
+    for index, (sub_request, (path, headers)) in enumerate(zip(sub_requests, parsed)):
+        result = run_sub_request(path, headers)
+        result['id'] = sub_request.get('id', index) if isinstance(sub_request, dict) else index
+        responses.append(result)
+    with _lock:
+        _metrics['batches'] += 1
+        _metrics['requests'] += len(responses)
+    return jsonify({'responses': responses})
+
+
+def get_metrics():
+    """Get the number of batches and the requests they answered."""
+    with _lock:
+        return dict(_metrics)
@@ -3,6 +3,7 @@ import flask_login
 from flask import Blueprint, request, jsonify
 from flask_login import login_required
 
+from crewlog.api.conditional import not_modified, tagged
 from crewlog.auth import auth_dao
 from crewlog.auth.models import Role
 from crewlog.calendar import calendar_dao
@@ -28,9 +29,42 @@ def create_calendar():
 @login_required
 @auth_dao.has_role(Role.OWNER)
 def delete_calendar():
-    """Delete current calendar."""
-    calendar_dao.delete()
-    return jsonify({'message': 'Calendar deleted successfully'})
+    """Delete current calendar, its events are removed in the background."""
+    job = calendar_dao.delete()
+    return jsonify({'message': 'Calendar deleted successfully', 'purge': job.serialized}), 202
+
+
+@bp.route('/purges/<purge_id>', methods=['GET'])
+@login_required
+def get_purge(purge_id):
+    """Get the progress of removing the events of a deleted calendar."""
+    job = calendar_dao.get_purge_job(purge_id)
+    if not job:
+        return jsonify({'error': 'Purge not found'}), 404
+    return jsonify(job.serialized)
+
+
+@bp.route('/<calendar_id>/clone', methods=['POST'])
+@login_required
+def clone_calendar(calendar_id):
+    """Copy a calendar with its events and recurrent events, optionally with shifts and roles."""
+    data = request.get_json() or {}
+    include_roles = bool(data.get('includeRoles'))
+    
+    role = next((role for role in flask_login.current_user.roles if str(role.calendar_id) == calendar_id), None)
+    if not role or not role.has_role(Role.MANAGER):
+        return jsonify({'message': 'Access to calendar denied'}), 403
+    if include_roles and not role.has_role(Role.OWNER):
+        return jsonify({'message': 'Only the owner can copy the shares of a calendar'}), 403
+    
+    calendar, counts = calendar_dao.clone(role.calendar, data.get('calendarName') or role.calendar.name,
+                                          include_shifts=bool(data.get('includeShifts')),
+                                          include_roles=include_roles)
+    return jsonify(dict(counts, message='Calendar cloned successfully', calendar={
+        'id': str(calendar.id),
+        'name': calendar.name,
+        'settings': calendar.settings
+    })), 201
 
 
 @bp.route('/default', methods=['POST'])
@@ -99,12 +133,13 @@ def change_share():
 @auth_dao.has_role(Role.OWNER)
 def get_shares():
     """Get all shares for current calendar."""
-    current_role = auth_dao.get_role()
-    if not current_role:
-        return jsonify([])
+    etag = calendar_dao.get_change_stamp()
+    unchanged = not_modified(etag)
+    if unchanged:
+        return unchanged
     
     shares = []
-    for role in current_role.calendar.roles:
+    for role in calendar_dao.get_shares():
         shares.append({
             'user_id': str(role.user_id),
             'username': role.user.username,
@@ -113,7 +148,7 @@ def get_shares():
             'role_type': role.type
         })
     
-    return jsonify(shares)
+    return tagged(jsonify(shares), etag)
 
 
 @bp.route('/settings', methods=['POST'])
@@ -0,0 +1,115 @@
+"""Negotiated gzip and brotli compression of API responses.
+
+Deployments without a proxy in front of gunicorn send month views and user lists as plain JSON, responses of at
+least COMPRESSION_MIN_SIZE bytes are therefore compressed with the best encoding the client accepts. Brotli is used
+when the brotli package is installed. Streamed responses are compressed chunk by chunk and flushed after every
+chunk, so clients still receive each chunk as soon as it is produced.
+"""
+import threading
+import zlib
+
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+GZIP = 'gzip'
+BROTLI = 'br'
+
+_COMPRESSIBLE = ('application/json', 'text/', 'application/javascript', 'application/xml', 'image/svg+xml')
+
+_lock = threading.Lock()
+_metrics = {}
+
+
+def _choose_encoding():
+    accepted = request.accept_encodings
+    gzip_quality = accepted[GZIP]
+    brotli_quality = accepted[BROTLI] if brotli else 0
+    if brotli_quality and brotli_quality >= gzip_quality:
+        return BROTLI
+    if gzip_quality:
+        return GZIP
+    return None
+
+
+def _gzip_compressor():
+    # wbits 16 + MAX_WBITS writes the gzip header and trailer
+    return zlib.compressobj(current_app.config['COMPRESSION_GZIP_LEVEL'], zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+def _brotli_compressor():
+    return brotli.Compressor(quality=current_app.config['COMPRESSION_BROTLI_QUALITY'])
+
+
+def _compress(encoding, data):
+    if encoding == BROTLI:
+        return brotli.compress(data, quality=current_app.config['COMPRESSION_BROTLI_QUALITY'])
+    compressor = _gzip_compressor()
+    return compressor.compress(data) + compressor.flush()
+
+
+def _compress_stream(encoding, chunks):
+    if encoding == BROTLI:
+        compressor = _brotli_compressor()
+        for chunk in chunks:
+            yield compressor.process(chunk) + compressor.flush()
+        yield compressor.finish()
+    else:
+        compressor = _gzip_compressor()
+        for chunk in chunks:
+            yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+
+
+def _count(encoding, original_size, compressed_size):
+    with _lock:
+        metrics = _metrics.setdefault(encoding, {'responses': 0, 'bytesIn': 0, 'bytesOut': 0})
+        metrics['responses'] += 1
+        metrics['bytesIn'] += original_size
+        metrics['bytesOut'] += compressed_size
+
+
+def compress_response(response):
+    """Compress an API response if the client accepts gzip or brotli, to be registered as after_request."""
+    if not current_app.config['COMPRESSION'] or not request.path.startswith('/api/') \
+            or response.status_code < 200 or response.status_code in (204, 206, 304) \
+            or 'Content-Encoding' in response.headers or response.direct_passthrough \
+            or not (response.mimetype or '').startswith(_COMPRESSIBLE):
+        return response
+    streamed = response.is_streamed
+    if not streamed and (response.content_length or 0) < current_app.config['COMPRESSION_MIN_SIZE']:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = _choose_encoding()
+    if encoding is None:
+        return response
+    if streamed:
+        response.response = _compress_stream(encoding, response.iter_encoded())
+        response.headers.pop('Content-Length', None)
+        _count(encoding, 0, 0)
+    else:
+        data = response.get_data()
+        compressed = _compress(encoding, data)
+        if len(compressed) >= len(data):
+            return response
+        response.set_data(compressed)
+        _count(encoding, len(data), len(compressed))
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        # the compressed bytes differ from the plain ones, a strong ETag must differ as well
+        response.set_etag('{etag}-{encoding}'.format(etag=etag, encoding=encoding))
+    return response
+
+
+def get_metrics():
+    """Get the number of compressed responses and their bytes before and after compression, by encoding.
+
+    Bytes of streamed responses are not counted.
+    """
+    with _lock:
+        return {encoding: dict(metrics, bytesSaved=metrics['bytesIn'] - metrics['bytesOut'])
+                for encoding, metrics in _metrics.items()}
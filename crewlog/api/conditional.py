@@ -0,0 +1,18 @@
+"""Conditional GET for API responses whose ETag is cheaper to get than their body."""
+from flask import current_app, request
+
+
+def not_modified(etag):
+    """Get a 304 response if the request already holds the representation with this ETag, otherwise None."""
+    if etag is None or not request.if_none_match.contains_weak(etag):
+        return None
+    return tagged(current_app.response_class(status=304), etag)
+
+
+def tagged(response, etag):
+    """Add the ETag to a response, browsers keep it but have to revalidate it before every use."""
+    if etag is not None:
+        response.set_etag(etag, weak=True)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+    return response
@@ -1,26 +1,173 @@
 """Event API endpoints for React frontend."""
+import uuid
+from datetime import timedelta
 from distutils.util import strtobool
 
 import flask_login
 import pytz
 from dateutil import parser
 from dateutil.tz import UTC
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_login import login_required
 
-from crewlog import db
+from crewlog.auth import auth_dao
+from crewlog.api.conditional import not_modified, tagged
+from crewlog.auth.models import Role
+from crewlog.calendar import calendar_dao
 from crewlog.event import event_dao
+from crewlog.event.models import Event
 
 bp = Blueprint("api_event", __name__, url_prefix="/api/v1/calendars/events")
 
+BATCH_LIMIT = 500
+SEARCH_PAGE_LIMIT = 100
+EVENT_OPERATIONS = ('create', 'update', 'delete')
+SHIFT_OPERATIONS = ('add_shift', 'remove_shift')
+
+
+def parse_utc(value, timezone=None):
+    """Parse a datetime string into a naive UTC datetime."""
+    date = parser.parse(value)
+    if date.tzinfo is None and timezone:
+        date = timezone.localize(date).astimezone(UTC).replace(tzinfo=None)
+    elif date.tzinfo is not None:
+        date = date.astimezone(UTC).replace(tzinfo=None)
+    return date
+
+
+def parse_timezone(name):
+    """Get the pytz timezone of a name, raise ValueError if it is unknown."""
+    try:
+        return pytz.timezone(name)
+    except pytz.exceptions.UnknownTimeZoneError:
+        raise ValueError('Unknown time zone')
+
+
+def parse_event_values(data, timezone=None):
+    """Get the event columns supplied in request data, raise ValueError if they are invalid."""
+    values = {}
+    if 'start' in data:
+        values['start'] = parse_utc(data['start'], timezone)
+    if 'end' in data:
+        values['end'] = parse_utc(data['end'], timezone)
+    if 'eventTitle' in data:
+        if not data['eventTitle'] or not data['eventTitle'].strip():
+            raise ValueError('Event title is required')
+        values['title'] = data['eventTitle'].strip()
+    if 'description' in data:
+        values['description'] = data['description'] or ''
+    if 'allDay' in data:
+        values['all_day'] = bool(data['allDay']) if isinstance(data['allDay'], bool) \
+            else bool(strtobool(str(data['allDay'])))
+    if 'start' in values and 'end' in values and values['end'] < values['start']:
+        raise ValueError('Event end must not be before its start')
+    return values
+
+
+def parse_batch_operation(operation, timezone=None):
+    """Validate one operation of a batch request, raise ValueError if it is invalid."""
+    kind = operation.get('op') if isinstance(operation, dict) else None
+    if kind not in EVENT_OPERATIONS + SHIFT_OPERATIONS:
+        raise ValueError('Unknown operation')
+    parsed = {'op': kind}
+    
+    if kind in ('update', 'delete', 'add_shift'):
+        if operation.get('eventId'):
+            parsed['event_id'] = uuid.UUID(operation['eventId'])
+        elif isinstance(operation.get('eventRef'), int):
+            # refers to the index of a create operation earlier in the same batch
+            parsed['event_ref'] = operation['eventRef']
+        else:
+            raise ValueError('Event ID is required')
+    
+    if kind == 'create':
+        if not all(field in operation for field in ('eventTitle', 'start', 'end')):
+            raise ValueError('Event title, start and end are required')
+        parsed['values'] = dict({'description': '', 'all_day': False}, **parse_event_values(operation, timezone))
+    elif kind == 'update':
+        parsed['values'] = parse_event_values(operation, timezone)
+        if not parsed['values']:
+            raise ValueError('Nothing to update')
+    elif kind == 'add_shift':
+        person = operation.get('person') or ''
+        if not person.strip():
+            raise ValueError('Person name is required')
+        parsed['person'] = person.strip()
+    elif kind == 'remove_shift':
+        if not operation.get('shiftId'):
+            raise ValueError('Shift ID is required')
+        parsed['shift_id'] = uuid.UUID(operation['shiftId'])
+    return parsed
+
 
 @bp.route('/', methods=['GET'])
 @login_required
 def get_events():
-    """Get events for date range."""
+    """Get events for date range, answers If-None-Match with 304 while the calendar is unchanged."""
+    etag = calendar_dao.get_change_stamp()
+    unchanged = not_modified(etag)
+    if unchanged:
+        return unchanged
+    start = parser.isoparse(request.args.get('start')).astimezone(UTC)
+    end = parser.isoparse(request.args.get('end')).astimezone(UTC)
+    include = request.args.get('include', '').split(',')
+    events = event_dao.get_serialized_events(start, end)
+    if 'shifts' not in include:
+        events = [{key: value for key, value in event.items() if key != 'volunteers'} for event in events]
+    return tagged(jsonify(events), etag)
+
+
+@bp.route('/search', methods=['GET'])
+@login_required
+def search_events():
+    """Search events and recurrent events of the current calendar by title and description."""
+    query = request.args.get('q', '')
+    try:
+        page = max(int(request.args.get('page', 1)), 1)
+        per_page = min(max(int(request.args.get('perPage', 20)), 1), SEARCH_PAGE_LIMIT)
+    except ValueError:
+        return jsonify({'message': 'Page and page size must be numbers'}), 400
+    
+    # one extra row tells whether there is a next page
+    items = event_dao.search_events(query, limit=per_page + 1, offset=(page - 1) * per_page)
+    results = []
+    for item in items[:per_page]:
+        output = item.serialized
+        output['type'] = 'event' if isinstance(item, Event) else 'recurrent'
+        results.append(output)
+    
+    return jsonify({
+        'results': results,
+        'page': page,
+        'perPage': per_page,
+        'hasMore': len(items) > per_page
+    })
+
+
+@bp.route('/overlay', methods=['GET'])
+@login_required
+def get_overlay_events():
+    """Get events for date range across several of the user's calendars."""
     start = parser.isoparse(request.args.get('start')).astimezone(UTC)
     end = parser.isoparse(request.args.get('end')).astimezone(UTC)
-    events = [event.serialized for event in event_dao.get_events(start, end)]
+    
+    roles = {str(role.calendar_id): role for role in flask_login.current_user.roles
+             if role.has_role(Role.USER)}
+    requested = [calendar_id for value in request.args.getlist('calendars')
+                 for calendar_id in value.split(',') if calendar_id]
+    if not requested:
+        requested = list(roles.keys())
+    
+    denied = [calendar_id for calendar_id in requested if calendar_id not in roles]
+    if denied:
+        return jsonify({'message': 'Access to calendar denied', 'calendars': denied}), 403
+    
+    calendar_ids = [roles[calendar_id].calendar_id for calendar_id in requested]
+    events = []
+    for event in event_dao.get_overlay_events(calendar_ids, start, end):
+        output = event.serialized
+        output['calendarId'] = str(event.calendar_id)
+        events.append(output)
     return jsonify(events)
 
 
@@ -41,22 +188,14 @@ def create_event():
     
     # Parse timezone first
     if data.get('timeZone'):
-        timezone = pytz.timezone(data['timeZone'])
-    
-    # Parse start and end times
-    start = parser.parse(data['start'])
-    end = parser.parse(data['end'])
+        try:
+            timezone = parse_timezone(data['timeZone'])
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
     
-    # Handle timezone conversion
-    if start.tzinfo is None and timezone:
-        start = timezone.localize(start).astimezone(UTC).replace(tzinfo=None)
-    elif start.tzinfo is not None:
-        start = start.astimezone(UTC).replace(tzinfo=None)
-        
-    if end.tzinfo is None and timezone:
-        end = timezone.localize(end).astimezone(UTC).replace(tzinfo=None)
-    elif end.tzinfo is not None:
-        end = end.astimezone(UTC).replace(tzinfo=None)
+    # Parse start and end times and convert them to UTC
+    start = parse_utc(data['start'], timezone)
+    end = parse_utc(data['end'], timezone)
     
     title = data.get('eventTitle')
     if not title:
@@ -95,6 +234,113 @@ def create_event():
     return jsonify({'message': 'Event saved successfully'})
 
 
+@bp.route('/<event_id>', methods=['PATCH'])
+@login_required
+@auth_dao.has_role(Role.MANAGER)
+def patch_event(event_id):
+    """Update only the supplied fields of an event, e.g. start and end after drag and drop."""
+    try:
+        event_id = uuid.UUID(event_id)
+    except ValueError:
+        return jsonify({'message': 'Invalid event id'}), 400
+    
+    data = request.get_json()
+    try:
+        timezone = parse_timezone(data['timeZone']) if data.get('timeZone') else None
+        values = parse_event_values(data, timezone)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    if not values:
+        return jsonify({'message': 'Nothing to update'}), 400
+    
+    try:
+        row = event_dao.update_event(event_id, **values)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    if not row:
+        return jsonify({'error': 'Event not found'}), 404
+    
+    output = {
+        'id': str(row.id),
+        'title': row.title,
+        'description': row.description,
+        'start': row.start.isoformat() + 'Z',
+        'end': row.end.isoformat() + 'Z',
+        'allDay': row.all_day
+    }
+    if row.recur_id:
+        output['recurId'] = str(row.recur_id)
+    return jsonify(output)
+
+
+@bp.route('/batch', methods=['POST'])
+@login_required
+def batch():
+    """Apply several event and shift operations in a single transaction."""
+    data = request.get_json()
+    operations = data.get('operations')
+    if not isinstance(operations, list) or not operations:
+        return jsonify({'message': 'Operations are required'}), 400
+    if len(operations) > BATCH_LIMIT:
+        return jsonify({'message': 'At most {limit} operations per batch'.format(limit=BATCH_LIMIT)}), 400
+    
+    timezone = None
+    if data.get('timeZone'):
+        try:
+            timezone = parse_timezone(data['timeZone'])
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+    
+    parsed = []
+    errors = []
+    for index, operation in enumerate(operations):
+        try:
+            parsed.append(parse_batch_operation(operation, timezone))
+        except (ValueError, TypeError, AttributeError) as e:
+            errors.append({'index': index, 'status': 'error', 'message': str(e)})
+    if errors:
+        return jsonify({'message': 'Batch was not applied', 'results': errors}), 400
+    
+    # event changes need a manager, signing up for shifts is open to every calendar user
+    required_role = Role.MANAGER if any(operation['op'] in EVENT_OPERATIONS for operation in parsed) else Role.USER
+    role = auth_dao.get_role()
+    if not role or not role.has_role(required_role):
+        return current_app.login_manager.unauthorized()
+    
+    success, results = event_dao.apply_batch(parsed)
+    if not success:
+        return jsonify({'message': 'Batch was not applied', 'results': results}), 400
+    return jsonify({'message': 'Batch applied successfully', 'results': results})
+
+
+@bp.route('/copy', methods=['POST'])
+@login_required
+@auth_dao.has_role(Role.MANAGER)
+def copy_events():
+    """Copy the events of a date range, optionally with shifts, to another date in the current calendar."""
+    data = request.get_json()
+    if not all(data.get(field) for field in ('start', 'end', 'targetStart')):
+        return jsonify({'message': 'Start, end and target start are required'}), 400
+    
+    timezone = None
+    if data.get('timeZone'):
+        try:
+            timezone = parse_timezone(data['timeZone'])
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+    start = parse_utc(data['start'], timezone).replace(tzinfo=UTC)
+    end = parse_utc(data['end'], timezone).replace(tzinfo=UTC)
+    target_start = parse_utc(data['targetStart'], timezone).replace(tzinfo=UTC)
+    offset = timedelta(seconds=int((target_start - start).total_seconds()))
+    if end <= start:
+        return jsonify({'message': 'Event end must not be before its start'}), 400
+    if not offset:
+        return jsonify({'message': 'Target start must differ from start'}), 400
+    
+    events, shifts = event_dao.copy_events(start, end, offset, include_shifts=bool(data.get('includeShifts')))
+    return jsonify({'message': 'Events copied successfully', 'events': events, 'shifts': shifts})
+
+
 @bp.route('/', methods=['DELETE'])
 @login_required
 def delete_event():
@@ -158,17 +404,10 @@ def save_shift():
     return jsonify({'message': 'Shifts saved successfully'})
 
 
-@bp.route('/<event_id>/details', methods=['GET'])
-@login_required
-def get_event_details(event_id):
-    """Get event details including volunteers."""
-    event = event_dao.get_event(event_id)
-    if not event:
-        return jsonify({'error': 'Event not found'}), 404
-    
+def get_details_data(event):
+    """Get event details including volunteers for JSON response."""
     volunteers = [{'id': str(shift.id), 'person': shift.person} for shift in event.shifts]
-    
-    return jsonify({
+    return {
         'id': str(event.id),
         'title': event.title,
         'description': event.description or '',
@@ -176,7 +415,34 @@ def get_event_details(event_id):
         'end': event.end.isoformat() + 'Z' if event.end else None,
         'all_day': event.all_day,
         'volunteers': volunteers
-    })
+    }
+
+
+@bp.route('/<event_id>/details', methods=['GET'])
+@login_required
+def get_event_details(event_id):
+    """Get event details including volunteers."""
+    event = event_dao.get_event(event_id, include_archive=True)
+    if not event:
+        return jsonify({'error': 'Event not found'}), 404
+    
+    return jsonify(get_details_data(event))
+
+
+@bp.route('/details', methods=['GET'])
+@login_required
+def get_events_details():
+    """Get details including volunteers for several events at once."""
+    try:
+        event_ids = [uuid.UUID(event_id) for value in request.args.getlist('ids')
+                     for event_id in value.split(',') if event_id]
+    except ValueError:
+        return jsonify({'message': 'Invalid event id'}), 400
+    
+    if not event_ids:
+        return jsonify([])
+    
+    return jsonify([get_details_data(event) for event in event_dao.get_events_by_ids(event_ids, include_archive=True)])
 
 
 @bp.route('/recurrent', methods=['POST'])
@@ -191,21 +457,16 @@ def update_recurrent_event():
     start = parser.parse(data['start'])
     end = parser.parse(data['end'])
     init_start = parser.parse(data['initStart'])
-    timezone = pytz.timezone(data['timeZone'])
+    try:
+        timezone = parse_timezone(data['timeZone'])
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
     title = data.get('eventTitle')
     description = data.get('description', '')
     all_day = bool(data.get('allDay', False))
     
     if recurrent_change == 'this':
-        if event_id:
-            event = event_dao.get_event(event_id=event_id)
-            event.start = start
-            event.end = end
-        else:
-            event = event_dao.generate_event(recur_id, start=start, end=end)
-            event.init_start = init_start
-        db.session.merge(event)
-        db.session.commit()
+        event_dao.save_occurrence(start, end, event_id=event_id, recur_id=recur_id, init_start=init_start)
     elif recurrent_change == 'following':
         event_dao.save_group_event(
             recur_id=recur_id, 
@@ -2,6 +2,7 @@ import flask_login
 from flask import Blueprint, request, redirect, url_for, render_template, flash
 from flask_login import LoginManager, login_required, logout_user
 
+from crewlog import fragments
 from . import auth_dao
 from .auth_forms import LoginForm, RegisterForm, ForgotForm, RestoreForm, ProfileForm, VerifyForm, PasswordForm
 
@@ -111,7 +112,7 @@ def verify_reminder():
 @bp.route('/render_password', methods=['GET'])
 @flask_login.login_required
 def render_password():
-    return render_template('password_modal.html', form=PasswordForm())
+    return fragments.render_fragment('password_modal.html', lambda: dict(form=PasswordForm()))
 
 
 @login_manager.user_loader
@@ -3,8 +3,9 @@ from threading import Thread
 
 import flask_login
 from flask import flash, current_app
+from sqlalchemy import select, bindparam
 
-from crewlog import db
+from crewlog import db, invalidation
 from crewlog.auth.models import User, Role
 from crewlog.calendar.models import Calendar
 
@@ -16,10 +17,14 @@ def get_user(username):
     return user
 
 
+# runs on every request through the user loader, built once so calls only bind the id
+_USER_BY_ALIAS_ID = select(User).where(User.alias_id == bindparam('alias_id')).limit(1)
+
+
 def get_user_by_id(id):
     if id is None:
         return
-    user = User.query.filter(User.alias_id == id).first()
+    user = db.session.scalars(_USER_BY_ALIAS_ID, {'alias_id': id}).first()
     return user
 
 
@@ -41,6 +46,9 @@ def update_user(first_name, last_name):
     user.first_name = first_name
     user.last_name = last_name
     db.session.merge(user)
+    from crewlog.calendar.calendar_dao import mark_user_calendars_changed
+    mark_user_calendars_changed(user.id)
+    invalidation.user_changed(user.id)
     db.session.commit()
     return True
 
@@ -58,6 +66,7 @@ def restore_password(token, new_password):
         user = get_user(user.username)
         user.set_password(new_password)
         db.session.merge(user)
+        invalidation.user_changed(user.id)
         db.session.commit()
         flask_login.login_user(user, remember=True)
         return True
@@ -87,6 +96,7 @@ def confirm_verify_email(token):
         user = get_user(user.username)
         user.is_verified = True
         db.session.merge(user)
+        invalidation.user_changed(user.id)
         db.session.commit()
     else:
         flash('Verification link got expired. Please request a new one.', 'danger')
@@ -96,6 +106,7 @@ def change_password(old_password, new_password):
     if flask_login.current_user.check_password(old_password):
         flask_login.current_user.set_password(new_password)
         db.session.merge(flask_login.current_user)
+        invalidation.user_changed(flask_login.current_user.id)
         db.session.commit()
         flash('Password was changed. Please sign in using new password.', 'success')
         return True
@@ -8,7 +8,7 @@ from sqlalchemy import UniqueConstraint
 from werkzeug.security import generate_password_hash, check_password_hash
 
 from crewlog import db
-from crewlog.database import GUID
+from crewlog.database import GUID, uuid7
 
 
 def _gen_valid_until():
@@ -23,7 +23,7 @@ def _get_auth_serializer(salt):
 
 class User(db.Model, UserMixin):
 
-    id = db.Column(GUID(), primary_key=True, default=uuid.uuid4)
+    id = db.Column(GUID(), primary_key=True, default=uuid7)
     alias_id = db.Column(GUID(), default=uuid.uuid4, nullable=False, unique=True)
     username = db.Column(db.String(80), nullable=False, unique=True)
     first_name = db.Column(db.String(80), nullable=False)
@@ -76,9 +76,9 @@ class Role(db.Model):
     MANAGER = 50
     USER = 10
 
-    id = db.Column(GUID(), primary_key=True, default=uuid.uuid4)
+    id = db.Column(GUID(), primary_key=True, default=uuid7)
     type = db.Column(db.Integer, nullable=False)
-    calendar_id = db.Column(GUID(), db.ForeignKey('calendar.id'), nullable=False)
+    calendar_id = db.Column(GUID(), db.ForeignKey('calendar.id', ondelete='CASCADE'), nullable=False)
     calendar = db.relationship("Calendar")
     user_id = db.Column(GUID(), db.ForeignKey('user.id'), nullable=False)
     user = db.relationship("User")
@@ -97,7 +97,7 @@ class EmailConfig(db.Model):
     PROVIDER_SENDGRID = 'sendgrid'
     PROVIDER_SMTP2GO = 'smtp2go'
     
-    id = db.Column(GUID(), primary_key=True, default=uuid.uuid4)
+    id = db.Column(GUID(), primary_key=True, default=uuid7)
     provider = db.Column(db.String(20), nullable=False, default=PROVIDER_SMTP)
     is_active = db.Column(db.Boolean, default=True, nullable=False)
     
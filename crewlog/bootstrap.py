@@ -0,0 +1,75 @@
+"""Data for the first paint of the React app, inlined into index.html.
+
+Without it the app boots in three round trips: index.html, /api/v1/auth/me and the first range of events. For signed
+in users index.html carries the /me payload and, on the calendar page, the events of the current week of their
+calendar as JSON in a script element. The week starts on the first day of the calendar settings and is padded by a
+day on both sides, so it covers the first view in any time zone of the browser, which takes the events of its view
+from it and requests all later ranges as usual.
+
+Rendered pages are kept per user, the change stamp of the user and their calendars, and day, for the pages used last.
+"""
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import flask_login
+from dateutil.tz import UTC
+from flask import current_app
+from jinja2.utils import htmlsafe_json_dumps
+
+from crewlog.api.auth_api import get_me_data
+from crewlog.calendar import calendar_dao
+from crewlog.event import event_dao
+from crewlog.static_assets import Asset
+
+_SCRIPT = '<script id="bootstrap-data" type="application/json">{data}</script>'
+_MAX_PAGES = 1024
+
+_pages = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_window(calendar, today):
+    """Get the padded week of the calendar that contains today."""
+    first_day = int(calendar.get_settings().get('firstDay', 1))
+    # weekday() counts from Monday, firstDay from Sunday
+    start = today - timedelta(days=(today.weekday() + 1 - first_day) % 7)
+    return start - timedelta(days=1), start + timedelta(days=8)
+
+
+def render_index(index, include_events):
+    """Get index.html with the bootstrap data of the current user, or None if nobody is signed in."""
+    user = flask_login.current_user
+    if not user.is_authenticated:
+        return None
+    today = datetime.now(UTC).replace(hour=0, minute=0, second=0, microsecond=0)
+    key = (user.id, calendar_dao.get_user_change_stamp(user), today, include_events, index.etag)
+    with _lock:
+        page = _pages.get(key)
+        if page is not None:
+            _pages.move_to_end(key)
+            return page
+
+    data = {'me': get_me_data(user)}
+    calendar = calendar_dao.get_current_calendar()
+    if include_events and calendar is not None:
+        start, end = get_window(calendar, today)
+        data['events'] = {
+            'calendarId': str(calendar.id),
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            # with volunteers, as the calendar page reads its events with include=shifts
+            'items': event_dao.get_serialized_events(start, end)
+        }
+    html = index.data.decode('utf-8')
+    position = html.find('</head>')
+    if position < 0:
+        position = 0
+    script = _SCRIPT.format(data=htmlsafe_json_dumps(data, dumps=current_app.json.dumps))
+    page = Asset(index.path, (html[:position] + script + html[position:]).encode('utf-8'), index.mimetype, False)
+    page.compress(current_app.config['COMPRESSION_GZIP_LEVEL'], current_app.config['COMPRESSION_BROTLI_QUALITY'])
+    with _lock:
+        _pages[key] = page
+        while len(_pages) > _MAX_PAGES:
+            _pages.popitem(last=False)
+    return page
@@ -1,12 +1,13 @@
+import click
 import flask_login
 from flask import Blueprint, render_template, request
 from flask_login import login_manager, LoginManager
 from flask_wtf import FlaskForm
 
-from crewlog import application
+from crewlog import application, fragments
 from crewlog.auth import auth_dao
 from crewlog.auth.models import Role
-from crewlog.calendar import calendar_dao
+from crewlog.calendar import calendar_dao, purge
 from crewlog.calendar.calendar_forms import DeleteForm, NewForm, SettingsForm
 
 bp = Blueprint("calendar", __name__, template_folder="templates")
@@ -22,26 +23,28 @@ def render_settings():
 @application.route('/render_delete', methods=['GET'])
 @flask_login.login_required
 def render_delete():
-    return render_template('delete_modal.html', form=DeleteForm())
+    return fragments.render_fragment('delete_modal.html', lambda: dict(form=DeleteForm()),
+                                     key=(auth_dao.get_role().calendar.name,))
 
 
 @application.route('/render_share', methods=['GET'])
 @flask_login.login_required
 def render_share():
-    return render_template('share_modal.html', form=FlaskForm())
+    return fragments.render_fragment('share_modal.html', lambda: dict(form=FlaskForm()),
+                                     key=(auth_dao.get_role().calendar.name,))
 
 
 @application.route('/render_new', methods=['GET'])
 @flask_login.login_required
 def render_new():
-    return render_template('new_modal.html', form=NewForm())
+    return fragments.render_fragment('new_modal.html', lambda: dict(form=NewForm()))
 
 
 @application.route('/render_transfer_ownership', methods=['GET'])
 @flask_login.login_required
 def render_transfer_ownership():
     form_id = request.args.get('form_id')
-    return render_template('transfer_ownership.html', form_id=form_id)
+    return fragments.render_fragment('transfer_ownership.html', lambda: dict(form_id=form_id), key=(form_id,))
 
 
 @application.route('/shares', methods=['GET'])
@@ -52,6 +55,15 @@ def render_shares():
     return render_template('shares.html', calendar=calendar_dao.get_current_calendar(), shares=shares, form=FlaskForm())
 
 
+@application.cli.command('purge-calendars')
+def purge_calendars():
+    """Remove the rows of deleted calendars whose purge did not finish."""
+    for job in purge.get_resumable_jobs():
+        click.echo('Purging calendar {calendar_id}'.format(calendar_id=job.calendar_id))
+        purge.run(job.id, progress=lambda job: click.echo('  {deleted}/{total} rows'.format(
+            deleted=job.deleted_rows, total=job.total_rows)))
+
+
 @bp.record_once
 def on_load(state):
     login_manager.init_app(state.app)
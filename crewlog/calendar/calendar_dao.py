@@ -1,11 +1,21 @@
+import hashlib
+import threading
+import uuid
+from collections import OrderedDict
+
 import flask_login
 from flask import flash
 from flask.json import dumps
+from sqlalchemy import update, select, case, literal, bindparam
+from sqlalchemy.orm import selectinload
 
-from crewlog import db
+from crewlog import db, invalidation
 from crewlog.auth import auth_dao
 from crewlog.auth.models import Role
-from crewlog.calendar.models import Share, Calendar
+from crewlog.calendar import purge
+from crewlog.calendar.models import Share, Calendar, PurgeJob
+from crewlog.database import GUID, new_guid, create_id_map
+from crewlog.event.models import Event, RecurEvent, Shift
 
 
 @auth_dao.has_role(Role.OWNER)
@@ -13,6 +23,7 @@ def save_settings(settings):
     calendar = get_current_calendar()
     calendar.settings = dumps(settings)
     db.session.merge(calendar)
+    mark_changed(calendar.id)
     db.session.commit()
     return True
 
@@ -24,10 +35,13 @@ def share_calendar(role_name, expiration_days=7, no_expiration=False):
                      expiration_days=expiration_days, no_expiration=no_expiration)
 
 
+_SHARES = select(Role).options(selectinload(Role.user)).where(Role.calendar_id == bindparam('calendar_id'))
+
+
 @auth_dao.has_role(Role.OWNER)
 def get_shares():
     calendar = get_current_calendar()
-    roles = Role.query.filter(Role.calendar_id == calendar.id).all()
+    roles = db.session.scalars(_SHARES, {'calendar_id': calendar.id}).all()
     return roles
 
 
@@ -48,6 +62,7 @@ def change_share(user_id, role_type):
             db.session.merge(role)
     else:
         db.session.delete(role)
+    mark_changed(calendar.id)
     db.session.commit()
     return role
 
@@ -68,10 +83,86 @@ def accept_share(share_token):
                     is_default=True)
         flask_login.current_user.roles.append(role)
         db.session.merge(flask_login.current_user)
+        mark_changed(share.calendar_id)
+        invalidation.user_changed(flask_login.current_user.id)
         db.session.commit()
         flash("New calendar was added", 'success')
 
 
+def mark_changed(calendar_id):
+    """Bump the change count of a calendar, to be called before committing a change to its events, settings or
+    shares. The change is published to the caches of other workers once committed."""
+    db.session.execute(update(Calendar).where(Calendar.id == calendar_id)
+                       .values(change_count=Calendar.change_count + 1)
+                       .execution_options(synchronize_session=False))
+    invalidation.calendar_changed(calendar_id)
+
+
+def mark_user_calendars_changed(user_id):
+    """Bump the change counts of the calendars of a user, whose name is part of their shares."""
+    calendar_ids = db.session.scalars(select(Role.calendar_id).where(Role.user_id == user_id)).all()
+    if not calendar_ids:
+        return
+    db.session.execute(update(Calendar).where(Calendar.id.in_(calendar_ids))
+                       .values(change_count=Calendar.change_count + 1)
+                       .execution_options(synchronize_session=False))
+    for calendar_id in calendar_ids:
+        invalidation.calendar_changed(calendar_id)
+
+
+def get_change_stamp():
+    """Get the ETag of the current calendar, it changes with every change to its events, settings or shares."""
+    calendar = get_current_calendar()
+    if calendar is None:
+        return None
+    return '{calendar_id}-{change_count}'.format(calendar_id=calendar.id.hex, change_count=calendar.change_count)
+
+
+_USER_CALENDAR_STAMPS = select(Role.calendar_id, Role.type, Role.is_default, Calendar.change_count) \
+    .join(Calendar, Role.calendar_id == Calendar.id) \
+    .where(Role.user_id == bindparam('user_id')).order_by(Role.calendar_id)
+_MAX_CALENDAR_STAMPS = 4096
+
+# roles and change counts of the calendars of users, with the versions of the invalidation bus they were read at
+_calendar_stamps = OrderedDict()
+_calendar_stamps_lock = threading.Lock()
+
+
+def _get_calendar_stamps(user):
+    """Get the roles of a user with the change counts of their calendars.
+
+    With an invalidation bus they are kept while the versions of the user, whose role changes are published, and of
+    their calendars are unchanged.
+    """
+    bus = invalidation.get_invalidation_bus()
+    if bus is None:
+        return [tuple(row) for row in db.session.execute(_USER_CALENDAR_STAMPS, {'user_id': user.id})]
+    with _calendar_stamps_lock:
+        cached = _calendar_stamps.get(user.id)
+    calendar_ids = tuple(stamp[0] for stamp in cached[1]) if cached else ()
+    # versions are read before the query, a change committed meanwhile makes the next use check again
+    version = bus.user_version(user.id), tuple(bus.calendar_version(calendar_id) for calendar_id in calendar_ids)
+    if cached is not None and cached[0].is_current(bus, version):
+        return cached[1]
+    stamps = [tuple(row) for row in db.session.execute(_USER_CALENDAR_STAMPS, {'user_id': user.id})]
+    if tuple(stamp[0] for stamp in stamps) != calendar_ids:
+        # the versions were read for other calendars
+        version = None
+    with _calendar_stamps_lock:
+        _calendar_stamps[user.id] = invalidation.VersionCheck(version), stamps
+        _calendar_stamps.move_to_end(user.id)
+        while len(_calendar_stamps) > _MAX_CALENDAR_STAMPS:
+            _calendar_stamps.popitem(last=False)
+    return stamps
+
+
+def get_user_change_stamp(user):
+    """Get the ETag of what a user sees of their account: their profile, roles and the calendars of the roles."""
+    stamps = _get_calendar_stamps(user)
+    values = (user.id, user.username, user.first_name, user.last_name, user.is_admin, user.is_verified, stamps)
+    return hashlib.sha1(repr(values).encode()).hexdigest()
+
+
 def get_current_calendar():
     for role in flask_login.current_user.roles:
         if role.is_default:
@@ -85,6 +176,7 @@ def set_default(calendar_id):
     for role in flask_login.current_user.roles:
         role.is_default = str(role.calendar_id) == calendar_id
         db.session.merge(role)
+    invalidation.user_changed(flask_login.current_user.id)
     db.session.commit()
 
 
@@ -96,10 +188,86 @@ def create(calendar_name):
     role = Role(type=Role.OWNER, calendar=calendar, is_default=True)
     user.roles.append(role)
     db.session.merge(user)
+    invalidation.user_changed(user.id)
     db.session.commit()
     return calendar
 
 
+def clone(source, calendar_name, include_shifts=False, include_roles=False):
+    """Copy the settings, events and recurrent events of a calendar, optionally with shifts and roles, to a new
+    calendar owned by the current user, which becomes their default calendar.
+
+    Rows are copied with INSERT ... SELECT statements, the ids of copied recurrent events and events are remapped
+    through temporary tables. Archived events stay with the source calendar. Other owners of the source calendar
+    become managers of the copy. Returns the new calendar and the number of copied rows per kind.
+    """
+    user = flask_login.current_user
+    calendar = Calendar(name=calendar_name, settings=source.settings)
+    for role in user.roles:
+        role.is_default = False
+    user.roles.append(Role(type=Role.OWNER, calendar=calendar, is_default=True))
+    db.session.flush()
+
+    connection = db.session.connection()
+    dialect = connection.dialect
+    calendar_id = literal(calendar.id, GUID())
+    recur_table = RecurEvent.__table__
+    event_table = Event.__table__
+    shift_table = Shift.__table__
+    recur_map = create_id_map(connection, 'recur_map')
+    id_map = create_id_map(connection)
+    counts = {}
+
+    db.session.execute(recur_map.insert().from_select(
+        ['old_id', 'new_id'],
+        select(recur_table.c.id, new_guid(dialect)).where(recur_table.c.calendar_id == source.id)))
+    counts['recurrentEvents'] = db.session.execute(recur_table.insert().from_select(
+        ['id', 'title', 'description', 'start', 'end', 'all_day', 'calendar_id', 'start_recur', 'end_recur', 'rrule',
+         'recurrent_type', 'recurrent_interval'],
+        select(recur_map.c.new_id, recur_table.c.title, recur_table.c.description, recur_table.c.start,
+               recur_table.c.end, recur_table.c.all_day, calendar_id, recur_table.c.start_recur,
+               recur_table.c.end_recur, recur_table.c.rrule, recur_table.c.recurrent_type,
+               recur_table.c.recurrent_interval)
+        .join(recur_map, recur_table.c.id == recur_map.c.old_id))).rowcount
+
+    # hidden overrides are copied too, they remove occurrences from the copied series
+    db.session.execute(id_map.insert().from_select(
+        ['old_id', 'new_id'],
+        select(event_table.c.id, new_guid(dialect)).where(event_table.c.calendar_id == source.id)))
+    counts['events'] = db.session.execute(event_table.insert().from_select(
+        ['id', 'title', 'description', 'start', 'end', 'all_day', 'calendar_id', 'recur_id', 'init_start', 'hide'],
+        select(id_map.c.new_id, event_table.c.title, event_table.c.description, event_table.c.start,
+               event_table.c.end, event_table.c.all_day, calendar_id, recur_map.c.new_id, event_table.c.init_start,
+               event_table.c.hide)
+        .join(id_map, event_table.c.id == id_map.c.old_id)
+        .outerjoin(recur_map, event_table.c.recur_id == recur_map.c.old_id))).rowcount
+
+    counts['shifts'] = 0
+    if include_shifts:
+        counts['shifts'] = db.session.execute(shift_table.insert().from_select(
+            ['id', 'person', 'event_id'],
+            select(new_guid(dialect), shift_table.c.person, id_map.c.new_id)
+            .join(id_map, shift_table.c.event_id == id_map.c.old_id))).rowcount
+
+    counts['roles'] = 0
+    if include_roles:
+        role_table = Role.__table__
+        counts['roles'] = db.session.execute(role_table.insert().from_select(
+            ['id', 'type', 'calendar_id', 'user_id', 'is_default'],
+            select(new_guid(dialect),
+                   case((role_table.c.type >= Role.OWNER, Role.MANAGER), else_=role_table.c.type),
+                   calendar_id, role_table.c.user_id, literal(False))
+            .where(role_table.c.calendar_id == source.id)
+            .where(role_table.c.user_id != user.id))).rowcount
+
+    id_map.drop(bind=connection)
+    recur_map.drop(bind=connection)
+    for user_id in db.session.scalars(select(Role.user_id).where(Role.calendar_id == calendar.id)):
+        invalidation.user_changed(user_id)
+    db.session.commit()
+    return calendar, counts
+
+
 @auth_dao.has_role(Role.OWNER)
 def set_owner(user_id):
     for role in get_shares():
@@ -114,5 +282,19 @@ def set_owner(user_id):
 
 @auth_dao.has_role(Role.OWNER)
 def delete():
-    db.session.delete(get_current_calendar())
+    """Mark the current calendar as deleted, its rows are removed by a background purge job."""
+    job = purge.create_job(get_current_calendar(), requested_by_id=flask_login.current_user.id)
     db.session.commit()
+    purge.start([job])
+    return job
+
+
+def get_purge_job(job_id):
+    """Get a purge job requested by the current user, or any purge job for admins."""
+    try:
+        job = db.session.get(PurgeJob, uuid.UUID(str(job_id)))
+    except ValueError:
+        return None
+    if job and (job.requested_by_id == flask_login.current_user.id or flask_login.current_user.is_admin):
+        return job
+    return None
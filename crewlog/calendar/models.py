@@ -7,7 +7,7 @@ from itsdangerous import URLSafeSerializer, BadSignature
 from sqlalchemy import JSON
 
 from crewlog import db
-from crewlog.database import GUID
+from crewlog.database import GUID, uuid7
 
 default_settings = "{\"firstDay\": \"1\"," \
                    " \"nextDayThreshold\": \"00:00:00\"," \
@@ -22,16 +22,56 @@ def _get_share_serializer():
 
 
 class Calendar(db.Model):
-    id = db.Column(GUID(), primary_key=True, default=uuid.uuid4)
+    id = db.Column(GUID(), primary_key=True, default=uuid7)
     settings = db.Column(JSON, default=default_settings)
     name = db.Column(db.String(256), nullable=False)
-    events = db.relationship('Event', backref='Calendar', cascade="all,delete", lazy=True)
-    roles = db.relationship('Role', backref='Calendar', cascade="all,delete", lazy=True)
+    # rows of deleted calendars are removed by a PurgeJob in chunks, never through the ORM
+    events = db.relationship('Event', backref='Calendar', cascade="all,delete", passive_deletes=True, lazy=True)
+    roles = db.relationship('Role', backref='Calendar', cascade="all,delete", passive_deletes=True, lazy=True)
+    # events that ended before this date may have been moved to the archive tables
+    archived_until = db.Column(db.DateTime)
+    # bumped by every change to the events, settings or shares of the calendar, in the same transaction
+    change_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    deleted_at = db.Column(db.DateTime)
 
     def get_settings(self):
         return loads(self.settings)
 
 
+class PurgeJob(db.Model):
+    """Removal of the rows of a deleted calendar, done in the background in chunks."""
+    __tablename__ = 'purge_job'
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    id = db.Column(GUID(), primary_key=True, default=uuid7)
+    # no foreign keys, the calendar is gone when the job is done and the user may be deleted meanwhile
+    calendar_id = db.Column(GUID(), nullable=False)
+    requested_by_id = db.Column(GUID())
+    status = db.Column(db.String(16), nullable=False, default=PENDING)
+    total_rows = db.Column(db.Integer, nullable=False, default=0)
+    deleted_rows = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    finished_at = db.Column(db.DateTime)
+
+    @property
+    def serialized(self):
+        return {
+            'id': self.id,
+            'calendarId': self.calendar_id,
+            'status': self.status,
+            'totalRows': self.total_rows,
+            'deletedRows': self.deleted_rows,
+            'error': self.error,
+            'createdAt': self.created_at.isoformat() + 'Z',
+            'finishedAt': self.finished_at.isoformat() + 'Z' if self.finished_at else None
+        }
+
+
 def _gen_valid_until(days=7, no_expiration=False):
     if no_expiration:
         return None
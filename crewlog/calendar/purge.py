@@ -0,0 +1,121 @@
+"""Background removal of the rows of deleted calendars.
+
+Deleting a calendar only removes its roles and marks it as deleted, the events, archived events and recurrent
+events are removed afterwards by a PurgeJob, a chunk of rows per transaction, so no request or lock has to cover
+the whole calendar. PostgreSQL removes shifts through the ON DELETE CASCADE foreign keys, on SQLite, which is used
+without foreign key enforcement, they are deleted explicitly before each chunk.
+
+Jobs run on a thread of the worker that accepted the deletion. Jobs that failed or were interrupted, e.g. by a
+worker restart, are picked up again by `flask purge-calendars`.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import select, delete, update, func
+
+from crewlog import db, invalidation
+from crewlog.auth.models import Role
+from crewlog.calendar.models import Calendar, PurgeJob
+from crewlog.event.models import Event, Shift, RecurEvent, ArchivedEvent, ArchivedShift
+from crewlog.event.snapshots import get_snapshot_store
+
+# running jobs without progress for this long are considered interrupted
+STALE_AFTER = timedelta(minutes=5)
+
+# parent model, child model and the child column referencing the parent, children are removed with their parents
+_PURGED = ((Event, Shift, Shift.event_id),
+           (ArchivedEvent, ArchivedShift, ArchivedShift.event_id),
+           (RecurEvent, None, None))
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='purge')
+
+
+def create_job(calendar, requested_by_id=None):
+    """Mark the calendar as deleted and create its purge job, to be started once the session is committed."""
+    calendar.deleted_at = datetime.utcnow()
+    db.session.execute(delete(Role).where(Role.calendar_id == calendar.id)
+                       .execution_options(synchronize_session=False))
+    invalidation.calendar_changed(calendar.id)
+    job = PurgeJob(calendar_id=calendar.id, requested_by_id=requested_by_id, total_rows=sum(
+        db.session.execute(select(func.count()).select_from(model).where(model.calendar_id == calendar.id)).scalar()
+        for model, _, _ in _PURGED))
+    db.session.add(job)
+    return job
+
+
+def start(jobs):
+    """Run committed purge jobs on the background thread of this worker."""
+    application = current_app._get_current_object()
+    for job in jobs:
+        _executor.submit(_run_in_context, application, job.id)
+
+
+def _run_in_context(application, job_id):
+    with application.app_context():
+        try:
+            run(job_id)
+        except Exception:
+            application.logger.exception('Purge job %s failed', job_id)
+        finally:
+            db.session.remove()
+
+
+def _resumable():
+    return PurgeJob.status.in_((PurgeJob.PENDING, PurgeJob.FAILED)) | \
+        ((PurgeJob.status == PurgeJob.RUNNING) & (PurgeJob.updated_at < datetime.utcnow() - STALE_AFTER))
+
+
+def get_resumable_jobs():
+    """Get pending and failed jobs, and running jobs that stopped making progress."""
+    return PurgeJob.query.filter(_resumable()).order_by(PurgeJob.created_at).all()
+
+
+def run(job_id, chunk_size=None, progress=None):
+    """Run a purge job unless another worker is running it, returns True if the calendar was purged.
+
+    progress(job) is called after every chunk.
+    """
+    if chunk_size is None:
+        chunk_size = current_app.config['PURGE_CHUNK_SIZE']
+    claimed = db.session.execute(
+        update(PurgeJob).where(PurgeJob.id == job_id).where(_resumable())
+        .values(status=PurgeJob.RUNNING, error=None, updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)).rowcount
+    db.session.commit()
+    if not claimed:
+        return False
+    job = db.session.get(PurgeJob, job_id)
+    explicit_children = db.session.get_bind().dialect.name != 'postgresql'
+    try:
+        for model, child_model, child_column in _PURGED:
+            while True:
+                ids = db.session.scalars(select(model.id).where(model.calendar_id == job.calendar_id)
+                                         .limit(chunk_size)).all()
+                if not ids:
+                    break
+                if child_model is not None and explicit_children:
+                    db.session.execute(delete(child_model).where(child_column.in_(ids))
+                                       .execution_options(synchronize_session=False))
+                job.deleted_rows += db.session.execute(delete(model).where(model.id.in_(ids))
+                                                       .execution_options(synchronize_session=False)).rowcount
+                job.updated_at = datetime.utcnow()
+                db.session.commit()
+                if progress:
+                    progress(job)
+        db.session.execute(delete(Calendar).where(Calendar.id == job.calendar_id)
+                           .execution_options(synchronize_session=False))
+        job.status = PurgeJob.DONE
+        job.finished_at = job.updated_at = datetime.utcnow()
+        db.session.commit()
+    except Exception as error:
+        db.session.rollback()
+        job.status = PurgeJob.FAILED
+        job.error = str(error)
+        job.updated_at = datetime.utcnow()
+        db.session.commit()
+        raise
+    snapshot_store = get_snapshot_store()
+    if snapshot_store:
+        snapshot_store.remove(job.calendar_id)
+    return True
@@ -1,14 +1,63 @@
+import os
+import sqlite3
+import threading
+import time
 import uuid
+from contextlib import contextmanager
 
+from sqlalchemy import Column, MetaData, Table, event, func, literal_column, cast, text
+from sqlalchemy.engine import Engine
 from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.types import TypeDecorator, CHAR
+from sqlalchemy.types import TypeDecorator, CHAR, BINARY, BigInteger, LargeBinary
+
+
+# storage of GUID columns on databases without a native UUID type, set once at startup by set_guid_storage
+GUID_STORAGE_HEX = 'hex'
+GUID_STORAGE_BINARY = 'binary'
+_guid_storage = GUID_STORAGE_HEX
+
+
+# databases whose GUID columns convert_guids can rewrite, PostgreSQL ignores the storage
+_CONVERTIBLE_DIALECTS = ('sqlite', 'mysql', 'mariadb')
+
+
+def set_guid_storage(storage, dialect_name=None):
+    """Store GUIDs as 32 hex characters or as 16 bytes, has to be called before the first query.
+
+    Existing databases are converted with `flask convert-guids`. PostgreSQL always uses its native UUID type. Binary
+    storage is refused on other databases, whose columns the conversion cannot rewrite.
+    """
+    global _guid_storage
+    _check_guid_storage(storage, dialect_name)
+    _guid_storage = storage
+
+
+def _check_guid_storage(storage, dialect_name):
+    if storage not in (GUID_STORAGE_HEX, GUID_STORAGE_BINARY):
+        raise ValueError('Unknown GUID storage: {storage}'.format(storage=storage))
+    if storage == GUID_STORAGE_BINARY and dialect_name not in (None, 'postgresql') + _CONVERTIBLE_DIALECTS:
+        raise ValueError('Binary GUID storage is supported on SQLite and MySQL only, not on {dialect}'.format(
+            dialect=dialect_name))
+
+
+def get_guid_storage(dialect):
+    return None if dialect.name == 'postgresql' else _guid_storage
+
+
+def _uuid_from_int(value, new=object.__new__, set_attribute=object.__setattr__, safe=uuid.SafeUUID.unknown):
+    # uuid.UUID() parses and validates its arguments, which dominates loading many rows
+    result = new(uuid.UUID)
+    set_attribute(result, 'int', value)
+    set_attribute(result, 'is_safe', safe)
+    return result
 
 
 class GUID(TypeDecorator):
     """Platform-independent GUID type.
 
     Uses PostgreSQL's UUID type, otherwise uses
-    CHAR(32), storing as stringified hex values.
+    CHAR(32), storing as stringified hex values,
+    or BINARY(16) with the binary GUID storage.
 
     """
     impl = CHAR
@@ -17,6 +66,8 @@ class GUID(TypeDecorator):
     def load_dialect_impl(self, dialect):
         if dialect.name == 'postgresql':
             return dialect.type_descriptor(UUID())
+        elif _guid_storage == GUID_STORAGE_BINARY:
+            return dialect.type_descriptor(BINARY(16))
         else:
             return dialect.type_descriptor(CHAR(32))
 
@@ -27,18 +78,54 @@ class GUID(TypeDecorator):
             return str(value)
         else:
             if not isinstance(value, uuid.UUID):
-                return "%.32x" % uuid.UUID(value).int
-            else:
-                # hexstring
-                return "%.32x" % value.int
+                value = uuid.UUID(value)
+            if _guid_storage == GUID_STORAGE_BINARY:
+                return value.bytes
+            # hexstring
+            return "%.32x" % value.int
 
     def process_result_value(self, value, dialect):
-        if value is None:
+        if value is None or isinstance(value, uuid.UUID):
             return value
+        # rows of a database being converted may hold either format
+        elif isinstance(value, bytes):
+            if len(value) != 16:
+                raise ValueError('Not a binary GUID: {value!r}'.format(value=value))
+            return _uuid_from_int(int.from_bytes(value, 'big'))
+        elif len(value) == 32:
+            return _uuid_from_int(int(value, 16))
         else:
-            if not isinstance(value, uuid.UUID):
-                value = uuid.UUID(value)
-            return value
+            return uuid.UUID(value)
+
+
+_uuid7_lock = threading.Lock()
+_uuid7_last_timestamp = 0
+_uuid7_counter = 0
+
+
+def uuid7():
+    """Time-ordered UUID, version 7 of RFC 9562, used as the default of primary keys.
+
+    The first 48 bits are the Unix time in milliseconds, so new rows are appended at the end of primary key indexes
+    instead of being scattered over them. They are followed by a 42 bit counter, seeded randomly every millisecond,
+    and 32 random bits, which keeps the ids of a process strictly increasing.
+    """
+    global _uuid7_last_timestamp, _uuid7_counter
+    with _uuid7_lock:
+        timestamp = time.time_ns() // 1000000
+        if timestamp > _uuid7_last_timestamp:
+            # the top bit stays clear, so counting up does not overflow within the millisecond
+            _uuid7_counter = int.from_bytes(os.urandom(6), 'big') >> 7
+            _uuid7_last_timestamp = timestamp
+        else:
+            _uuid7_counter += 1
+            if _uuid7_counter >> 42:
+                _uuid7_last_timestamp += 1
+                _uuid7_counter = int.from_bytes(os.urandom(6), 'big') >> 7
+            timestamp = _uuid7_last_timestamp
+        counter = _uuid7_counter
+    return uuid.UUID(int=timestamp << 80 | 0x7 << 76 | (counter >> 30) << 64 | 0x2 << 62
+                     | (counter & 0x3fffffff) << 32 | int.from_bytes(os.urandom(4), 'big'))
 
 
 def same_as(column_name):
@@ -46,3 +133,156 @@ def same_as(column_name):
         return context.current_parameters.get(column_name)
 
     return default_function
+
+
+def new_guid(dialect):
+    """SQL expression generating a new GUID value, used by INSERT ... SELECT statements.
+
+    Matches the storage format of GUID: a native UUID on PostgreSQL, 32 hex characters or 16 bytes otherwise. On
+    PostgreSQL and SQLite the value is time-ordered like uuid7, the millisecond of the statement followed by random
+    bits.
+    """
+    if dialect.name == 'postgresql':
+        timestamp = func.lpad(func.to_hex(cast(func.floor(
+            func.extract('epoch', func.clock_timestamp()) * 1000), BigInteger)), 12, '0')
+        random_hex = func.md5(func.concat(func.random(), func.clock_timestamp()))
+        return cast(func.concat(timestamp, '7', func.substr(random_hex, 1, 3), '8', func.substr(random_hex, 4, 15)),
+                    UUID)
+    elif dialect.name == 'sqlite' and _guid_storage == GUID_STORAGE_BINARY:
+        # || turns blobs into text and SQLite before 3.41 has no unhex(), the bytes come from uuid7 in Python
+        return func.guid_bytes(type_=LargeBinary)
+    elif dialect.name == 'sqlite':
+        timestamp = func.printf('%012x', cast((func.julianday('now') - 2440587.5) * 86400000, BigInteger))
+        random_hex = func.lower(func.hex(func.randomblob(9)))
+        return timestamp.op('||')('7').op('||')(func.substr(random_hex, 1, 3)).op('||')('8') \
+            .op('||')(func.substr(random_hex, 4, 15))
+    elif _guid_storage == GUID_STORAGE_BINARY:
+        return func.unhex(func.replace(func.uuid(), '-', ''))
+    else:
+        return func.replace(func.uuid(), '-', '')
+
+
+@event.listens_for(Engine, 'connect')
+def _register_sqlite_functions(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.create_function('guid_bytes', 0, lambda: uuid7().bytes)
+
+
+def add_seconds(column, seconds, dialect):
+    """SQL expression moving a DateTime column by the given number of seconds."""
+    if dialect.name == 'sqlite':
+        # SQLite keeps datetimes as 'YYYY-MM-DD HH:MM:SS.ffffff' strings, keep the fraction as it was
+        moved = func.strftime('%Y-%m-%d %H:%M:%S', column, '{seconds:+d} seconds'.format(seconds=int(seconds)))
+        return moved.op('||')(func.substr(column, 20))
+    elif dialect.name == 'postgresql':
+        return column + literal_column("interval '{seconds:d} seconds'".format(seconds=int(seconds)))
+    else:
+        return func.timestampadd(literal_column('SECOND'), int(seconds), column)
+
+
+def create_id_map(connection, name='id_map'):
+    """Create a temporary table mapping ids of copied rows to the ids of their copies.
+
+    The caller is expected to drop it once the copy is done.
+    """
+    id_map = Table(name, MetaData(),
+                   Column('old_id', GUID(), primary_key=True),
+                   Column('new_id', GUID(), nullable=False),
+                   prefixes=['TEMPORARY'])
+    id_map.create(bind=connection)
+    return id_map
+
+
+def _guid_columns(metadata):
+    for table in metadata.sorted_tables:
+        for column in table.columns:
+            if isinstance(column.type, GUID):
+                yield table, column
+
+
+def _convert_sqlite_guids(engine, metadata, storage, chunk_size, progress):
+    if storage == GUID_STORAGE_BINARY:
+        source_type, convert = 'text', lambda value: uuid.UUID(value).bytes
+    else:
+        source_type, convert = 'blob', lambda value: bytes(value).hex()
+    quote = engine.dialect.identifier_preparer.quote
+    total = 0
+    for table, column in _guid_columns(metadata):
+        names = {'table': quote(table.name), 'column': quote(column.name)}
+        select_chunk = text('SELECT rowid, {column} FROM {table} WHERE typeof({column}) = :type LIMIT :limit'
+                            .format(**names))
+        update_row = text('UPDATE {table} SET {column} = :value WHERE rowid = :row_id'.format(**names))
+        converted = 0
+        while True:
+            with engine.begin() as connection:
+                rows = connection.execute(select_chunk, {'type': source_type, 'limit': chunk_size}).all()
+                if not rows:
+                    break
+                connection.execute(update_row, [{'row_id': row_id, 'value': convert(value)}
+                                                for row_id, value in rows])
+            converted += len(rows)
+            if progress:
+                progress(table.name, column.name, converted)
+        total += converted
+    return total
+
+
+@contextmanager
+def _without_foreign_key_checks(engine):
+    with engine.begin() as connection:
+        connection.execute(text('SET FOREIGN_KEY_CHECKS = 0'))
+        try:
+            yield connection
+        finally:
+            # the setting belongs to the session, which goes back to the pool
+            connection.execute(text('SET FOREIGN_KEY_CHECKS = 1'))
+
+
+def _convert_mysql_guids(engine, metadata, storage, chunk_size, progress):
+    # the column is widened to VARBINARY(32), which holds both formats, converted in place by chunked UPDATEs
+    # and narrowed to the target type, foreign key checks are off while parents and children differ
+    if storage == GUID_STORAGE_BINARY:
+        source_length, convert, target_type = 32, 'UNHEX({column})', 'BINARY(16)'
+    else:
+        source_length, convert, target_type = 16, 'LOWER(HEX({column}))', 'CHAR(32)'
+    quote = engine.dialect.identifier_preparer.quote
+    total = 0
+    for table, column in _guid_columns(metadata):
+        names = {'table': quote(table.name), 'column': quote(column.name),
+                 'null': 'NULL' if column.nullable else 'NOT NULL'}
+        names['convert'] = convert.format(**names)
+        widen = text('ALTER TABLE {table} MODIFY {column} VARBINARY(32) {null}'.format(**names))
+        update_chunk = text('UPDATE {table} SET {column} = {convert} WHERE LENGTH({column}) = :length LIMIT :limit'
+                            .format(**names))
+        narrow = text('ALTER TABLE {table} MODIFY {column} {type} {null}'.format(type=target_type, **names))
+        with _without_foreign_key_checks(engine) as connection:
+            connection.execute(widen)
+        converted = 0
+        while True:
+            with _without_foreign_key_checks(engine) as connection:
+                count = connection.execute(update_chunk, {'length': source_length, 'limit': chunk_size}).rowcount
+            if not count:
+                break
+            converted += count
+            if progress:
+                progress(table.name, column.name, converted)
+        with _without_foreign_key_checks(engine) as connection:
+            connection.execute(narrow)
+        total += converted
+    return total
+
+
+def convert_guids(engine, metadata, storage, chunk_size=1000, progress=None):
+    """Rewrite the GUID columns of an SQLite or MySQL database to the given storage, a chunk of rows per transaction.
+
+    Values already stored in the target format are skipped, so an interrupted conversion continues where it
+    stopped. On MySQL the column types are changed around the conversion of the values. progress(table, column,
+    converted) is called after every chunk. Returns the number of converted values.
+    """
+    _check_guid_storage(storage, engine.dialect.name)
+    if engine.dialect.name == 'sqlite':
+        return _convert_sqlite_guids(engine, metadata, storage, chunk_size, progress)
+    elif engine.dialect.name in ('mysql', 'mariadb'):
+        return _convert_mysql_guids(engine, metadata, storage, chunk_size, progress)
+    # PostgreSQL stores native UUIDs, other databases only hex
+    return 0
@@ -6,3 +6,51 @@ _basedir = os.path.abspath(os.path.dirname(__file__))
 SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(_basedir, 'resources', 'database.db')
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 WTF_CSRF_TIME_LIMIT = 14400
+# Events that ended more than this many days ago are moved to the archive by `flask archive-events`
+ARCHIVE_AFTER_DAYS = 365
+# Convert event and shift to monthly partitioned tables on PostgreSQL when migrating
+PARTITION_EVENTS = False
+# Months ahead for which `flask partition-events` creates event partitions
+PARTITION_MONTHS_AHEAD = 3
+# Calendars with at least this many events get an in-process index of event times in every worker
+EVENT_INDEX_MIN_EVENTS = 5000
+# Memory per worker for the event index, 0 disables it
+EVENT_INDEX_MAX_MB = 64
+# Directory for occurrence snapshots of large calendars shared by the workers of a host, unset disables them
+OCCURRENCE_SNAPSHOT_DIR = None
+# Days before and after today covered by occurrence snapshots
+OCCURRENCE_SNAPSHOT_PAST_DAYS = 90
+OCCURRENCE_SNAPSHOT_FUTURE_DAYS = 365
+# Calendars with fewer occurrences within the horizon are read from the database
+OCCURRENCE_SNAPSHOT_MIN_OCCURRENCES = 2000
+# Rows removed per transaction when purging deleted calendars
+PURGE_CHUNK_SIZE = 1000
+# Cache of serialized event ranges per calendar change count, 'memory' per worker, 'filesystem' per host or None
+RANGE_CACHE = 'memory'
+# Events held by the memory range cache of a worker
+RANGE_CACHE_SIZE = 200000
+# Directory of the filesystem range cache
+RANGE_CACHE_DIR = None
+# Threads per worker precomputing the windows before and after a read range into the range cache, 0 disables them
+RANGE_WARM_THREADS = 0
+# Share of one core the warm threads of a worker may use
+RANGE_WARM_CPU_SHARE = 0.25
+# Compress API responses of at least COMPRESSION_MIN_SIZE bytes with gzip, or brotli if the brotli package is installed
+COMPRESSION = True
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_GZIP_LEVEL = 6
+COMPRESSION_BROTLI_QUALITY = 4
+# Inline the signed in user and the events of the current week into index.html of the React app
+INDEX_BOOTSTRAP = True
+# Keep the HTML of the modals of the legacy UI, with the CSRF token of each request put into it
+FRAGMENT_CACHE = True
+# Keep compiled templates on disk in JINJA_BYTECODE_CACHE_DIR, a directory of the user in the temp directory if unset
+JINJA_BYTECODE_CACHE = True
+JINJA_BYTECODE_CACHE_DIR = None
+# Directory of the version file through which workers of a host invalidate each other's caches, unset disables it
+INVALIDATION_DIR = None
+# Seconds a worker trusts cached calendar state without asking the database, changes made on other hosts are
+# seen after at most this long
+INVALIDATION_MAX_AGE = 5
+# Storage of GUID columns on SQLite and MySQL, 'hex' or 'binary', convert existing databases with `flask convert-guids`
+GUID_STORAGE = 'hex'
@@ -1,5 +1,6 @@
 from datetime import datetime, timedelta
 
+import click
 import flask_login
 import pytz
 from dateutil import parser
@@ -7,9 +8,12 @@ from dateutil.tz import UTC
 from flask import Blueprint, render_template, request
 from flask_login import login_manager, LoginManager
 from flask_wtf import FlaskForm
+from sqlalchemy import update
 
-from crewlog import application
-from crewlog.event import event_dao
+from crewlog import application, db
+from crewlog.invalidation import get_invalidation_bus
+from crewlog.calendar.models import Calendar
+from crewlog.event import event_dao, partitions
 from crewlog.event.models import Event
 
 bp = Blueprint("event", __name__, template_folder="templates")
@@ -107,6 +111,57 @@ def render_recurrent():
                            form=FlaskForm())
 
 
+@application.cli.command('archive-events')
+@click.option('--days', type=int, help='Archive events that ended more than this many days ago.')
+def archive_events(days):
+    """Move past events and their shifts to the archive tables."""
+    if days is None:
+        days = application.config['ARCHIVE_AFTER_DAYS']
+    before = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days)
+    for calendar in Calendar.query.filter(Calendar.deleted_at.is_(None)).all():
+        archived = event_dao.archive_events(calendar, before)
+        if archived:
+            click.echo('Archived {archived} events of calendar {name}'.format(archived=archived, name=calendar.name))
+
+
+@application.cli.command('partition-events')
+@click.option('--months-ahead', type=int, help='Create partitions up to this many months from now.')
+def partition_events(months_ahead):
+    """Partition events and shifts by month on PostgreSQL and create the upcoming monthly partitions."""
+    if months_ahead is None:
+        months_ahead = application.config['PARTITION_MONTHS_AHEAD']
+    with db.engine.begin() as connection:
+        if connection.dialect.name != 'postgresql':
+            raise click.ClickException('Partitioning is only supported on PostgreSQL')
+        if not partitions.check_partitioned(connection):
+            partitions.partition_tables(connection, months_ahead)
+            click.echo('Partitioned the event and shift tables')
+        last_month = partitions.add_months(partitions.month_start(datetime.utcnow()), months_ahead)
+        for month in partitions.create_partitions(connection, partitions.month_start(datetime.utcnow()), last_month):
+            click.echo('Created partitions for {month:%Y-%m}'.format(month=month))
+
+
+@application.cli.command('detach-event-partitions')
+@click.option('--before', required=True, type=click.DateTime(formats=['%Y-%m']),
+              help='Detach the partitions of months before this one, as YYYY-MM.')
+@click.option('--drop', is_flag=True, help='Drop the detached partitions instead of keeping them as tables.')
+def detach_event_partitions(before, drop):
+    """Detach the event and shift partitions of old months."""
+    with db.engine.begin() as connection:
+        if not partitions.check_partitioned(connection):
+            raise click.ClickException('The event table is not partitioned')
+        detached = partitions.detach_partitions(connection, before, drop)
+        if detached:
+            # detached events disappear from every calendar, cached ranges and indexes must not outlive them
+            connection.execute(update(Calendar).values(change_count=Calendar.change_count + 1))
+        for month in detached:
+            click.echo('{action} partitions for {month:%Y-%m}'.format(action='Dropped' if drop else 'Detached',
+                                                                     month=month))
+    bus = get_invalidation_bus()
+    if detached and bus:
+        bus.publish(everything=True)
+
+
 @bp.record_once
 def on_load(state):
     login_manager.init_app(state.app)
@@ -6,7 +6,6 @@ from dateutil import parser
 from dateutil.tz import UTC
 from flask import Blueprint, request, jsonify
 
-from crewlog import db
 from crewlog.event import event_dao
 from crewlog.event.models import Event, Shift
 
@@ -18,7 +17,8 @@ bp = Blueprint("event_api", __name__, url_prefix="/legacy/calendars/events")
 def get_events():
     start = parser.isoparse(request.args.get('start')).astimezone(UTC)
     end = parser.isoparse(request.args.get('end')).astimezone(UTC)
-    events = [event.serialized for event in event_dao.get_events(start, end)]
+    events = [{key: value for key, value in event.items() if key != 'volunteers'}
+              for event in event_dao.get_serialized_events(start, end)]
     return jsonify(events)
 
 
@@ -153,15 +153,7 @@ def post_recurrent(recurrent_change='following'):
     if 'allDay' in request.form:
         all_day = bool(strtobool(request.form['allDay']))
     if recurrent_change == 'this':
-        if event_id:
-            event = event_dao.get_event(event_id=event_id)
-            event.start = start
-            event.end = end
-        else:
-            event = event_dao.generate_event(recur_id, start=start, end=end)
-            event.init_start = init_start
-        db.session.merge(event)
-        db.session.commit()
+        event_dao.save_occurrence(start, end, event_id=event_id, recur_id=recur_id, init_start=init_start)
     elif recurrent_change == 'following':
         event_dao.save_group_event(recur_id=recur_id, start=start, end=end, timezone=timezone, init_start=init_start,
                                    all_day=all_day, title=title, description=description)
@@ -1,51 +1,262 @@
 import calendar
 import math
+import re
 from datetime import datetime, timedelta
 
 from dateutil.rrule import rrulestr
 from dateutil.tz import UTC
-from sqlalchemy import func
+from sqlalchemy import func, select, update, insert, delete, text, String, bindparam, literal, or_, union_all
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
 
 from crewlog import db
 from crewlog.calendar import calendar_dao
-from .models import Shift, Event, RecurEvent
+from crewlog.database import GUID, new_guid, add_seconds, create_id_map, uuid7
+from crewlog.calendar.models import Calendar
+from crewlog.singleflight import SingleFlight
+from . import partitions
+from .event_index import get_event_index
+from .range_cache import get_range_cache, normalize_window
+from .range_warmer import get_range_warmer
+from .snapshots import get_snapshot_store, from_micros, EVENT, ARCHIVED_EVENT, RECURRENCE
+from .models import Shift, Event, RecurEvent, ArchivedEvent, ArchivedShift
 from ..auth import auth_dao
 from ..auth.models import Role
 
 
+# ids per IN clause when loading events found through the event index or a snapshot
+ID_CHUNK = 500
+
+
+def _range_statements(calendar_filter):
+    """Statements of get_range for the events matching calendar_filter: the whole window, and the events starting
+    shortly before it and the long events of the split lookup on partitioned tables."""
+    statement = select(Event).options(selectinload(Event.shifts)).where(calendar_filter) \
+        .where(Event.start <= bindparam('end')).where(Event.end >= bindparam('start'))
+    return (statement,
+            statement.where(Event.start >= bindparam('lookback')),
+            statement.where(Event.start < bindparam('lookback'))
+            .where(Event.end - Event.start >= bindparam('long_event')))
+
+
+# statements of the hot read paths are built once, SQLAlchemy finds their compiled SQL in its cache by a cache key
+# that is memoized on the statement, so calls only bind parameters
+_CALENDAR_RANGE = _range_statements(Event.calendar_id == bindparam('calendar_id'))
+_CALENDARS_RANGE = _range_statements(Event.calendar_id.in_(bindparam('calendar_ids', expanding=True)))
+_ARCHIVED_RANGE = select(ArchivedEvent).options(selectinload(ArchivedEvent.shifts)) \
+    .where(ArchivedEvent.calendar_id.in_(bindparam('calendar_ids', expanding=True))) \
+    .where(ArchivedEvent.start <= bindparam('end')).where(ArchivedEvent.end >= bindparam('start'))
+_RECUR_EVENTS_RANGE = select(RecurEvent) \
+    .where(RecurEvent.calendar_id.in_(bindparam('calendar_ids', expanding=True))) \
+    .where(RecurEvent.start_recur <= bindparam('end')) \
+    .where((RecurEvent.end_recur >= bindparam('start')) | (RecurEvent.end_recur.is_(None)))
+_BY_IDS = {model: select(model).where(model.id.in_(bindparam('ids', expanding=True)))
+           for model in (Event, ArchivedEvent, RecurEvent)}
+for _model in (Event, ArchivedEvent):
+    _BY_IDS[_model] = _BY_IDS[_model].options(selectinload(_model.shifts))
+
+# concurrent requests for the same range or report of a calendar share one computation
+_RANGES = SingleFlight('ranges')
+_REPORTS = SingleFlight('reports')
+
+
 def get_events(start, end):
-    calendar_id = calendar_dao.get_current_calendar().id
-    events = Event.query.filter(Event.calendar_id == calendar_id).filter(Event.start <= end).filter(
-        Event.end >= start).all()
+    return get_calendar_events(calendar_dao.get_current_calendar(), start, end)
+
+
+def get_calendar_events(calendar, start, end):
+    snapshot_store = get_snapshot_store()
+    occurrences = snapshot_store.lookup(calendar, start, end, load_calendar_events) if snapshot_store else None
+    if occurrences is None:
+        return load_calendar_events(calendar, start, end)
+    return get_occurrence_events(occurrences)
+
+
+def get_serialized_events(start, end):
+    """Get the events of the current calendar as dicts with their volunteers, shared by all readers of the range.
+
+    The dicts may come from the range cache, callers must not change them. The windows before and after the range
+    are warmed in the background if RANGE_WARM_THREADS is set.
+    """
+    current_calendar = calendar_dao.get_current_calendar()
+    range_cache = get_range_cache()
+    if range_cache is None:
+        return _serialize_coalesced(current_calendar, start, end)
+    events = range_cache.get(current_calendar, start, end, _serialize_coalesced)
+    range_warmer = get_range_warmer()
+    if range_warmer:
+        range_warmer.warm(range_cache, current_calendar, start, end, _serialize_coalesced)
+    return events
+
+
+def _serialize_coalesced(calendar, start, end):
+    key = (calendar.id, calendar.change_count, normalize_window(start, end))
+    return _RANGES.do(key, lambda: serialize_calendar_events(calendar, start, end))
+
+
+def serialize_calendar_events(calendar, start, end):
+    events = []
+    for event in get_calendar_events(calendar, start, end):
+        output = event.serialized
+        for key in ('id', 'recurId'):
+            if key in output:
+                output[key] = str(output[key])
+        output['volunteers'] = [{'id': str(shift.id), 'person': shift.person} for shift in event.shifts]
+        events.append(output)
+    return events
+
+
+def load_calendar_events(calendar, start, end):
+    # shifts are needed for the event color anyway, they are loaded in one batch instead of per event
+    event_index = get_event_index()
+    event_ids = event_index.lookup(calendar, start, end) if event_index else None
+    if event_ids is None:
+        events = get_range(_CALENDAR_RANGE, start, end, calendar_id=calendar.id)
+    else:
+        events = _get_in_chunks(Event, event_ids)
+    if reaches_archive(calendar.archived_until, start):
+        events.extend(get_archived_events([calendar.id], start, end))
     recur_events_unboxed = list(filter(lambda event: event.recur_id is not None, events))
-    events.extend(get_recur_events(start, end, recur_events_unboxed))
+    events.extend(get_recur_events(start, end, recur_events_unboxed, calendar_id=calendar.id))
     events = list(filter(lambda event: event.hide is not True, events))
     return events
 
 
-def get_recur_events(start, end, recur_events_unboxed):
+def get_occurrence_events(occurrences):
+    """Get the events of occurrences found in a snapshot, occurrences of recurrent events are generated again."""
+    row_ids = {EVENT: [], ARCHIVED_EVENT: []}
+    recur_ids = set()
+    for kind, _, _, row_id, recur_id in occurrences:
+        if kind == RECURRENCE:
+            recur_ids.add(recur_id)
+        else:
+            row_ids[kind].append(row_id)
+    rows = {}
+    for kind, model in ((EVENT, Event), (ARCHIVED_EVENT, ArchivedEvent)):
+        rows.update((event.id, event) for event in _get_in_chunks(model, row_ids[kind]))
+    recur_events = {recur_event.id: recur_event for recur_event in _get_in_chunks(RecurEvent, list(recur_ids))}
     events = []
-    calendar_id = calendar_dao.get_current_calendar().id
-    recur_events = RecurEvent.query.filter(RecurEvent.calendar_id == calendar_id) \
-        .filter(RecurEvent.start_recur <= end) \
-        .filter((RecurEvent.end_recur >= start) | (RecurEvent.end_recur.is_(None))).all()
+    for kind, start, end, row_id, recur_id in occurrences:
+        if kind == RECURRENCE:
+            if recur_id in recur_events:
+                events.append(_generate_from_group_event(recur_events[recur_id], from_micros(start),
+                                                         from_micros(end)))
+        elif row_id in rows:
+            events.append(rows[row_id])
+    return events
+
+
+def _get_in_chunks(model, ids):
+    items = []
+    for position in range(0, len(ids), ID_CHUNK):
+        items.extend(db.session.scalars(_BY_IDS[model], {'ids': ids[position:position + ID_CHUNK]}))
+    return items
+
+
+def get_range(statements, start, end, **params):
+    """Get the events that overlap the window from start to end, using statements from _range_statements.
+
+    On a partitioned event table the lookup is split in two, so that partitions of months well before the window
+    are pruned: events starting shortly before the window, and long events found through their partial index.
+    """
+    statement, recent_statement, long_statement = statements
+    params.update(start=start, end=end)
+    if not partitions.is_partitioned():
+        return db.session.scalars(statement, params).all()
+    long_event = timedelta(days=partitions.LONG_EVENT_DAYS)
+    params.update(lookback=start - long_event, long_event=long_event)
+    events = db.session.scalars(recent_statement, params).all()
+    events.extend(db.session.scalars(long_statement, params))
+    return events
+
+
+def get_recur_events(start, end, recur_events_unboxed, calendar_id=None):
+    events = []
+    if calendar_id is None:
+        calendar_id = calendar_dao.get_current_calendar().id
+    recur_events = db.session.scalars(_RECUR_EVENTS_RANGE, {'calendar_ids': [calendar_id], 'start': start, 'end': end})
     for recur_event in recur_events:
-        rrule = rrulestr(recur_event.rrule)
-        if recur_event.end_recur:
-            rrule = rrule.replace(until=recur_event.end_recur.replace(tzinfo=UTC))
-        for start_date in list(rrule.between(after=start, before=end, inc=True)):
-            start_date = start_date.astimezone(UTC).replace(tzinfo=None)
-            # nasty part, do not add recurrent event if unboxed version already there
-            # check if user moved the original event or changed it anyhow, e.g added shifts
-            if not any(recur_event_unboxed.recur_id == recur_event.id and recur_event_unboxed.init_start == start_date
-                       for recur_event_unboxed in recur_events_unboxed):
-                duration = recur_event.end - recur_event.start
-                event = generate_event(recur_event.id, start=start_date, end=start_date + duration)
-                events.append(event)
+        events.extend(expand_recur_event(recur_event, start, end, recur_events_unboxed))
+    return events
+
+
+def expand_recur_event(recur_event, start, end, recur_events_unboxed):
+    events = []
+    rrule = rrulestr(recur_event.rrule)
+    if recur_event.end_recur:
+        rrule = rrule.replace(until=recur_event.end_recur.replace(tzinfo=UTC))
+    for start_date in list(rrule.between(after=start, before=end, inc=True)):
+        start_date = start_date.astimezone(UTC).replace(tzinfo=None)
+        # nasty part, do not add recurrent event if unboxed version already there
+        # check if user moved the original event or changed it anyhow, e.g added shifts
+        if not any(recur_event_unboxed.recur_id == recur_event.id and recur_event_unboxed.init_start == start_date
+                   for recur_event_unboxed in recur_events_unboxed):
+            duration = recur_event.end - recur_event.start
+            events.append(_generate_from_group_event(recur_event, start=start_date, end=start_date + duration))
     return events
 
 
+def get_overlay_events(calendar_ids, start, end):
+    """Get events of several calendars at once, leaving the default calendar untouched.
+
+    Loads events, their shifts and the recurrent series with one query per table.
+    """
+    events = get_range(_CALENDARS_RANGE, start, end, calendar_ids=list(calendar_ids))
+    archived_until = db.session.query(func.max(Calendar.archived_until)) \
+        .filter(Calendar.id.in_(calendar_ids)).scalar()
+    if reaches_archive(archived_until, start):
+        events.extend(get_archived_events(calendar_ids, start, end))
+    recur_events_unboxed = list(filter(lambda event: event.recur_id is not None, events))
+    recur_events = db.session.scalars(_RECUR_EVENTS_RANGE, {'calendar_ids': list(calendar_ids), 'start': start,
+                                                            'end': end})
+    for recur_event in recur_events:
+        events.extend(expand_recur_event(recur_event, start, end, recur_events_unboxed))
+    events = list(filter(lambda event: event.hide is not True, events))
+    return events
+
+
+def reaches_archive(archived_until, start):
+    """Check if a window starting at start may contain events moved to the archive tables."""
+    if archived_until is None:
+        return False
+    if start.tzinfo is not None:
+        start = start.astimezone(UTC).replace(tzinfo=None)
+    return start < archived_until
+
+
+def get_archived_events(calendar_ids, start, end):
+    return db.session.scalars(_ARCHIVED_RANGE, {'calendar_ids': list(calendar_ids), 'start': start,
+                                                'end': end}).all()
+
+
+def archive_events(calendar, before):
+    """Move events of the calendar that ended before the given date, with their shifts, to the archive tables.
+
+    Overrides of recurrent events are archived only once their original occurrence is past as well, so the
+    series does not bring the occurrence back. Returns the number of archived events.
+    """
+    event_table = Event.__table__
+    shift_table = Shift.__table__
+    archived_ids = select(event_table.c.id).where(event_table.c.calendar_id == calendar.id) \
+        .where(event_table.c.end < before) \
+        .where((event_table.c.init_start < before) | event_table.c.init_start.is_(None))
+    event_columns = [column.name for column in event_table.columns]
+    shift_columns = [column.name for column in shift_table.columns]
+
+    db.session.execute(ArchivedEvent.__table__.insert().from_select(
+        event_columns, select(*event_table.columns).where(event_table.c.id.in_(archived_ids))))
+    db.session.execute(ArchivedShift.__table__.insert().from_select(
+        shift_columns, select(*shift_table.columns).where(shift_table.c.event_id.in_(archived_ids))))
+    db.session.execute(shift_table.delete().where(shift_table.c.event_id.in_(archived_ids)))
+    archived = db.session.execute(event_table.delete().where(event_table.c.id.in_(archived_ids))).rowcount
+    if calendar.archived_until is None or calendar.archived_until < before:
+        calendar.archived_until = before
+    if archived:
+        calendar_dao.mark_changed(calendar.id)
+    db.session.commit()
+    return archived
+
+
 @auth_dao.has_role(Role.MANAGER)
 def save_event(title=None, description=None, start=None, end=None, all_day=False, event_id=None, recurrent=False,
                recurrent_interval=None,
@@ -54,6 +265,7 @@ def save_event(title=None, description=None, start=None, end=None, all_day=False
     calendar_id = calendar_dao.get_current_calendar().id
     if event:
         db.session.merge(event)
+        calendar_dao.mark_changed(calendar_id)
         db.session.commit()
     elif recurrent:
         save_group_event(title=title.strip(), description=description, start=start, end=end, all_day=all_day,
@@ -66,9 +278,249 @@ def save_event(title=None, description=None, start=None, end=None, all_day=False
         if init_start:
             event.init_start = init_start
         db.session.merge(event)
+        calendar_dao.mark_changed(calendar_id)
         db.session.commit()
 
 
+@auth_dao.has_role(Role.MANAGER)
+def update_event(event_id, **values):
+    """Update only the given columns of an event with a single UPDATE statement.
+
+    Returns the updated row, or None if the event is not in the current calendar. When only one of start and end
+    is given it is checked against the stored other one in the same statement, ValueError is raised if the event
+    would end before its start.
+    """
+    calendar_id = calendar_dao.get_current_calendar().id
+    statement = update(Event).where(Event.id == event_id).where(Event.calendar_id == calendar_id) \
+        .values(**values).execution_options(synchronize_session=False)
+    if 'start' in values and 'end' not in values:
+        statement = statement.where(Event.end >= values['start'])
+    elif 'end' in values and 'start' not in values:
+        statement = statement.where(Event.start <= values['end'])
+    columns = (Event.id, Event.title, Event.description, Event.start, Event.end, Event.all_day, Event.recur_id)
+    if db.engine.dialect.update_returning:
+        row = db.session.execute(statement.returning(*columns)).first()
+    else:
+        row = None
+        if db.session.execute(statement).rowcount:
+            row = db.session.execute(select(*columns).where(Event.id == event_id)).first()
+    if row:
+        calendar_dao.mark_changed(calendar_id)
+    db.session.commit()
+    if not row and ('start' in values) != ('end' in values) and db.session.scalar(
+            select(Event.id).where(Event.id == event_id).where(Event.calendar_id == calendar_id)):
+        raise ValueError('Event end must not be before its start')
+    return row
+
+
+def apply_batch(operations):
+    """Apply a batch of event and shift operations in a single transaction.
+
+    Operations are dicts prepared by the API layer with an 'op' of create, update, delete, add_shift or
+    remove_shift. Events and shifts referenced by the batch are validated with one query per table, and the
+    changes are written with bulk statements. Returns a tuple of a success flag and per-operation results,
+    nothing is written if any operation is invalid.
+    """
+    calendar_id = calendar_dao.get_current_calendar().id
+    event_ids = {operation['event_id'] for operation in operations if operation.get('event_id')}
+    shift_ids = {operation['shift_id'] for operation in operations if operation.get('shift_id')}
+    known_events = {}
+    if event_ids:
+        # start and end are loaded to check updates that move only one of them
+        rows = db.session.execute(select(Event.id, Event.recur_id, Event.start, Event.end)
+                                  .where(Event.id.in_(event_ids))
+                                  .where(Event.calendar_id == calendar_id))
+        known_events = {row.id: row for row in rows}
+    known_shifts = set()
+    if shift_ids:
+        known_shifts = set(db.session.scalars(select(Shift.id).join(Event, Shift.event_id == Event.id)
+                                              .where(Shift.id.in_(shift_ids))
+                                              .where(Event.calendar_id == calendar_id)))
+
+    results = []
+    created = {}
+    inserts = {}
+    updates = {}
+    new_shifts = []
+    removed_shifts = set()
+    hidden_events = set()
+    deleted_events = set()
+    for index, operation in enumerate(operations):
+        kind = operation['op']
+        result = {'index': index, 'op': kind, 'status': 'ok'}
+        results.append(result)
+        if kind == 'create':
+            event_id = uuid7()
+            created[index] = event_id
+            inserts[event_id] = dict(operation['values'], id=event_id, calendar_id=calendar_id,
+                                     init_start=operation['values']['start'], hide=False)
+            result['id'] = str(event_id)
+        elif kind == 'remove_shift':
+            if operation['shift_id'] not in known_shifts or operation['shift_id'] in removed_shifts:
+                result.update(status='error', message='Shift not found')
+                continue
+            removed_shifts.add(operation['shift_id'])
+            result['id'] = str(operation['shift_id'])
+        else:
+            event_id = operation.get('event_id') or created.get(operation.get('event_ref'))
+            if event_id not in known_events and event_id not in inserts:
+                result.update(status='error', message='Event not found')
+                continue
+            if event_id in hidden_events or event_id in deleted_events:
+                result.update(status='error', message='Event was deleted earlier in the batch')
+                continue
+            result['id'] = str(event_id)
+            if kind == 'update':
+                if event_id in inserts:
+                    inserts[event_id].update(operation['values'])
+                else:
+                    updates.setdefault(event_id, {'id': event_id}).update(operation['values'])
+            elif kind == 'add_shift':
+                shift_id = uuid7()
+                new_shifts.append({'id': shift_id, 'person': operation['person'], 'event_id': event_id})
+                result['shiftId'] = str(shift_id)
+            elif kind == 'delete':
+                if event_id in known_events and known_events[event_id].recur_id:
+                    # keep the unboxed occurrence hidden, so the recurrent event does not bring it back
+                    hidden_events.add(event_id)
+                else:
+                    deleted_events.add(event_id)
+
+    for event_values in list(inserts.values()) + list(updates.values()):
+        stored = known_events.get(event_values['id'])
+        start = event_values.get('start', stored.start if stored else None)
+        end = event_values.get('end', stored.end if stored else None)
+        if start is not None and end is not None and end < start:
+            index = next(result['index'] for result in results if result.get('id') == str(event_values['id']))
+            results[index].update(status='error', message='Event end must not be before its start')
+    if any(result['status'] == 'error' for result in results):
+        return False, results
+
+    inserts = [event_values for event_values in inserts.values() if event_values['id'] not in deleted_events]
+    new_shifts = [shift for shift in new_shifts if shift['event_id'] not in deleted_events | hidden_events]
+    try:
+        if inserts:
+            db.session.execute(insert(Event), inserts)
+        if updates:
+            db.session.execute(update(Event), list(updates.values()))
+        if new_shifts:
+            db.session.execute(insert(Shift), new_shifts)
+        if removed_shifts:
+            db.session.execute(delete(Shift).where(Shift.id.in_(removed_shifts))
+                               .execution_options(synchronize_session=False))
+        if hidden_events or deleted_events:
+            db.session.execute(delete(Shift).where(Shift.event_id.in_(hidden_events | deleted_events))
+                               .execution_options(synchronize_session=False))
+        if hidden_events:
+            db.session.execute(update(Event).where(Event.id.in_(hidden_events)).values(hide=True)
+                               .execution_options(synchronize_session=False))
+        if deleted_events:
+            db.session.execute(delete(Event).where(Event.id.in_(deleted_events))
+                               .execution_options(synchronize_session=False))
+        calendar_dao.mark_changed(calendar_id)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        for result in results:
+            result.update(status='error', message='Batch could not be saved')
+        return False, results
+    return True, results
+
+
+@auth_dao.has_role(Role.MANAGER)
+def copy_events(start, end, offset, include_shifts=False):
+    """Copy the events of the current calendar starting within [start, end) by offset.
+
+    Single events, and optionally their shifts, are copied with INSERT ... SELECT statements. An occurrence
+    of a recurrent event is copied as an override of its series when the series also occurs at the target
+    time and the occurrence was changed, and as a single event when the series does not occur there.
+    Returns the number of copied events and shifts.
+    """
+    calendar_id = calendar_dao.get_current_calendar().id
+    connection = db.session.connection()
+    dialect = connection.dialect
+    seconds = int(offset.total_seconds())
+    event_table = Event.__table__
+    shift_table = Shift.__table__
+    id_map = create_id_map(connection)
+
+    db.session.execute(id_map.insert().from_select(
+        ['old_id', 'new_id'],
+        select(event_table.c.id, new_guid(dialect))
+        .where(event_table.c.calendar_id == calendar_id)
+        .where(event_table.c.recur_id.is_(None))
+        .where(event_table.c.hide.is_(False))
+        .where(event_table.c.start >= start)
+        .where(event_table.c.start < end)))
+    copied_events = db.session.execute(event_table.insert().from_select(
+        ['id', 'title', 'description', 'start', 'end', 'all_day', 'calendar_id', 'recur_id', 'init_start', 'hide'],
+        select(id_map.c.new_id, event_table.c.title, event_table.c.description,
+               add_seconds(event_table.c.start, seconds, dialect), add_seconds(event_table.c.end, seconds, dialect),
+               event_table.c.all_day, event_table.c.calendar_id, event_table.c.recur_id,
+               add_seconds(event_table.c.start, seconds, dialect), event_table.c.hide)
+        .join(id_map, event_table.c.id == id_map.c.old_id))).rowcount
+
+    overrides = {(event.recur_id, event.init_start): event for event in
+                 Event.query.filter(Event.calendar_id == calendar_id).filter(Event.recur_id.isnot(None))
+                 .filter(Event.init_start >= start).filter(Event.init_start < end).all()}
+    target_overrides = set(db.session.execute(
+        select(Event.recur_id, Event.init_start).where(Event.calendar_id == calendar_id)
+        .where(Event.recur_id.isnot(None))
+        .where(Event.init_start >= start + offset).where(Event.init_start < end + offset)).all())
+    recur_events = RecurEvent.query.filter(RecurEvent.calendar_id == calendar_id) \
+        .filter(RecurEvent.start_recur < end) \
+        .filter((RecurEvent.end_recur >= start) | (RecurEvent.end_recur.is_(None))).all()
+    new_events = []
+    new_ids = []
+    for recur_event in recur_events:
+        rrule = rrulestr(recur_event.rrule)
+        if recur_event.end_recur:
+            rrule = rrule.replace(until=recur_event.end_recur.replace(tzinfo=UTC))
+        target_starts = {date.astimezone(UTC).replace(tzinfo=None)
+                         for date in rrule.between(after=start + offset, before=end + offset, inc=True)}
+        duration = recur_event.end - recur_event.start
+        for start_date in rrule.between(after=start, before=end, inc=True):
+            if start_date == end:
+                continue
+            start_date = start_date.astimezone(UTC).replace(tzinfo=None)
+            override = overrides.get((recur_event.id, start_date))
+            if override and override.hide:
+                continue
+            target_start = start_date + offset
+            if target_start in target_starts:
+                # the series brings the occurrence back by itself, copy only what was changed
+                if not override or (recur_event.id, target_start) in target_overrides:
+                    continue
+                recur_id = recur_event.id
+            else:
+                recur_id = None
+            source = override or _generate_from_group_event(recur_event, start=start_date,
+                                                            end=start_date + duration)
+            event_id = uuid7()
+            new_events.append({'id': event_id, 'title': source.title, 'description': source.description,
+                               'start': source.start + offset, 'end': source.end + offset,
+                               'all_day': source.all_day, 'calendar_id': calendar_id, 'recur_id': recur_id,
+                               'init_start': target_start, 'hide': False})
+            if override:
+                new_ids.append({'old_id': override.id, 'new_id': event_id})
+    if new_events:
+        db.session.execute(event_table.insert(), new_events)
+        copied_events += len(new_events)
+    if new_ids:
+        db.session.execute(id_map.insert(), new_ids)
+
+    copied_shifts = 0
+    if include_shifts:
+        copied_shifts = db.session.execute(shift_table.insert().from_select(
+            ['id', 'person', 'event_id'],
+            select(new_guid(dialect), shift_table.c.person, id_map.c.new_id)
+            .join(id_map, shift_table.c.event_id == id_map.c.old_id))).rowcount
+    id_map.drop(bind=connection)
+    calendar_dao.mark_changed(calendar_id)
+    db.session.commit()
+    return copied_events, copied_shifts
+
+
 @auth_dao.has_role(Role.MANAGER)
 def save_group_event(title=None, description=None, start=None, end=None, timezone=None, recurrent=None,
                      recurrent_interval=None, all_day=False, recur_id=None, init_start=None):
@@ -109,6 +561,24 @@ def save_group_event(title=None, description=None, start=None, end=None, timezon
                                  calendar_id=calendar_id, rrule=rrule_str, recurrent_type=recurrent,
                                  recurrent_interval=recurrent_interval)
     db.session.merge(recur_event)
+    calendar_dao.mark_changed(calendar_id)
+    db.session.commit()
+
+
+@auth_dao.has_role(Role.MANAGER)
+def save_occurrence(start, end, event_id=None, recur_id=None, init_start=None):
+    """Move a single occurrence of a recurrent event, the stored one if event_id is given, otherwise a new one."""
+    if event_id:
+        event = get_event(event_id=event_id)
+        if event is None:
+            return
+        event.start = start
+        event.end = end
+    else:
+        event = generate_event(recur_id, start=start, end=end)
+        event.init_start = init_start
+    db.session.merge(event)
+    calendar_dao.mark_changed(event.calendar_id)
     db.session.commit()
 
 
@@ -123,6 +593,7 @@ def remove_event(event_id):
         db.session.merge(event)
     else:
         db.session.delete(event)
+    calendar_dao.mark_changed(calendar_id)
     db.session.commit()
 
 
@@ -131,12 +602,104 @@ def remove_group_event(recur_id, start):
     recur_event = get_group_event(recur_id)
     recur_event.end_recur = start - timedelta(seconds=1)
     db.session.merge(recur_event)
+    calendar_dao.mark_changed(recur_event.calendar_id)
     db.session.commit()
 
 
-def get_event(event_id):
+def get_event(event_id, include_archive=False):
+    current_calendar = calendar_dao.get_current_calendar()
+    event = Event.query.filter(Event.id == event_id).filter(Event.calendar_id == current_calendar.id).first()
+    if not event and include_archive and current_calendar.archived_until:
+        event = ArchivedEvent.query.filter(ArchivedEvent.id == event_id) \
+            .filter(ArchivedEvent.calendar_id == current_calendar.id).first()
+    return event
+
+
+def get_events_by_ids(event_ids, include_archive=False):
+    current_calendar = calendar_dao.get_current_calendar()
+    events = Event.query.options(selectinload(Event.shifts)).filter(Event.id.in_(event_ids)) \
+        .filter(Event.calendar_id == current_calendar.id).all()
+    if include_archive and current_calendar.archived_until and len(events) < len(event_ids):
+        events.extend(ArchivedEvent.query.options(selectinload(ArchivedEvent.shifts))
+                      .filter(ArchivedEvent.id.in_(event_ids))
+                      .filter(ArchivedEvent.calendar_id == current_calendar.id).all())
+    return events
+
+
+_SQLITE_SEARCH = text("""
+    SELECT d.kind, d.item_id FROM event_search
+    JOIN event_search_doc d ON d.docid = event_search.rowid
+    WHERE event_search MATCH :match
+    ORDER BY bm25(event_search, 10.0, 1.0, 0.0)
+    LIMIT :limit OFFSET :offset
+""").columns(kind=String, item_id=GUID)
+
+_POSTGRESQL_SEARCH = text("""
+    SELECT kind, item_id FROM (
+        SELECT 'event' AS kind, id AS item_id, ts_rank(search, query) AS rank
+        FROM event, to_tsquery('simple', :match) query
+        WHERE calendar_id = :calendar_id AND NOT hide AND search @@ query
+        UNION ALL
+        SELECT 'recur_event' AS kind, id AS item_id, ts_rank(search, query) AS rank
+        FROM recur_event, to_tsquery('simple', :match) query
+        WHERE calendar_id = :calendar_id AND search @@ query
+    ) matches
+    ORDER BY rank DESC, item_id
+    LIMIT :limit OFFSET :offset
+""").columns(kind=String, item_id=GUID)
+
+
+def _like_search(calendar_id, terms, limit, offset):
+    """Match every term anywhere in the title or description with LIKE, for databases without a search index."""
+    patterns = ['%{term}%'.format(term=term.replace('_', '\\_')) for term in terms]
+
+    def matches(model):
+        return [or_(func.lower(model.title).like(pattern, escape='\\'),
+                    func.lower(model.description).like(pattern, escape='\\')) for pattern in patterns]
+
+    events = select(literal('event').label('kind'), Event.id.label('item_id')) \
+        .where(Event.calendar_id == calendar_id).where(Event.hide.is_(False)).where(*matches(Event))
+    recur_events = select(literal('recur_event').label('kind'), RecurEvent.id.label('item_id')) \
+        .where(RecurEvent.calendar_id == calendar_id).where(*matches(RecurEvent))
+    found = union_all(events, recur_events).subquery()
+    return db.session.execute(select(found.c.kind, found.c.item_id).order_by(found.c.item_id)
+                              .limit(limit).offset(offset)).all()
+
+
+def search_events(query, limit=20, offset=0):
+    """Full-text search over titles and descriptions of events and recurrent events of the current calendar.
+
+    Every word of the query has to match as a prefix. Uses the FTS5 index on SQLite and the tsvector columns
+    on PostgreSQL, both created by the add_event_search migration. Other databases fall back to a LIKE scan
+    where every word has to occur anywhere in the text. Returns Event and RecurEvent objects ordered by rank,
+    or by creation on the fallback.
+    """
     calendar_id = calendar_dao.get_current_calendar().id
-    return Event.query.filter(Event.id == event_id).filter(Event.calendar_id == calendar_id).first()
+    terms = re.findall(r'\w+', query.lower())
+    if not terms:
+        return []
+    dialect = db.session.get_bind().dialect
+    if dialect.name == 'sqlite':
+        match = 'calendar_id:"{calendar_id}" AND {{title description}}:({terms})'.format(
+            calendar_id=calendar_id.hex, terms=' AND '.join('"{term}"*'.format(term=term) for term in terms))
+        rows = db.session.execute(_SQLITE_SEARCH, {'match': match, 'limit': limit, 'offset': offset}).all()
+    elif dialect.name == 'postgresql':
+        match = ' & '.join('{term}:*'.format(term=term) for term in terms)
+        rows = db.session.execute(_POSTGRESQL_SEARCH, {'match': match, 'calendar_id': str(calendar_id),
+                                                       'limit': limit, 'offset': offset}).all()
+    else:
+        rows = _like_search(calendar_id, terms, limit, offset)
+
+    event_ids = [item_id for kind, item_id in rows if kind == 'event']
+    recur_ids = [item_id for kind, item_id in rows if kind == 'recur_event']
+    items = {}
+    if event_ids:
+        items.update((event.id, event) for event in Event.query.options(selectinload(Event.shifts))
+                     .filter(Event.id.in_(event_ids)).all())
+    if recur_ids:
+        items.update((recur_event.id, recur_event) for recur_event in
+                     RecurEvent.query.filter(RecurEvent.id.in_(recur_ids)).all())
+    return [items[item_id] for kind, item_id in rows if item_id in items]
 
 
 def get_group_event(recur_id):
@@ -145,7 +708,10 @@ def get_group_event(recur_id):
 
 
 def generate_event(recur_id, start, end):
-    recur_event = get_group_event(recur_id)
+    return _generate_from_group_event(get_group_event(recur_id), start, end)
+
+
+def _generate_from_group_event(recur_event, start, end):
     event = Event(title=recur_event.title, description=recur_event.description,
                   start=start, end=end, all_day=recur_event.all_day, calendar_id=recur_event.calendar_id,
                   recur_id=recur_event.id)
@@ -168,76 +734,99 @@ def save_shift(event_id=None, new_person_name=None, shift_ids_to_remove=[], recu
         db.session.merge(event)
     except IntegrityError:
         return False
+    calendar_dao.mark_changed(event.calendar_id)
     db.session.commit()
     return True
 
 
 def get_all_users():
     """Get all unique users who have shifts in the current calendar."""
-    if calendar_dao.get_current_calendar():
-        calendar_id = calendar_dao.get_current_calendar().id
-        users = db.session.query(Shift.person) \
-            .join(Event, Shift.event_id == Event.id) \
-            .filter(Event.calendar_id == calendar_id) \
-            .distinct() \
-            .order_by(Shift.person) \
-            .all()
-        return [user[0] for user in users]
+    current_calendar = calendar_dao.get_current_calendar()
+    if current_calendar:
+        models = [(Shift, Event)]
+        if current_calendar.archived_until:
+            models.append((ArchivedShift, ArchivedEvent))
+        users = set()
+        for shift_model, event_model in models:
+            users.update(user[0] for user in db.session.query(shift_model.person)
+                         .join(event_model, shift_model.event_id == event_model.id)
+                         .filter(event_model.calendar_id == current_calendar.id)
+                         .distinct()
+                         .all())
+        return sorted(users)
     return []
 
 
+def _report_statements(shift_model, event_model):
+    # Get all shifts with their event details for the report
+    # Join Shift to Event via the event_id foreign key
+    statement = select(
+        shift_model.person,
+        event_model.title,
+        event_model.start,
+        event_model.end,
+        event_model.id,
+        event_model.description
+    ) \
+        .join(event_model, shift_model.event_id == event_model.id) \
+        .where(event_model.calendar_id == bindparam('calendar_id')) \
+        .where(event_model.start <= bindparam('end')) \
+        .where(event_model.end >= bindparam('start'))
+    return statement, statement.where(shift_model.person == bindparam('person'))
+
+
+# shift model -> statements of get_report without and with a filter by person
+_REPORT = {Shift: _report_statements(Shift, Event), ArchivedShift: _report_statements(ArchivedShift, ArchivedEvent)}
+
+
 @auth_dao.has_role(Role.MANAGER)
 def get_report(start, end, calendar_name="default", user_filter=None):
-    if calendar_dao.get_current_calendar():
-        calendar_id = calendar_dao.get_current_calendar().id
-        # Get all shifts with their event details for the report
-        # Join Shift to Event via the event_id foreign key
-        query = db.session.query(
-            Shift.person,
-            Event.title,
-            Event.start,
-            Event.end,
-            Event.id,
-            Event.description
-        ) \
-            .join(Event, Shift.event_id == Event.id) \
-            .filter(Event.calendar_id == calendar_id) \
-            .filter(Event.start <= end) \
-            .filter(Event.end >= start)
-        
-        # Apply user filter if specified
-        if user_filter:
-            query = query.filter(Shift.person == user_filter)
-        
-        shifts_data = query.order_by(Shift.person, Event.start).all()
-        
-        # Process the data to calculate hours and group by person
-        report = {}
-        for person, title, event_start, event_end, event_id, description in shifts_data:
-            if person not in report:
-                report[person] = {
-                    'person': person,
-                    'total_hours': 0,
-                    'shifts': []
-                }
-            
-            # Calculate duration in hours
-            duration = (event_end - event_start).total_seconds() / 3600.0
-            report[person]['total_hours'] += duration
-            report[person]['shifts'].append({
-                'title': title,
-                'start': event_start,
-                'end': event_end,
-                'duration': duration,
-                'event_id': str(event_id),
-                'description': description or ''
-            })
-        
-        return list(report.values())
+    current_calendar = calendar_dao.get_current_calendar()
+    if current_calendar:
+        key = (current_calendar.id, current_calendar.change_count, start, end, user_filter)
+        return _REPORTS.do(key, lambda: _compute_report(current_calendar, start, end, user_filter))
     else:
         return None
 
 
+def _compute_report(current_calendar, start, end, user_filter):
+    models = [(Shift, Event)]
+    if reaches_archive(current_calendar.archived_until, start):
+        models.append((ArchivedShift, ArchivedEvent))
+    shifts_data = []
+    for shift_model, event_model in models:
+        statements = _REPORT[shift_model]
+        # Apply user filter if specified
+        statement = statements[1] if user_filter else statements[0]
+        shifts_data.extend(db.session.execute(statement, {
+            'calendar_id': current_calendar.id, 'start': start, 'end': end, 'person': user_filter}).all())
+    shifts_data.sort(key=lambda shift: (shift[0], shift[2]))
+
+    # Process the data to calculate hours and group by person
+    report = {}
+    for person, title, event_start, event_end, event_id, description in shifts_data:
+        if person not in report:
+            report[person] = {
+                'person': person,
+                'total_hours': 0,
+                'shifts': []
+            }
+
+        # Calculate duration in hours
+        duration = (event_end - event_start).total_seconds() / 3600.0
+        report[person]['total_hours'] += duration
+        report[person]['shifts'].append({
+            'title': title,
+            'start': event_start,
+            'end': event_end,
+            'duration': duration,
+            'event_id': str(event_id),
+            'description': description or ''
+        })
+
+    return list(report.values())
+
+
 def get_weekday(date, timezone):
     weekday = date.astimezone(timezone).weekday()
     return weekday, calendar.day_name[weekday]
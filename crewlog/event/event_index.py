@@ -0,0 +1,151 @@
+"""In-process index of event times for large calendars.
+
+Each worker keeps, per calendar, the ids and start/end times of all its event rows in compact arrays sorted by
+start. Range reads bisect the arrays for the ids overlapping a window and load only those rows. An index is valid
+as long as the change_count of its calendar is unchanged, every event write bumps it in the same transaction.
+Callers pass the calendar they loaded for the request, and the index is reloaded whenever its change_count differs
+from the one of that calendar, so results cached under a change_count are always built from an index of the same
+count. Indexes are kept for the calendars used last, within a memory cap.
+"""
+import threading
+import uuid
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from dateutil.tz import UTC
+from flask import current_app
+from sqlalchemy import func, select
+
+from crewlog import db
+from . import partitions
+from .models import Event
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+# events longer than this are kept apart, so they do not widen the bisect window of all others
+_LONG_EVENT = timedelta(days=partitions.LONG_EVENT_DAYS) // _MICROSECOND
+# bytes accounted for a calendar that is too small to be indexed
+_MARKER_SIZE = 64
+
+
+def to_micros(value):
+    if value.tzinfo is not None:
+        value = value.astimezone(UTC).replace(tzinfo=None)
+    return (value - _EPOCH) // _MICROSECOND
+
+
+class CalendarIndex:
+    """Sorted event times of a single calendar, ids are kept as 16 bytes each.
+
+    Without rows it only marks the calendar as too small to be indexed.
+    """
+    __slots__ = ('change_count', 'starts', 'ends', 'ids', 'max_duration', 'long_events')
+
+    def __init__(self, change_count, rows=None):
+        self.change_count = change_count
+        self.starts = None
+        if rows is None:
+            return
+        self.starts = array('q')
+        self.ends = array('q')
+        self.ids = bytearray()
+        self.max_duration = 0
+        self.long_events = []
+        for event_id, start, end in rows:
+            start, end = to_micros(start), to_micros(end)
+            if end - start > _LONG_EVENT:
+                self.long_events.append((start, end, event_id))
+                continue
+            self.starts.append(start)
+            self.ends.append(end)
+            self.ids += event_id.bytes
+            self.max_duration = max(self.max_duration, end - start)
+
+    @property
+    def size(self):
+        if self.starts is None:
+            return _MARKER_SIZE
+        return self.starts.itemsize * len(self.starts) * 2 + len(self.ids) + 64 * len(self.long_events)
+
+    def lookup(self, start, end):
+        """Get the ids of events overlapping the window from start to end, both in microseconds."""
+        first = bisect_left(self.starts, start - self.max_duration)
+        last = bisect_right(self.starts, end)
+        ids = [uuid.UUID(bytes=bytes(self.ids[position * 16:position * 16 + 16]))
+               for position in range(first, last) if self.ends[position] >= start]
+        ids.extend(event_id for event_start, event_end, event_id in self.long_events
+                   if event_start <= end and event_end >= start)
+        return ids
+
+
+class EventIndex:
+    """Least recently used calendar indexes of a worker, within max_bytes.
+
+    Calendars with fewer than min_events event rows are not indexed, lookup returns None for them and the caller
+    queries the database as usual.
+    """
+
+    def __init__(self, min_events, max_bytes):
+        self.min_events = min_events
+        self.max_bytes = max_bytes
+        self.calendars = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def lookup(self, calendar, start, end):
+        """Get the ids of the events of the calendar overlapping the window, or None for a small calendar.
+
+        The change_count of the calendar is the one loaded by the caller, the index is reloaded if it differs.
+        """
+        with self.lock:
+            index = self.calendars.get(calendar.id)
+        if index is None or index.change_count != calendar.change_count:
+            index = self._load(calendar.id, calendar.change_count)
+        with self.lock:
+            if calendar.id in self.calendars:
+                self.calendars.move_to_end(calendar.id)
+        if index.starts is None:
+            return None
+        return index.lookup(to_micros(start), to_micros(end))
+
+    def _load(self, calendar_id, change_count):
+        count = db.session.execute(select(func.count()).select_from(Event)
+                                   .where(Event.calendar_id == calendar_id)).scalar()
+        if count < self.min_events:
+            # remember that the calendar is small until it changes
+            index = CalendarIndex(change_count)
+        else:
+            index = CalendarIndex(change_count, db.session.execute(
+                select(Event.id, Event.start, Event.end).where(Event.calendar_id == calendar_id)
+                .order_by(Event.start)))
+        self._store(calendar_id, index)
+        return index
+
+    def _store(self, calendar_id, index):
+        if index.size > self.max_bytes:
+            return
+        with self.lock:
+            previous = self.calendars.pop(calendar_id, None)
+            if previous is not None:
+                self.size -= previous.size
+            self.calendars[calendar_id] = index
+            self.size += index.size
+            while self.size > self.max_bytes:
+                _, evicted = self.calendars.popitem(last=False)
+                self.size -= evicted.size
+
+
+_event_index = None
+
+
+def get_event_index():
+    """Get the event index of this worker, or None if it is disabled by EVENT_INDEX_MAX_MB."""
+    global _event_index
+    max_bytes = current_app.config['EVENT_INDEX_MAX_MB'] * 1024 * 1024
+    if not max_bytes:
+        return None
+    if _event_index is None or _event_index.max_bytes != max_bytes:
+        _event_index = EventIndex(current_app.config['EVENT_INDEX_MIN_EVENTS'], max_bytes)
+    return _event_index
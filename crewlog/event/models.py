@@ -1,10 +1,8 @@
-import uuid
-
 from sqlalchemy import UniqueConstraint
 from sqlalchemy.ext.declarative import declared_attr
 
 from crewlog import db
-from crewlog.database import GUID, same_as
+from crewlog.database import GUID, same_as, uuid7
 
 
 class EventBase(db.Model):
@@ -18,14 +16,12 @@ class EventBase(db.Model):
 
     @declared_attr
     def calendar_id(self):
-        return db.Column(GUID(), db.ForeignKey('calendar.id'), nullable=False)
+        return db.Column(GUID(), db.ForeignKey('calendar.id', ondelete='CASCADE'), nullable=False)
 
 
-class Event(EventBase):
-    id = db.Column(GUID(), primary_key=True, default=uuid.uuid4)
-    recur_id = db.Column(GUID(), db.ForeignKey('recur_event.id'))
-    recur_event = db.relationship('RecurEvent')
-    shifts = db.relationship('Shift', backref='Event', cascade="all,delete", lazy=True)
+class SingleEventBase(EventBase):
+    __abstract__ = True
+
     init_start = db.Column(db.DateTime, default=same_as('start'))
     # sometimes will have to hide the event instead of true removal in order to remember what actually event was
     # removed from the recurrent group
@@ -56,19 +52,50 @@ class Event(EventBase):
             return "#9F9C99"
 
 
+class Event(SingleEventBase):
+    id = db.Column(GUID(), primary_key=True, default=uuid7)
+    recur_id = db.Column(GUID(), db.ForeignKey('recur_event.id'))
+    recur_event = db.relationship('RecurEvent')
+    shifts = db.relationship('Shift', backref='Event', cascade="all,delete", lazy=True)
+
+
+class ArchivedEvent(SingleEventBase):
+    """Past event moved out of the event table by the archive-events command, read only."""
+    __tablename__ = 'event_archive'
+    __table_args__ = (db.Index('ix_event_archive_calendar_start', 'calendar_id', 'start'),)
+
+    id = db.Column(GUID(), primary_key=True)
+    recur_id = db.Column(GUID())
+    shifts = db.relationship('ArchivedShift', lazy=True)
+
+
 class RecurEvent(EventBase):
-    id = db.Column(GUID(), primary_key=True, default=uuid.uuid4)
+    id = db.Column(GUID(), primary_key=True, default=uuid7)
     start_recur = db.Column(db.DateTime, nullable=False)
     end_recur = db.Column(db.DateTime)
     rrule = db.Column(db.String(256), nullable=False)
     recurrent_type = db.Column(db.String(256), nullable=False, default='')
     recurrent_interval = db.Column(db.Integer, nullable=False, default=1)
 
+    @property
+    def serialized(self):
+        return {
+            'title': self.title,
+            'description': self.description,
+            'start': self.start.isoformat() + 'Z',
+            'end': self.end.isoformat() + 'Z',
+            'allDay': self.all_day,
+            'recurId': self.id,
+            'startRecur': self.start_recur.isoformat() + 'Z',
+            'endRecur': self.end_recur.isoformat() + 'Z' if self.end_recur else None,
+            'recurrentType': self.recurrent_type
+        }
+
 
 class Shift(db.Model):
-    id = db.Column(GUID(), primary_key=True, default=uuid.uuid4)
+    id = db.Column(GUID(), primary_key=True, default=uuid7)
     person = db.Column(db.String(80), nullable=False)
-    event_id = db.Column(GUID(), db.ForeignKey('event.id'), nullable=False)
+    event_id = db.Column(GUID(), db.ForeignKey('event.id', ondelete='CASCADE'), nullable=False)
     UniqueConstraint(person, event_id, name='shift_person_event_key')
 
     @property
@@ -77,3 +104,18 @@ class Shift(db.Model):
             'id': self.id,
             'person': self.person
         }
+
+
+class ArchivedShift(db.Model):
+    __tablename__ = 'shift_archive'
+
+    id = db.Column(GUID(), primary_key=True)
+    person = db.Column(db.String(80), nullable=False)
+    event_id = db.Column(GUID(), db.ForeignKey('event_archive.id', ondelete='CASCADE'), nullable=False, index=True)
+
+    @property
+    def serialized(self):
+        return {
+            'id': self.id,
+            'person': self.person
+        }
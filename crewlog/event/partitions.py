@@ -0,0 +1,243 @@
+"""Monthly range partitioning of events and shifts on PostgreSQL.
+
+A partitioned database keeps events in one partition per month of their start. Shifts are kept in the matching
+month partitions of shift_partitioned, keyed by the start of their event, and the application keeps using them
+through the shift view. Rows of months without a partition land in the default partitions.
+"""
+import re
+from datetime import date
+
+from sqlalchemy import text
+
+from crewlog import db
+
+# range reads look up events by start at most this many days before the window,
+# longer events are found through the ix_event_long partial index
+LONG_EVENT_DAYS = 31
+
+_PARTITION_NAME = re.compile(r'event_p(\d{4})_(\d{2})')
+
+_partitioned_engines = {}
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def next_month(month):
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def add_months(month, months):
+    for _ in range(months):
+        month = next_month(month)
+    return month
+
+
+def is_partitioned():
+    """Check if the event table of the application database is partitioned, cached per engine."""
+    engine = db.engine
+    if engine not in _partitioned_engines:
+        with engine.connect() as connection:
+            _partitioned_engines[engine] = check_partitioned(connection)
+    return _partitioned_engines[engine]
+
+
+def check_partitioned(connection):
+    if connection.dialect.name != 'postgresql':
+        return False
+    return connection.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('event'))")).scalar()
+
+
+def list_partitions(connection):
+    """Get the months of the existing event partitions, oldest first."""
+    names = connection.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass('event')")).scalars()
+    months = []
+    for name in names:
+        match = _PARTITION_NAME.fullmatch(name)
+        if match:
+            months.append(date(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+
+def partition_tables(connection, months_ahead):
+    """Convert the event and shift tables to monthly partitioned tables, keeping their rows.
+
+    Partitions are created from the month of the oldest event up to months_ahead months from now.
+    """
+    if connection.dialect.server_version_info < (15,):
+        # older versions delete shifts instead of moving them when an event moves to another partition
+        raise RuntimeError('Partitioning events requires PostgreSQL 15 or newer')
+    for constraint in connection.execute(text(
+            "SELECT conname FROM pg_constraint WHERE contype = 'f' AND conrelid = to_regclass('shift')")).scalars():
+        connection.execute(text('ALTER TABLE shift DROP CONSTRAINT "{name}"'.format(name=constraint)))
+    connection.execute(text("ALTER TABLE event RENAME TO event_unpartitioned"))
+    connection.execute(text("ALTER TABLE shift RENAME TO shift_unpartitioned"))
+
+    connection.execute(text("CREATE TABLE event (LIKE event_unpartitioned INCLUDING DEFAULTS INCLUDING GENERATED) "
+                            "PARTITION BY RANGE (start)"))
+    connection.execute(text("CREATE TABLE event_default PARTITION OF event DEFAULT"))
+    connection.execute(text("CREATE TABLE shift_partitioned (LIKE shift_unpartitioned INCLUDING DEFAULTS, "
+                            "event_start TIMESTAMP WITHOUT TIME ZONE NOT NULL) PARTITION BY RANGE (event_start)"))
+    connection.execute(text("CREATE TABLE shift_default PARTITION OF shift_partitioned DEFAULT"))
+    oldest = connection.execute(text("SELECT min(start) FROM event_unpartitioned")).scalar()
+    last_month = add_months(month_start(date.today()), months_ahead)
+    create_partitions(connection, month_start(oldest) if oldest else month_start(date.today()), last_month)
+
+    columns = _stored_columns(connection, 'event')
+    connection.execute(text("INSERT INTO event ({columns}) SELECT {columns} FROM event_unpartitioned"
+                            .format(columns=columns)))
+    connection.execute(text("INSERT INTO shift_partitioned (id, person, event_id, event_start) "
+                            "SELECT s.id, s.person, s.event_id, e.start FROM shift_unpartitioned s "
+                            "JOIN event_unpartitioned e ON e.id = s.event_id"))
+    has_search = 'search' in _columns(connection, 'event_unpartitioned')
+    connection.execute(text("DROP TABLE shift_unpartitioned"))
+    connection.execute(text("DROP TABLE event_unpartitioned"))
+
+    # constraints are added once the rows are in, their names were taken by the old tables until now
+    connection.execute(text("ALTER TABLE event ADD CONSTRAINT event_pkey PRIMARY KEY (id, start)"))
+    connection.execute(text("ALTER TABLE event ADD CONSTRAINT event_calendar_id_fkey "
+                            "FOREIGN KEY (calendar_id) REFERENCES calendar (id) ON DELETE CASCADE"))
+    connection.execute(text("ALTER TABLE event ADD CONSTRAINT event_recur_id_fkey "
+                            "FOREIGN KEY (recur_id) REFERENCES recur_event (id)"))
+    connection.execute(text("CREATE INDEX ix_event_calendar_start ON event (calendar_id, start)"))
+    connection.execute(text("CREATE INDEX ix_event_long ON event (calendar_id, start) "
+                            "WHERE \"end\" - start >= interval '{days} days'".format(days=LONG_EVENT_DAYS)))
+    if has_search:
+        connection.execute(text("CREATE INDEX ix_event_search ON event USING gin (search)"))
+    connection.execute(text("ALTER TABLE shift_partitioned ADD CONSTRAINT shift_pkey PRIMARY KEY (id, event_start)"))
+    connection.execute(text("ALTER TABLE shift_partitioned ADD CONSTRAINT shift_person_event_key "
+                            "UNIQUE (person, event_id, event_start)"))
+    connection.execute(text("ALTER TABLE shift_partitioned ADD CONSTRAINT shift_event_fkey "
+                            "FOREIGN KEY (event_id, event_start) REFERENCES event (id, start) "
+                            "ON UPDATE CASCADE ON DELETE CASCADE"))
+    connection.execute(text("CREATE INDEX ix_shift_event_id ON shift_partitioned (event_id)"))
+
+    # the application does not know event_start, inserts through the view look it up
+    connection.execute(text("CREATE VIEW shift AS SELECT id, person, event_id FROM shift_partitioned"))
+    connection.execute(text(
+        "CREATE FUNCTION shift_insert() RETURNS trigger LANGUAGE plpgsql AS $$ BEGIN "
+        "INSERT INTO shift_partitioned (id, person, event_id, event_start) "
+        "SELECT NEW.id, NEW.person, NEW.event_id, start FROM event WHERE id = NEW.event_id; "
+        "IF NOT FOUND THEN RAISE foreign_key_violation USING MESSAGE = 'event ' || NEW.event_id || ' does not exist'; "
+        "END IF; RETURN NEW; END $$"))
+    connection.execute(text("CREATE TRIGGER shift_insert INSTEAD OF INSERT ON shift "
+                            "FOR EACH ROW EXECUTE FUNCTION shift_insert()"))
+    _partitioned_engines.clear()
+
+
+def unpartition_tables(connection):
+    """Convert partitioned event and shift tables back to plain tables, partitions detached before are left alone."""
+    connection.execute(text("CREATE TABLE event_unpartitioned (LIKE event INCLUDING DEFAULTS INCLUDING GENERATED)"))
+    columns = _stored_columns(connection, 'event')
+    connection.execute(text("INSERT INTO event_unpartitioned ({columns}) SELECT {columns} FROM event"
+                            .format(columns=columns)))
+    connection.execute(text("CREATE TABLE shift_unpartitioned AS SELECT id, person, event_id FROM shift_partitioned"))
+    has_search = 'search' in _columns(connection, 'event')
+    connection.execute(text("DROP VIEW shift"))
+    connection.execute(text("DROP FUNCTION shift_insert()"))
+    connection.execute(text("DROP TABLE shift_partitioned"))
+    connection.execute(text("DROP TABLE event"))
+    connection.execute(text("ALTER TABLE event_unpartitioned RENAME TO event"))
+    connection.execute(text("ALTER TABLE shift_unpartitioned RENAME TO shift"))
+
+    connection.execute(text("ALTER TABLE event ADD CONSTRAINT event_pkey PRIMARY KEY (id)"))
+    connection.execute(text("ALTER TABLE event ADD CONSTRAINT event_calendar_id_fkey "
+                            "FOREIGN KEY (calendar_id) REFERENCES calendar (id)"))
+    connection.execute(text("ALTER TABLE event ADD CONSTRAINT event_recur_id_fkey "
+                            "FOREIGN KEY (recur_id) REFERENCES recur_event (id)"))
+    if has_search:
+        connection.execute(text("CREATE INDEX ix_event_search ON event USING gin (search)"))
+    connection.execute(text("ALTER TABLE shift ALTER COLUMN id SET NOT NULL, ALTER COLUMN person SET NOT NULL, "
+                            "ALTER COLUMN event_id SET NOT NULL"))
+    connection.execute(text("ALTER TABLE shift ADD CONSTRAINT shift_pkey PRIMARY KEY (id)"))
+    connection.execute(text("ALTER TABLE shift ADD CONSTRAINT shift_person_event_key UNIQUE (person, event_id)"))
+    connection.execute(text("ALTER TABLE shift ADD CONSTRAINT shift_event_id_fkey "
+                            "FOREIGN KEY (event_id) REFERENCES event (id)"))
+    _partitioned_engines.clear()
+
+
+def create_partitions(connection, first_month, last_month):
+    """Create event and shift partitions for the months from first_month to last_month, both included.
+
+    Rows of these months kept in the default partitions so far are moved to the new partitions.
+    Returns the months that got a partition.
+    """
+    existing = set(list_partitions(connection))
+    created = []
+    month = month_start(first_month)
+    while month <= last_month:
+        if month not in existing:
+            _create_partition(connection, month)
+            created.append(month)
+        month = next_month(month)
+    return created
+
+
+def _create_partition(connection, month):
+    names = {'suffix': 'p{month:%Y_%m}'.format(month=month),
+             'bounds': "FOR VALUES FROM ('{month}') TO ('{until}')".format(month=month, until=next_month(month))}
+    in_month = {'month': month, 'until': next_month(month)}
+    if not connection.execute(text("SELECT EXISTS (SELECT 1 FROM event_default "
+                                   "WHERE start >= :month AND start < :until)"), in_month).scalar():
+        connection.execute(text("CREATE TABLE event_{suffix} PARTITION OF event {bounds}".format(**names)))
+        connection.execute(text("CREATE TABLE shift_{suffix} PARTITION OF shift_partitioned {bounds}"
+                                .format(**names)))
+        return
+    # a partition cannot be attached while the default partition holds rows of its range, move them over first
+    connection.execute(text("CREATE TABLE event_{suffix} (LIKE event INCLUDING DEFAULTS INCLUDING GENERATED)"
+                            .format(**names)))
+    connection.execute(text("CREATE TABLE shift_{suffix} (LIKE shift_partitioned INCLUDING DEFAULTS)"
+                            .format(**names)))
+    columns = _stored_columns(connection, 'event')
+    connection.execute(text("INSERT INTO event_{suffix} ({columns}) SELECT {columns} FROM event_default "
+                            "WHERE start >= :month AND start < :until".format(columns=columns, **names)), in_month)
+    connection.execute(text("INSERT INTO shift_{suffix} SELECT * FROM shift_default "
+                            "WHERE event_start >= :month AND event_start < :until".format(**names)), in_month)
+    connection.execute(text("DELETE FROM shift_default WHERE event_start >= :month AND event_start < :until"),
+                       in_month)
+    connection.execute(text("DELETE FROM event_default WHERE start >= :month AND start < :until"), in_month)
+    connection.execute(text("ALTER TABLE event ATTACH PARTITION event_{suffix} {bounds}".format(**names)))
+    connection.execute(text("ALTER TABLE shift_partitioned ATTACH PARTITION shift_{suffix} {bounds}"
+                            .format(**names)))
+
+
+def detach_partitions(connection, before, drop=False):
+    """Detach the event and shift partitions of the months before the given one.
+
+    Detached partitions are kept as plain tables unless drop is set. Returns the detached months.
+    """
+    detached = []
+    for month in list_partitions(connection):
+        if month >= month_start(before):
+            break
+        suffix = 'p{month:%Y_%m}'.format(month=month)
+        connection.execute(text("ALTER TABLE shift_partitioned DETACH PARTITION shift_{suffix}".format(suffix=suffix)))
+        # the detached shifts keep a copy of the foreign key, which would keep their events from being detached
+        for constraint in connection.execute(text(
+                "SELECT conname FROM pg_constraint WHERE contype = 'f' AND conrelid = to_regclass(:name)"),
+                {'name': 'shift_' + suffix}).scalars():
+            connection.execute(text('ALTER TABLE shift_{suffix} DROP CONSTRAINT "{name}"'
+                                    .format(suffix=suffix, name=constraint)))
+        connection.execute(text("ALTER TABLE event DETACH PARTITION event_{suffix}".format(suffix=suffix)))
+        if drop:
+            connection.execute(text("DROP TABLE shift_{suffix}, event_{suffix}".format(suffix=suffix)))
+        detached.append(month)
+    return detached
+
+
+def _columns(connection, table):
+    return connection.execute(text(
+        "SELECT column_name FROM information_schema.columns WHERE table_schema = current_schema() "
+        "AND table_name = :table"), {'table': table}).scalars().all()
+
+
+def _stored_columns(connection, table):
+    """Comma separated columns of a table that can be inserted into, generated columns left out."""
+    columns = connection.execute(text(
+        "SELECT column_name FROM information_schema.columns WHERE table_schema = current_schema() "
+        "AND table_name = :table AND is_generated = 'NEVER' ORDER BY ordinal_position"), {'table': table}).scalars()
+    return ', '.join('"{column}"'.format(column=column) for column in columns)
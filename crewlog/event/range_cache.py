@@ -0,0 +1,184 @@
+"""Cache of serialized event ranges, keyed by calendar, change count and window.
+
+Many volunteers open the same week of the same calendar, the cache serves them the events serialized for the
+first one. Entries are keyed by the change_count of their calendar, so a write makes all entries of the calendar
+unreachable at once, they are removed by invalidate() on the next miss. Entries are never expired otherwise: a
+write to events, shifts or recurrences that commits without calendar_dao.mark_changed leaves wrong ranges in the
+cache until the next counted write, so event writes go through the functions of event_dao, which all bump it in
+their transaction, e.g. save_occurrence for moving a single occurrence of a recurrent event.
+
+Stores implement RangeCacheBackend: MemoryBackend keeps entries per worker within a bound on the number of cached
+events, FileBackend keeps them in a directory shared by the workers of a host. A store like Redis would implement
+the same three methods, with keys such as calendar:change_count:window and an expiry instead of invalidate().
+"""
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+from dateutil.tz import UTC
+from flask import current_app
+
+MEMORY = 'memory'
+FILESYSTEM = 'filesystem'
+
+
+def normalize_window(start, end):
+    """Get the window as naive UTC ISO strings to the second, so equal windows sent with other offsets match."""
+    window = []
+    for value in (start, end):
+        if value.tzinfo is not None:
+            value = value.astimezone(UTC).replace(tzinfo=None)
+        window.append(value.replace(microsecond=0).isoformat())
+    return tuple(window)
+
+
+class RangeCacheBackend:
+    """Store of cached event ranges, events are lists of dicts of JSON types."""
+
+    def get(self, calendar_id, change_count, window):
+        """Get the cached events, or None."""
+        raise NotImplementedError
+
+    def set(self, calendar_id, change_count, window, events):
+        raise NotImplementedError
+
+    def invalidate(self, calendar_id, change_count):
+        """Remove the entries of the calendar cached for other change counts."""
+        raise NotImplementedError
+
+
+class MemoryBackend(RangeCacheBackend):
+    """Least recently used entries of a worker, holding at most max_events events in total."""
+
+    def __init__(self, max_events):
+        self.max_events = max_events
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, calendar_id, change_count, window):
+        key = (calendar_id, change_count, window)
+        with self.lock:
+            events = self.entries.get(key)
+            if events is not None:
+                self.entries.move_to_end(key)
+            return events
+
+    def set(self, calendar_id, change_count, window, events):
+        if len(events) > self.max_events:
+            return
+        key = (calendar_id, change_count, window)
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self.entries[key] = events
+            self.size += len(events)
+            while self.size > self.max_events:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def invalidate(self, calendar_id, change_count):
+        with self.lock:
+            for key in [key for key in self.entries if key[0] == calendar_id and key[1] != change_count]:
+                self.size -= len(self.entries.pop(key))
+
+
+class FileBackend(RangeCacheBackend):
+    """Entries as JSON files in directory/calendar/change_count/, shared by the workers of a host."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, calendar_id, change_count, window=None):
+        path = os.path.join(self.directory, calendar_id.hex, str(change_count))
+        if window is None:
+            return path
+        return os.path.join(path, '{start}_{end}.json'.format(start=window[0], end=window[1]).replace(':', ''))
+
+    def get(self, calendar_id, change_count, window):
+        try:
+            with open(self.path(calendar_id, change_count, window), 'rb') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def set(self, calendar_id, change_count, window, events):
+        path = self.path(calendar_id, change_count, window)
+        temporary_path = '{path}.{pid}.{thread}.tmp'.format(path=path, pid=os.getpid(), thread=threading.get_ident())
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(temporary_path, 'w') as file:
+                json.dump(events, file, separators=(',', ':'))
+            os.replace(temporary_path, path)
+        except OSError:
+            # a concurrent invalidate() removed the directory, the entry is outdated anyway
+            pass
+
+    def invalidate(self, calendar_id, change_count):
+        calendar_path = os.path.join(self.directory, calendar_id.hex)
+        try:
+            names = os.listdir(calendar_path)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if name != str(change_count):
+                shutil.rmtree(os.path.join(calendar_path, name), ignore_errors=True)
+
+
+class RangeCache:
+    """Serialized events of calendar windows, computed by load on a miss."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, calendar, start, end, load):
+        """Get the events of the calendar overlapping the window, load(calendar, start, end) serializes them."""
+        window = normalize_window(start, end)
+        events = self.backend.get(calendar.id, calendar.change_count, window)
+        if events is not None:
+            with self.lock:
+                self.hits += 1
+            return events
+        with self.lock:
+            self.misses += 1
+        events = load(calendar, start, end)
+        self.backend.invalidate(calendar.id, calendar.change_count)
+        self.backend.set(calendar.id, calendar.change_count, window, events)
+        return events
+
+    @property
+    def metrics(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+
+_range_cache = None
+_range_cache_config = None
+
+
+def get_range_cache():
+    """Get the range cache of this worker, or None if RANGE_CACHE is not set."""
+    global _range_cache, _range_cache_config
+    config = (current_app.config['RANGE_CACHE'], current_app.config['RANGE_CACHE_SIZE'],
+              current_app.config['RANGE_CACHE_DIR'])
+    if not config[0]:
+        return None
+    if _range_cache is None or _range_cache_config != config:
+        if config[0] == MEMORY:
+            backend = MemoryBackend(config[1])
+        elif config[0] == FILESYSTEM:
+            if not config[2]:
+                raise ValueError('RANGE_CACHE_DIR is required for the filesystem range cache')
+            backend = FileBackend(config[2])
+        else:
+            raise ValueError('Unknown RANGE_CACHE: {backend}'.format(backend=config[0]))
+        _range_cache = RangeCache(backend)
+        _range_cache_config = config
+    return _range_cache
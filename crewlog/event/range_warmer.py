@@ -0,0 +1,102 @@
+"""Background precomputation of the windows next to a range that was just read.
+
+After a volunteer loads a week the next request is almost always the week before or after it. The warmer expands
+those windows into the range cache on a small thread pool, keyed by the change count the calendar has when the
+window is loaded, so arrow navigation finds them warm. Windows of calendars changed since the triggering read are
+left to the next read. Warm threads of a worker share a CPU budget, a share of one core over a sliding window, and
+warming is skipped while it is used up or too many windows are pending.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from crewlog import db
+from crewlog.calendar.models import Calendar
+from .range_cache import get_range_cache, normalize_window
+
+# seconds over which the CPU time of warm threads is accounted
+_BUDGET_WINDOW = 10.0
+
+
+class RangeWarmer:
+    """Warms adjacent windows on threads threads, using at most cpu_share of a core."""
+
+    def __init__(self, threads, cpu_share):
+        self.threads = threads
+        self.cpu_share = cpu_share
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='warm')
+        self.max_pending = threads * 4
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.window_start = time.monotonic()
+        self.cpu_used = 0.0
+        self.warmed = 0
+        self.stale = 0
+        self.over_budget = 0
+
+    def _has_budget(self):
+        now = time.monotonic()
+        with self.lock:
+            if now - self.window_start > _BUDGET_WINDOW:
+                self.window_start = now
+                self.cpu_used = 0.0
+            return self.cpu_used < self.cpu_share * _BUDGET_WINDOW
+
+    def warm(self, range_cache, calendar, start, end, load):
+        """Queue the windows before and after start to end, load(calendar, start, end) serializes their events."""
+        if not self._has_budget():
+            self.over_budget += 1
+            return
+        application = current_app._get_current_object()
+        length = end - start
+        for window_start, window_end in ((start - length, start), (end, end + length)):
+            window = normalize_window(window_start, window_end)
+            key = (calendar.id, calendar.change_count, window)
+            if range_cache.backend.get(calendar.id, calendar.change_count, window) is not None:
+                continue
+            with self.lock:
+                if key in self.pending or len(self.pending) >= self.max_pending:
+                    continue
+                self.pending.add(key)
+            self.executor.submit(self._run_in_context, application, range_cache, key, window_start, window_end, load)
+
+    def _run_in_context(self, application, range_cache, key, start, end, load):
+        calendar_id, change_count, _ = key
+        began = time.thread_time()
+        with application.app_context():
+            try:
+                calendar = db.session.get(Calendar, calendar_id)
+                if calendar is None or calendar.deleted_at is not None or calendar.change_count != change_count:
+                    self.stale += 1
+                    return
+                range_cache.get(calendar, start, end, load)
+                self.warmed += 1
+            except Exception:
+                application.logger.exception('Warming %s failed', key)
+            finally:
+                db.session.remove()
+                with self.lock:
+                    self.pending.discard(key)
+                    self.cpu_used += time.thread_time() - began
+
+    @property
+    def metrics(self):
+        with self.lock:
+            return {'warmed': self.warmed, 'stale': self.stale, 'overBudget': self.over_budget,
+                    'pending': len(self.pending), 'cpuUsed': round(self.cpu_used, 3)}
+
+
+_range_warmer = None
+
+
+def get_range_warmer():
+    """Get the range warmer of this worker, or None if RANGE_WARM_THREADS is 0 or there is no range cache."""
+    global _range_warmer
+    threads, cpu_share = current_app.config['RANGE_WARM_THREADS'], current_app.config['RANGE_WARM_CPU_SHARE']
+    if not threads or get_range_cache() is None:
+        return None
+    if _range_warmer is None or (_range_warmer.threads, _range_warmer.cpu_share) != (threads, cpu_share):
+        _range_warmer = RangeWarmer(threads, cpu_share)
+    return _range_warmer
@@ -0,0 +1,286 @@
+"""Occurrence snapshots of large calendars, shared by all workers of a host through mmap.
+
+A snapshot holds the visible occurrences of a calendar within a horizon around today: single events, archived
+events and the generated occurrences of recurrent events, after overrides and hidden occurrences were applied.
+Each occurrence is a fixed-width record of its start and end in microseconds, the id of its row and the id of its
+recurrent event, sorted by start, so range reads are a binary search over the mapped file. Only the rows of the
+found occurrences are loaded from the database afterwards.
+
+A snapshot is valid while the change_count of its calendar is unchanged and its horizon still starts at the same
+day, it is compared with the change_count of the calendar the caller loaded for the request. A reader that finds
+it outdated first estimates an upper bound of the occurrences from the rows of the calendar, without expanding
+recurrences. Calendars below OCCURRENCE_SNAPSHOT_MIN_OCCURRENCES get a small snapshot without records right away,
+others are rebuilt on a background thread into a temporary file that is renamed over the old one. Readers use the
+database until the new file is in place.
+"""
+import mmap
+import os
+import struct
+import threading
+import time
+import uuid
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from dateutil.tz import UTC
+from flask import current_app
+from sqlalchemy import func, select
+
+from crewlog import db
+from crewlog.calendar.models import Calendar
+from .event_index import to_micros
+from .models import ArchivedEvent, Event, RecurEvent
+
+_MAGIC = b'CLOS'
+_VERSION = 1
+# magic, version, flags, change count, horizon start, horizon end, longest occurrence, record count
+_HEADER = struct.Struct('<4sHHqqqqq')
+# start, end, row id, recurrent event id, kind, padded to 8 bytes
+_RECORD = struct.Struct('<qq16s16sB7x')
+_EMPTY_ID = bytes(16)
+
+SMALL = 1
+# occurrence kinds
+EVENT = 0
+ARCHIVED_EVENT = 1
+RECURRENCE = 2
+
+# seconds after which a lock of an interrupted rebuild is ignored
+_LOCK_TIMEOUT = 300
+# shortest days between occurrences by recurrent type, other types are counted as daily
+_PERIOD_DAYS = {'weekly': 7, 'monthly': 28, 'yearly': 365}
+
+
+def from_micros(value):
+    return datetime(1970, 1, 1) + timedelta(microseconds=value)
+
+
+class Snapshot:
+    """A mapped snapshot file of a single calendar."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self.stat = os.fstat(file.fileno())
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.flags, self.change_count, self.horizon_start, self.horizon_end, self.max_duration, \
+            self.count = _HEADER.unpack_from(self.map, 0)
+        if magic != _MAGIC or version != _VERSION:
+            self.map.close()
+            raise ValueError('Not an occurrence snapshot: ' + path)
+        self.starts = _Starts(self.map, self.count)
+
+    def covers(self, start, end):
+        return self.horizon_start <= start and end <= self.horizon_end
+
+    def lookup(self, start, end):
+        """Get the (kind, start, end, row id, recurrent event id) of occurrences overlapping the window."""
+        occurrences = []
+        first = bisect_left(self.starts, start - self.max_duration)
+        last = bisect_right(self.starts, end)
+        for position in range(first, last):
+            occurrence_start, occurrence_end, row_id, recur_id, kind = _RECORD.unpack_from(
+                self.map, _HEADER.size + position * _RECORD.size)
+            if occurrence_end >= start:
+                occurrences.append((kind, occurrence_start, occurrence_end,
+                                    uuid.UUID(bytes=row_id) if row_id != _EMPTY_ID else None,
+                                    uuid.UUID(bytes=recur_id) if recur_id != _EMPTY_ID else None))
+        return occurrences
+
+
+class _Starts:
+    """Sequence view of the record starts of a mapped snapshot, for bisect."""
+
+    def __init__(self, snapshot_map, count):
+        self.map = snapshot_map
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, position):
+        return struct.unpack_from('<q', self.map, _HEADER.size + position * _RECORD.size)[0]
+
+
+class SnapshotStore:
+    """Snapshot files of a directory, mapped on first use by each worker."""
+
+    def __init__(self, directory, past_days, future_days, min_occurrences):
+        self.directory = directory
+        self.past_days = past_days
+        self.future_days = future_days
+        self.min_occurrences = min_occurrences
+        self.snapshots = {}
+        self.lock = threading.Lock()
+        # calendars whose snapshot is being rebuilt by this worker
+        self.pending = set()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='snapshot')
+        os.makedirs(directory, exist_ok=True)
+
+    def horizon(self):
+        today = datetime.now(UTC).replace(hour=0, minute=0, second=0, microsecond=0)
+        return today - timedelta(days=self.past_days), today + timedelta(days=self.future_days)
+
+    def path(self, calendar_id):
+        return os.path.join(self.directory, '{calendar_id}.occurrences'.format(calendar_id=calendar_id.hex))
+
+    def lookup(self, calendar, start, end, load):
+        """Get the occurrences of the calendar overlapping the window, or None if the database has to be used.
+
+        load(calendar, start, end) gets the events of a calendar without snapshots, it is used for rebuilding.
+        """
+        horizon_start, horizon_end = self.horizon()
+        start, end = to_micros(start), to_micros(end)
+        if start < to_micros(horizon_start) or end > to_micros(horizon_end):
+            return None
+        snapshot = self._open(calendar.id)
+        if snapshot is None or snapshot.change_count != calendar.change_count \
+                or snapshot.horizon_start != to_micros(horizon_start):
+            self._refresh(calendar, horizon_start, horizon_end, load)
+            return None
+        if snapshot.flags & SMALL or not snapshot.covers(start, end):
+            return None
+        return snapshot.lookup(start, end)
+
+    def estimate(self, calendar_id, horizon_start, horizon_end):
+        """Get an upper bound of the occurrences of a calendar within the horizon, from its rows."""
+        count = 0
+        for model in (Event, ArchivedEvent):
+            count += db.session.execute(select(func.count()).select_from(model)
+                                        .where(model.calendar_id == calendar_id)
+                                        .where(model.start <= horizon_end).where(model.end >= horizon_start)).scalar()
+        recurrences = db.session.execute(
+            select(RecurEvent.start_recur, RecurEvent.end_recur, RecurEvent.recurrent_type,
+                   RecurEvent.recurrent_interval)
+            .where(RecurEvent.calendar_id == calendar_id).where(RecurEvent.start_recur <= horizon_end)
+            .where((RecurEvent.end_recur >= horizon_start) | RecurEvent.end_recur.is_(None)))
+        for start_recur, end_recur, recurrent_type, recurrent_interval in recurrences:
+            days = (min(end_recur or horizon_end, horizon_end) - max(start_recur, horizon_start)).days
+            period = _PERIOD_DAYS.get(recurrent_type, 1) * max(recurrent_interval or 1, 1)
+            count += days // period + 1
+        return count
+
+    def _refresh(self, calendar, horizon_start, horizon_end, load):
+        with self.lock:
+            if calendar.id in self.pending:
+                return
+        naive_start, naive_end = horizon_start.replace(tzinfo=None), horizon_end.replace(tzinfo=None)
+        if self.estimate(calendar.id, naive_start, naive_end) < self.min_occurrences:
+            # small calendars are read from the database anyway, their occurrences are not expanded
+            write_snapshot(self.path(calendar.id), calendar.change_count, to_micros(horizon_start),
+                           to_micros(horizon_end), [], small=True)
+            return
+        with self.lock:
+            if calendar.id in self.pending:
+                return
+            self.pending.add(calendar.id)
+        application = current_app._get_current_object()
+        self.executor.submit(self._rebuild_in_context, application, calendar.id, calendar.change_count,
+                             horizon_start, horizon_end, load)
+
+    def _rebuild_in_context(self, application, calendar_id, change_count, horizon_start, horizon_end, load):
+        with application.app_context():
+            try:
+                calendar = db.session.get(Calendar, calendar_id)
+                # a calendar changed since it was queued is queued again by its next reader
+                if calendar is not None and calendar.deleted_at is None and calendar.change_count == change_count:
+                    self._rebuild(calendar, change_count, horizon_start, horizon_end, load)
+            except Exception:
+                application.logger.exception('Rebuilding the occurrence snapshot of %s failed', calendar_id)
+            finally:
+                db.session.remove()
+                with self.lock:
+                    self.pending.discard(calendar_id)
+
+    def _open(self, calendar_id):
+        path = self.path(calendar_id)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        with self.lock:
+            snapshot = self.snapshots.get(calendar_id)
+            if snapshot is not None and (snapshot.stat.st_ino, snapshot.stat.st_mtime_ns) == \
+                    (stat.st_ino, stat.st_mtime_ns):
+                return snapshot
+        try:
+            snapshot = Snapshot(path)
+        except (OSError, ValueError, struct.error):
+            return None
+        with self.lock:
+            # readers of the replaced snapshot keep their own reference, the map is closed once they are done
+            self.snapshots[calendar_id] = snapshot
+        return snapshot
+
+    def _rebuild(self, calendar, change_count, horizon_start, horizon_end, load):
+        path = self.path(calendar.id)
+        lock_path = path + '.lock'
+        try:
+            lock = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                if time.time() - os.stat(lock_path).st_mtime > _LOCK_TIMEOUT:
+                    os.remove(lock_path)
+            except FileNotFoundError:
+                pass
+            return None
+        try:
+            occurrences = []
+            for event in load(calendar, horizon_start, horizon_end):
+                if event.id is None:
+                    kind = RECURRENCE
+                elif isinstance(event, ArchivedEvent):
+                    kind = ARCHIVED_EVENT
+                else:
+                    kind = EVENT
+                occurrences.append((to_micros(event.start), to_micros(event.end),
+                                    event.id.bytes if event.id else _EMPTY_ID,
+                                    event.recur_id.bytes if event.recur_id else _EMPTY_ID, kind))
+            write_snapshot(path, change_count, to_micros(horizon_start), to_micros(horizon_end), occurrences,
+                           small=len(occurrences) < self.min_occurrences)
+        finally:
+            os.close(lock)
+            os.remove(lock_path)
+        return self._open(calendar.id)
+
+    def remove(self, calendar_id):
+        with self.lock:
+            self.snapshots.pop(calendar_id, None)
+        try:
+            os.remove(self.path(calendar_id))
+        except FileNotFoundError:
+            pass
+
+
+def write_snapshot(path, change_count, horizon_start, horizon_end, occurrences, small=False):
+    """Write occurrence records sorted by start to a temporary file and move it in place atomically.
+
+    Snapshots of calendars with too few occurrences to be worth it are written without records.
+    """
+    occurrences = [] if small else sorted(occurrences)
+    max_duration = max((end - start for start, end, *_ in occurrences), default=0)
+    temporary_path = '{path}.{pid}.{thread}.tmp'.format(path=path, pid=os.getpid(), thread=threading.get_ident())
+    with open(temporary_path, 'wb') as file:
+        file.write(_HEADER.pack(_MAGIC, _VERSION, SMALL if small else 0, change_count, horizon_start, horizon_end,
+                                max_duration, len(occurrences)))
+        for start, end, row_id, recur_id, kind in occurrences:
+            file.write(_RECORD.pack(start, end, row_id, recur_id, kind))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary_path, path)
+
+
+_snapshot_store = None
+
+
+def get_snapshot_store():
+    """Get the snapshot store of this worker, or None if OCCURRENCE_SNAPSHOT_DIR is not set."""
+    global _snapshot_store
+    directory = current_app.config['OCCURRENCE_SNAPSHOT_DIR']
+    if not directory:
+        return None
+    if _snapshot_store is None or _snapshot_store.directory != directory:
+        _snapshot_store = SnapshotStore(directory, current_app.config['OCCURRENCE_SNAPSHOT_PAST_DAYS'],
+                                        current_app.config['OCCURRENCE_SNAPSHOT_FUTURE_DAYS'],
+                                        current_app.config['OCCURRENCE_SNAPSHOT_MIN_OCCURRENCES'])
+    return _snapshot_store
@@ -0,0 +1,72 @@
+"""Cached HTML of the modals of the legacy UI, and the bytecode cache of its templates.
+
+The legacy UI loads a modal from the server on every click, e.g. /render_new or /auth/render_password, whose markup
+only depends on the calendar name or a parameter of the request, and on the CSRF token of the session. Fragments are
+rendered once per key with a placeholder in place of the token, which is replaced by the token of the request when
+the fragment is sent. Requests with flashed messages, which are shown in the modal once, requests other than GET
+and auto reloaded templates are rendered as usual.
+
+Compiled templates are kept on disk by Jinja's bytecode cache, so new workers skip compiling them.
+"""
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+from flask import current_app, render_template, request, session
+from flask_wtf.csrf import generate_csrf
+from jinja2 import FileSystemBytecodeCache
+
+_TOKEN = 'csrf-{uuid}'.format(uuid=uuid.uuid4().hex)
+_MAX_FRAGMENTS = 1024
+
+_fragments = OrderedDict()
+_lock = threading.Lock()
+_metrics = {'hits': 0, 'misses': 0}
+
+
+def _cacheable():
+    return current_app.config['FRAGMENT_CACHE'] and request.method == 'GET' and '_flashes' not in session \
+        and not current_app.jinja_env.auto_reload
+
+
+def render_fragment(template_name, context=dict, key=()):
+    """Render a template, or get it from the fragment cache.
+
+    context returns the context of the template and is only called when it is rendered, key holds the values other
+    than the CSRF token the HTML depends on.
+    """
+    if not _cacheable():
+        return render_template(template_name, **context())
+    token = generate_csrf() if current_app.config['WTF_CSRF_ENABLED'] else None
+    cache_key = (template_name,) + tuple(key)
+    with _lock:
+        fragment = _fragments.get(cache_key)
+        if fragment is not None:
+            _fragments.move_to_end(cache_key)
+            _metrics['hits'] += 1
+    if fragment is None:
+        html = render_template(template_name, **context())
+        fragment = html.replace(token, _TOKEN) if token else html
+        with _lock:
+            _metrics['misses'] += 1
+            _fragments[cache_key] = fragment
+            while len(_fragments) > _MAX_FRAGMENTS:
+                _fragments.popitem(last=False)
+    return fragment.replace(_TOKEN, token) if token else fragment
+
+
+def get_metrics():
+    """Get the hits and misses of the fragment cache of this worker."""
+    with _lock:
+        return dict(_metrics, size=len(_fragments))
+
+
+def init_app(app):
+    """Keep compiled templates in JINJA_BYTECODE_CACHE_DIR, or a directory of the user in the temp directory."""
+    if not app.config['JINJA_BYTECODE_CACHE']:
+        return
+    directory = app.config['JINJA_BYTECODE_CACHE_DIR']
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
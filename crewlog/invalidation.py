@@ -0,0 +1,129 @@
+"""Versions of calendars and users shared by the workers of a host, for caches kept in each worker.
+
+Each calendar and user hashes to a slot of a memory mapped file of counters. The DAOs record the calendars and users
+they change on the session, once the session is committed their slots are incremented. A worker caching something
+derived from a calendar reads its version before loading it, and may keep using the cached value without asking
+the database while the version is unchanged. Slots are shared by many ids, which only costs extra reloads. The
+roles and calendar change counts of users behind their account ETags are kept this way, see
+calendar_dao.get_user_change_stamp, role changes publish the user and all other changes their calendars.
+
+Workers on other hosts do not see the increments, caches therefore trust a version for at most INVALIDATION_MAX_AGE
+seconds before checking the database again. Without INVALIDATION_DIR there is no bus, and caches check the database
+on every use.
+"""
+import fcntl
+import mmap
+import os
+import struct
+import time
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from crewlog import db
+
+_SLOT = struct.Struct('<Q')
+# slot 0 is incremented when all calendars change at once
+_EPOCH = 0
+_SLOTS = 1 << 16
+_CALENDAR_SLOTS = range(1, _SLOTS // 2)
+_USER_SLOTS = range(_SLOTS // 2, _SLOTS)
+
+_CALENDARS = 'invalidated_calendars'
+_USERS = 'invalidated_users'
+
+
+class InvalidationBus:
+    """Counter slots in directory/versions, mapped by every worker."""
+
+    def __init__(self, directory, max_age):
+        self.directory = directory
+        self.max_age = max_age
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, 'versions')
+        self.file = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self.file, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self.file).st_size < _SLOTS * _SLOT.size:
+                os.ftruncate(self.file, _SLOTS * _SLOT.size)
+        finally:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.map = mmap.mmap(self.file, _SLOTS * _SLOT.size)
+
+    def _read(self, slot):
+        return _SLOT.unpack_from(self.map, slot * _SLOT.size)[0]
+
+    def calendar_version(self, calendar_id):
+        """Get the version of a calendar, to be compared with a version read before loading a cached value."""
+        return self._read(_EPOCH), self._read(_CALENDAR_SLOTS[calendar_id.int % len(_CALENDAR_SLOTS)])
+
+    def user_version(self, user_id):
+        return self._read(_EPOCH), self._read(_USER_SLOTS[user_id.int % len(_USER_SLOTS)])
+
+    def publish(self, calendar_ids=(), user_ids=(), everything=False):
+        slots = {_CALENDAR_SLOTS[calendar_id.int % len(_CALENDAR_SLOTS)] for calendar_id in calendar_ids}
+        slots.update(_USER_SLOTS[user_id.int % len(_USER_SLOTS)] for user_id in user_ids)
+        if everything:
+            slots.add(_EPOCH)
+        if not slots:
+            return
+        fcntl.flock(self.file, fcntl.LOCK_EX)
+        try:
+            for slot in slots:
+                _SLOT.pack_into(self.map, slot * _SLOT.size, self._read(slot) + 1)
+        finally:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+
+
+class VersionCheck:
+    """A version of the bus read when a cached value was last confirmed by the database."""
+    __slots__ = ('version', 'checked_at')
+
+    def __init__(self, version):
+        self.version = version
+        self.checked_at = time.monotonic()
+
+    def is_current(self, bus, version):
+        return version == self.version and time.monotonic() - self.checked_at < bus.max_age
+
+
+def calendar_changed(calendar_id):
+    """Publish a change of the calendar once the session is committed."""
+    db.session.info.setdefault(_CALENDARS, set()).add(calendar_id)
+
+
+def user_changed(user_id):
+    """Publish a change of the user once the session is committed."""
+    db.session.info.setdefault(_USERS, set()).add(user_id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish(session):
+    calendar_ids = session.info.pop(_CALENDARS, ())
+    user_ids = session.info.pop(_USERS, ())
+    if not calendar_ids and not user_ids:
+        return
+    bus = get_invalidation_bus()
+    if bus:
+        bus.publish(calendar_ids, user_ids)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard(session):
+    session.info.pop(_CALENDARS, None)
+    session.info.pop(_USERS, None)
+
+
+_invalidation_bus = None
+
+
+def get_invalidation_bus():
+    """Get the invalidation bus of this worker, or None if INVALIDATION_DIR is not set."""
+    global _invalidation_bus
+    directory, max_age = current_app.config['INVALIDATION_DIR'], current_app.config['INVALIDATION_MAX_AGE']
+    if not directory:
+        return None
+    if _invalidation_bus is None or (_invalidation_bus.directory, _invalidation_bus.max_age) != (directory, max_age):
+        _invalidation_bus = InvalidationBus(directory, max_age)
+    return _invalidation_bus
@@ -1,12 +1,12 @@
 import flask_login
-from flask import request, render_template, redirect, url_for, jsonify, send_from_directory
-import os
+from flask import request, render_template, redirect, url_for, jsonify
 
-from crewlog import application
+from crewlog import application, static_assets, bootstrap, fragments
 from crewlog.auth import auth_dao, auth_api
 from crewlog.calendar import calendar_dao, calendar, calendar_api
 from crewlog.event import event, event_api, event_dao
 from crewlog.admin import admin, admin_api
+from crewlog.api import batch_api, compression
 from crewlog.api import auth_api as api_auth, user_api, calendar_api as api_calendar, event_api as api_event, admin_api as api_admin
 from .auth import auth
 from flask_login import LoginManager
@@ -45,15 +45,20 @@ application.register_blueprint(user_api.bp)
 application.register_blueprint(api_calendar.bp)
 application.register_blueprint(api_event.bp)
 application.register_blueprint(api_admin.bp)
+application.register_blueprint(batch_api.bp)
+
+application.after_request(compression.compress_response)
+static_assets.init_app(application)
+fragments.init_app(application)
 
 
 @application.route('/')
 def main():
     """Main route - serve React app or legacy template."""
     # Check if React build exists
-    static_folder = application.static_folder
-    if static_folder and os.path.exists(os.path.join(static_folder, 'index.html')):
-        return send_from_directory(static_folder, 'index.html')
+    index = static_assets.get_asset_manifest().index
+    if index:
+        return send_index(index, include_events=True)
     
     # Fallback to legacy template if user is authenticated
     if flask_login.current_user.is_authenticated:
@@ -68,19 +73,29 @@ def main():
     return redirect(url_for('auth.login'))
 
 
-# Serve React app for all other routes (client-side routing)
+def send_index(index, include_events):
+    """Send index.html, with the bootstrap data of the signed in user if INDEX_BOOTSTRAP is set."""
+    page = bootstrap.render_index(index, include_events) if application.config['INDEX_BOOTSTRAP'] else None
+    if page is None:
+        return static_assets.send_asset(index)
+    response = static_assets.send_asset(page)
+    response.cache_control.private = True
+    return response
+
+
+# Serve React app for all other routes (client-side routing), the static route of the build folder as well, so that
+# client-side routes are not answered with a 404 by it
 @application.route('/<path:path>')
-def serve_react(path):
+@application.endpoint('static')
+def serve_react(path=None, filename=None):
     """Serve React frontend for client-side routing."""
-    static_folder = application.static_folder
-    
-    if static_folder and os.path.exists(static_folder):
-        # Serve static files
-        if os.path.exists(os.path.join(static_folder, path)):
-            return send_from_directory(static_folder, path)
-        # Serve index.html for client-side routing
-        if os.path.exists(os.path.join(static_folder, 'index.html')):
-            return send_from_directory(static_folder, 'index.html')
+    path = path or filename
+    manifest = static_assets.get_asset_manifest()
+    asset = manifest.get(path) if not path.startswith('api/') else None
+    if asset is not None and asset is manifest.index:
+        return send_index(asset, include_events=False)
+    if asset:
+        return static_assets.send_asset(asset)
     
     # Return 404 for unknown paths
     return jsonify({'error': 'Not found'}), 404
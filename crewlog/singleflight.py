@@ -0,0 +1,73 @@
+"""Coalescing of identical computations running at the same time in a worker.
+
+When many volunteers open the same calendar week at once, the threads of a worker would all expand the same range.
+A SingleFlight lets the first thread compute the result for a key while the others wait for it and share it, so
+results must not be changed by their callers and must not hold objects bound to the session of the computing
+thread. Keys have to include the change stamp of the calendar, a computation started before a write is not shared
+with requests made after it.
+"""
+import threading
+
+_groups = {}
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Computations in flight by key, with counters of executed and coalesced calls."""
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = {}
+        self.lock = threading.Lock()
+        self.executed = 0
+        self.coalesced = 0
+        self.max_waiters = 0
+        _groups[name] = self
+
+    def do(self, key, compute):
+        """Get compute(), or the result of the call with the same key that is already running."""
+        with self.lock:
+            call = self.calls.get(key)
+            running = call is not None
+            if running:
+                call.waiters += 1
+                self.coalesced += 1
+                self.max_waiters = max(self.max_waiters, call.waiters)
+            else:
+                call = self.calls[key] = _Call()
+                self.executed += 1
+        if running:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = compute()
+        except Exception as error:
+            call.error = error
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result
+
+    @property
+    def metrics(self):
+        with self.lock:
+            return {'executed': self.executed, 'coalesced': self.coalesced, 'inFlight': len(self.calls),
+                    'maxWaiters': self.max_waiters}
+
+
+def get_metrics():
+    """Get the counters of all single flight groups of this worker by name."""
+    return {name: group.metrics for name, group in _groups.items()}
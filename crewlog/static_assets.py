@@ -0,0 +1,151 @@
+"""In-memory manifest of the React build, served without touching the filesystem after startup.
+
+Every file of the build is read once when the application starts, with its gzip and brotli variants. Variants are
+taken from .gz and .br files next to an asset, as written by `flask compress-assets` when the image is built,
+otherwise they are compressed at startup. Assets whose names carry a content hash, like static/js/main.1a2b3c4d.js,
+never change under their URL and are cached by browsers for a year, all others are revalidated with their ETag.
+Paths that are not in the build get index.html, for the client side routes of the React app.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+
+import click
+from flask import current_app, request
+
+from crewlog import application
+from crewlog.api.compression import BROTLI, GZIP, brotli
+
+# content hashes of create-react-app builds, e.g. main.1a2b3c4d.js or logo.6ce24c58023cc2f8fd88.svg
+_FINGERPRINT = re.compile(r'\.[0-9a-f]{8,32}\.')
+_COMPRESSIBLE = ('text/', 'application/javascript', 'application/json', 'application/manifest+json',
+                 'application/xml', 'image/svg+xml')
+# assets are compressed once, so the smallest output is worth the time
+_GZIP_LEVEL = 9
+_BROTLI_QUALITY = 11
+_MIN_SIZE = 512
+_SUFFIXES = {GZIP: '.gz', BROTLI: '.br'}
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+class Asset:
+    """A file of the build with its content, ETag and compressed variants by encoding."""
+    __slots__ = ('path', 'data', 'mimetype', 'etag', 'immutable', 'variants')
+
+    def __init__(self, path, data, mimetype, immutable):
+        self.path = path
+        self.data = data
+        self.mimetype = mimetype
+        self.etag = hashlib.sha1(data).hexdigest()[:20]
+        self.immutable = immutable
+        self.variants = {}
+
+    @property
+    def compressible(self):
+        return self.mimetype.startswith(_COMPRESSIBLE) and len(self.data) >= _MIN_SIZE
+
+    def compress(self, gzip_level=_GZIP_LEVEL, brotli_quality=_BROTLI_QUALITY):
+        """Compress the variants that were not found on disk, variants that do not shrink the asset are dropped."""
+        if not self.compressible:
+            return
+        if GZIP not in self.variants:
+            self.variants[GZIP] = gzip.compress(self.data, gzip_level, mtime=0)
+        if BROTLI not in self.variants and brotli:
+            self.variants[BROTLI] = brotli.compress(self.data, quality=brotli_quality)
+        for encoding, data in list(self.variants.items()):
+            if len(data) >= len(self.data):
+                del self.variants[encoding]
+
+
+class AssetManifest:
+    """Assets of a build directory by their URL path."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.assets = {}
+        if not directory or not os.path.isdir(directory):
+            return
+        variants = []
+        for root, _, names in os.walk(directory):
+            for name in names:
+                full_path = os.path.join(root, name)
+                path = os.path.relpath(full_path, directory).replace(os.sep, '/')
+                encoding = next((encoding for encoding, suffix in _SUFFIXES.items() if name.endswith(suffix)), None)
+                # compressed files without their original are assets of their own, e.g. downloadable archives
+                if encoding and name[:-len(_SUFFIXES[encoding])] in names:
+                    variants.append((path[:-len(_SUFFIXES[encoding])], encoding, full_path))
+                    continue
+                with open(full_path, 'rb') as file:
+                    data = file.read()
+                mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+                self.assets[path] = Asset(path, data, mimetype, bool(_FINGERPRINT.search(name)))
+        for path, encoding, full_path in variants:
+            with open(full_path, 'rb') as file:
+                self.assets[path].variants[encoding] = file.read()
+        for asset in self.assets.values():
+            asset.compress()
+
+    @property
+    def index(self):
+        return self.assets.get('index.html')
+
+    def get(self, path):
+        """Get the asset of a path, index.html for paths outside of the build, or None without a build."""
+        return self.assets.get(path.lstrip('/')) or self.index
+
+
+def _choose_variant(asset):
+    accepted = request.accept_encodings
+    encodings = [encoding for encoding in (BROTLI, GZIP) if encoding in asset.variants and accepted[encoding]]
+    if not encodings:
+        return None, asset.data
+    encoding = max(encodings, key=lambda encoding: accepted[encoding])
+    return encoding, asset.variants[encoding]
+
+
+def send_asset(asset):
+    """Get a response for an asset, in the best encoding the client accepts."""
+    encoding, data = _choose_variant(asset)
+    etag = asset.etag if encoding is None else '{etag}-{encoding}'.format(etag=asset.etag, encoding=encoding)
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.response_class(data, mimetype=asset.mimetype)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    if asset.variants:
+        response.vary.add('Accept-Encoding')
+    if asset.immutable:
+        response.headers['Cache-Control'] = IMMUTABLE
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+
+def init_app(app):
+    """Build the manifest of the static folder of the application."""
+    app.extensions['asset_manifest'] = AssetManifest(app.static_folder)
+
+
+def get_asset_manifest():
+    return current_app.extensions['asset_manifest']
+
+
+@application.cli.command('compress-assets')
+def compress_assets():
+    """Write the gzip and brotli variants of the React build next to its files, to skip compressing them at startup."""
+    manifest = get_asset_manifest()
+    if not manifest.assets:
+        raise click.ClickException('No build found in {directory}'.format(directory=manifest.directory))
+    written = 0
+    for asset in manifest.assets.values():
+        for encoding, data in asset.variants.items():
+            path = os.path.join(manifest.directory, asset.path + _SUFFIXES[encoding])
+            if not os.path.exists(path):
+                with open(path, 'wb') as file:
+                    file.write(data)
+                written += 1
+    click.echo('Wrote {written} compressed files'.format(written=written))
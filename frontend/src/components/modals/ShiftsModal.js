@@ -21,6 +21,11 @@ const ShiftsModal = ({ show, onHide, event, onSave }) => {
       setVolunteers([]);
       return;
     }
+    if (Array.isArray(event.volunteers)) {
+      setVolunteers(event.volunteers);
+      setRemovedShifts([]);
+      return;
+    }
 
     setFetchLoading(true);
     try {
@@ -1,5 +1,6 @@
 import React, { createContext, useContext, useState, useEffect } from 'react';
 import api from '../services/api';
+import { takeMe } from '../services/bootstrap';
 
 const AuthContext = createContext(null);
 
@@ -23,10 +24,10 @@ export const AuthProvider = ({ children }) => {
 
   const checkAuth = async () => {
     try {
-      const response = await api.get('/api/v1/auth/me');
-      setUser(response.data.user);
-      setCalendars(response.data.calendars || []);
-      setCurrentCalendar(response.data.currentCalendar || null);
+      const data = takeMe() || (await api.get('/api/v1/auth/me')).data;
+      setUser(data.user);
+      setCalendars(data.calendars || []);
+      setCurrentCalendar(data.currentCalendar || null);
     } catch (error) {
       setUser(null);
       setCalendars([]);
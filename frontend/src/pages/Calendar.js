@@ -7,6 +7,7 @@ import listPlugin from '@fullcalendar/list';
 import interactionPlugin from '@fullcalendar/interaction';
 import { useAuth } from '../contexts/AuthContext';
 import { eventApi } from '../services/api';
+import { takeEvents } from '../services/bootstrap';
 import EventModal from '../components/modals/EventModal';
 import ShiftsModal from '../components/modals/ShiftsModal';
 import RecurrentModal from '../components/modals/RecurrentModal';
@@ -48,14 +49,20 @@ const Calendar = () => {
 
   // Fetch events
   const fetchEvents = useCallback(async (fetchInfo, successCallback, failureCallback) => {
+    const inlined = currentCalendar && takeEvents(currentCalendar.id, fetchInfo.startStr, fetchInfo.endStr);
+    if (inlined) {
+      successCallback(inlined);
+      return;
+    }
     try {
-      const response = await eventApi.getEvents(fetchInfo.startStr, fetchInfo.endStr);
+      // volunteers come with the events, so the shifts modal does not request them per click
+      const response = await eventApi.getEventsWithShifts(fetchInfo.startStr, fetchInfo.endStr);
       successCallback(response.data);
     } catch (err) {
       setError('Failed to load events');
       failureCallback(err);
     }
-  }, []);
+  }, [currentCalendar]);
 
   // Handle date selection (create new event)
   const handleDateSelect = (selectInfo) => {
@@ -80,7 +87,8 @@ const Calendar = () => {
       end: event.end || event.start,
       allDay: event.allDay,
       description: event.extendedProps.description || '',
-      recurId: event.extendedProps.recurId
+      recurId: event.extendedProps.recurId,
+      volunteers: event.extendedProps.volunteers
     };
 
     if (editable) {
@@ -46,9 +46,18 @@ export default api;
 // Event API
 export const eventApi = {
   getEvents: (start, end) => api.get('/api/v1/calendars/events/', { params: { start, end } }),
+  searchEvents: (q, page = 1, perPage = 20) =>
+    api.get('/api/v1/calendars/events/search', { params: { q, page, perPage } }),
+  getOverlayEvents: (start, end, calendarIds) =>
+    api.get('/api/v1/calendars/events/overlay', { params: { start, end, calendars: calendarIds.join(',') } }),
   createEvent: (data) => api.post('/api/v1/calendars/events/', data),
   updateEvent: (data) => api.post('/api/v1/calendars/events/', data),
+  patchEvent: (eventId, data) => api.patch(`/api/v1/calendars/events/${eventId}`, data),
   deleteEvent: (data) => api.delete('/api/v1/calendars/events/', { data }),
+  batch: (operations, timeZone) => api.post('/api/v1/calendars/events/batch', { operations, timeZone }),
+  copyEvents: (data) => api.post('/api/v1/calendars/events/copy', data),
+  getEventsWithShifts: (start, end) =>
+    api.get('/api/v1/calendars/events/', { params: { start, end, include: 'shifts' } }),
   getEventDetails: (eventId) => api.get(`/api/v1/calendars/events/${eventId}/details`),
   updateRecurrentEvent: (data) => api.post('/api/v1/calendars/events/recurrent', data),
   deleteRecurrentEvent: (data) => api.delete('/api/v1/calendars/events/recurrent', { data }),
@@ -67,6 +76,11 @@ export const calendarApi = {
   setDefault: (calendarId) => api.post('/api/v1/calendars/default', { calendarId }),
 };
 
+// Batch API, requests are paths or { id, path, headers } objects of GET requests
+export const batchApi = {
+  get: (requests) => api.post('/api/v1/batch', { requests }).then(response => response.data.responses),
+};
+
 // Admin API
 export const adminApi = {
   getUsers: () => api.get('/api/v1/admin/users'),
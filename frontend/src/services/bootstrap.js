@@ -0,0 +1,28 @@
+// Data the server inlines into index.html for signed in users, each part is used once instead of its first request
+const element = document.getElementById('bootstrap-data');
+let data = null;
+if (element) {
+  try {
+    data = JSON.parse(element.textContent);
+  } catch (error) {
+    data = null;
+  }
+}
+
+// The /api/v1/auth/me payload, or null
+export const takeMe = () => {
+  const me = data ? data.me : null;
+  if (data) data.me = null;
+  return me;
+};
+
+// The events of the calendar overlapping the range, or null if the inlined window does not cover it
+export const takeEvents = (calendarId, start, end) => {
+  const events = data ? data.events : null;
+  if (!events || events.calendarId !== calendarId) return null;
+  const rangeStart = new Date(start);
+  const rangeEnd = new Date(end);
+  if (rangeStart < new Date(events.start) || rangeEnd > new Date(events.end)) return null;
+  data.events = null;
+  return events.items.filter(event => new Date(event.start) <= rangeEnd && new Date(event.end) >= rangeStart);
+};
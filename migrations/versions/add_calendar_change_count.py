@@ -0,0 +1,25 @@
+"""Add change count to calendars
+
+Revision ID: add_calendar_change_count
+Revises: add_event_partitions
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_calendar_change_count'
+down_revision = 'add_event_partitions'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('calendar', sa.Column('change_count', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('calendar') as batch_op:
+        batch_op.drop_column('change_count')
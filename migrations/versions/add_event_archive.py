@@ -0,0 +1,53 @@
+"""Add archive tables for past events and shifts
+
+Revision ID: add_event_archive
+Revises: add_event_search
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from crewlog.database import GUID
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_event_archive'
+down_revision = 'add_event_search'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('calendar', sa.Column('archived_until', sa.DateTime(), nullable=True))
+    op.create_table('event_archive',
+        sa.Column('id', GUID(), nullable=False),
+        sa.Column('title', sa.String(length=256), nullable=False),
+        sa.Column('description', sa.Text(), nullable=False),
+        sa.Column('start', sa.DateTime(), nullable=False),
+        sa.Column('end', sa.DateTime(), nullable=False),
+        sa.Column('all_day', sa.Boolean(), nullable=False),
+        sa.Column('calendar_id', GUID(), nullable=False),
+        sa.Column('recur_id', GUID(), nullable=True),
+        sa.Column('init_start', sa.DateTime(), nullable=True),
+        sa.Column('hide', sa.Boolean(), nullable=False),
+        sa.ForeignKeyConstraint(['calendar_id'], ['calendar.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_event_archive_calendar_start', 'event_archive', ['calendar_id', 'start'])
+    op.create_table('shift_archive',
+        sa.Column('id', GUID(), nullable=False),
+        sa.Column('person', sa.String(length=80), nullable=False),
+        sa.Column('event_id', GUID(), nullable=False),
+        sa.ForeignKeyConstraint(['event_id'], ['event_archive.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_shift_archive_event_id', 'shift_archive', ['event_id'])
+
+
+def downgrade():
+    op.drop_index('ix_shift_archive_event_id', table_name='shift_archive')
+    op.drop_table('shift_archive')
+    op.drop_index('ix_event_archive_calendar_start', table_name='event_archive')
+    op.drop_table('event_archive')
+    with op.batch_alter_table('calendar') as batch_op:
+        batch_op.drop_column('archived_until')
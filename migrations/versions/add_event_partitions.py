@@ -0,0 +1,31 @@
+"""Partition events and shifts by month on PostgreSQL, when PARTITION_EVENTS is enabled
+
+Revision ID: add_event_partitions
+Revises: add_event_archive
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+from flask import current_app
+
+from crewlog.event import partitions
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_event_partitions'
+down_revision = 'add_event_archive'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql' and current_app.config['PARTITION_EVENTS'] \
+            and not partitions.check_partitioned(bind):
+        partitions.partition_tables(bind, current_app.config['PARTITION_MONTHS_AHEAD'])
+
+
+def downgrade():
+    bind = op.get_bind()
+    if partitions.check_partitioned(bind):
+        partitions.unpartition_tables(bind)
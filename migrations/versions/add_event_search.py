@@ -0,0 +1,71 @@
+"""Add full-text search index for event titles and descriptions
+
+Revision ID: add_event_search
+Revises: add_admin_email
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_event_search'
+down_revision = 'add_admin_email'
+branch_labels = None
+depends_on = None
+
+# searched table -> condition for rows that are indexed
+SEARCHED_TABLES = {'event': 'NEW.hide = 0', 'recur_event': '1'}
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        for table in SEARCHED_TABLES:
+            op.execute("ALTER TABLE {table} ADD COLUMN search tsvector GENERATED ALWAYS AS ("
+                       "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+                       "setweight(to_tsvector('simple', coalesce(description, '')), 'B')) STORED"
+                       .format(table=table))
+            op.create_index('ix_{table}_search'.format(table=table), table, ['search'], postgresql_using='gin')
+    elif bind.dialect.name == 'sqlite':
+        # FTS5 rowids are kept in a plain table, SQLite may renumber the implicit rowids of event on VACUUM
+        op.execute("CREATE TABLE event_search_doc ("
+                   "docid INTEGER PRIMARY KEY, item_id CHAR(32) NOT NULL UNIQUE, kind VARCHAR(16) NOT NULL)")
+        op.execute("CREATE VIRTUAL TABLE event_search USING fts5(title, description, calendar_id)")
+        for table, condition in SEARCHED_TABLES.items():
+            index_new = ("INSERT INTO event_search_doc (item_id, kind) SELECT NEW.id, '{table}' WHERE {condition}; "
+                         "INSERT INTO event_search (rowid, title, description, calendar_id) "
+                         "SELECT docid, NEW.title, NEW.description, NEW.calendar_id "
+                         "FROM event_search_doc WHERE item_id = NEW.id;").format(table=table, condition=condition)
+            remove_old = ("DELETE FROM event_search WHERE rowid = "
+                          "(SELECT docid FROM event_search_doc WHERE item_id = OLD.id); "
+                          "DELETE FROM event_search_doc WHERE item_id = OLD.id;")
+            op.execute("CREATE TRIGGER {table}_search_insert AFTER INSERT ON {table} BEGIN {index_new} END"
+                       .format(table=table, index_new=index_new))
+            op.execute("CREATE TRIGGER {table}_search_delete AFTER DELETE ON {table} BEGIN {remove_old} END"
+                       .format(table=table, remove_old=remove_old))
+            op.execute("CREATE TRIGGER {table}_search_update AFTER UPDATE OF title, description, calendar_id{hide} "
+                       "ON {table} BEGIN {remove_old} {index_new} END"
+                       .format(table=table, hide=', hide' if table == 'event' else '',
+                               remove_old=remove_old, index_new=index_new))
+            op.execute("INSERT INTO event_search_doc (item_id, kind) SELECT id, '{table}' FROM {table} WHERE {condition}"
+                       .format(table=table, condition=condition.replace('NEW.', '')))
+        op.execute("INSERT INTO event_search (rowid, title, description, calendar_id) "
+                   "SELECT d.docid, e.title, e.description, e.calendar_id FROM event e "
+                   "JOIN event_search_doc d ON d.item_id = e.id "
+                   "UNION ALL SELECT d.docid, r.title, r.description, r.calendar_id FROM recur_event r "
+                   "JOIN event_search_doc d ON d.item_id = r.id")
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        for table in SEARCHED_TABLES:
+            op.drop_index('ix_{table}_search'.format(table=table), table_name=table)
+            op.drop_column(table, 'search')
+    elif bind.dialect.name == 'sqlite':
+        for table in SEARCHED_TABLES:
+            for action in ('insert', 'delete', 'update'):
+                op.execute("DROP TRIGGER IF EXISTS {table}_search_{action}".format(table=table, action=action))
+        op.execute("DROP TABLE IF EXISTS event_search")
+        op.execute("DROP TABLE IF EXISTS event_search_doc")
@@ -0,0 +1,55 @@
+"""Keep the search index of SQLite independent of the GUID storage
+
+Revision ID: add_guid_storage_triggers
+Revises: add_purge_jobs
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_guid_storage_triggers'
+down_revision = 'add_purge_jobs'
+branch_labels = None
+depends_on = None
+
+# searched table -> condition for rows that are indexed, as in add_event_search
+SEARCHED_TABLES = {'event': 'NEW.hide = 0', 'recur_event': '1'}
+
+
+def _as_hex(column):
+    # ids are kept as hex in event_search_doc and event_search, whether GUIDs are stored as hex or binary
+    return "(CASE typeof({column}) WHEN 'blob' THEN lower(hex({column})) ELSE {column} END)".format(column=column)
+
+
+def _create_triggers(key):
+    for table, condition in SEARCHED_TABLES.items():
+        index_new = ("INSERT INTO event_search_doc (item_id, kind) SELECT {new_id}, '{table}' WHERE {condition}; "
+                     "INSERT INTO event_search (rowid, title, description, calendar_id) "
+                     "SELECT docid, NEW.title, NEW.description, {calendar_id} "
+                     "FROM event_search_doc WHERE item_id = {new_id};").format(
+            table=table, condition=condition, new_id=key('NEW.id'), calendar_id=key('NEW.calendar_id'))
+        remove_old = ("DELETE FROM event_search WHERE rowid = "
+                      "(SELECT docid FROM event_search_doc WHERE item_id = {old_id}); "
+                      "DELETE FROM event_search_doc WHERE item_id = {old_id};").format(old_id=key('OLD.id'))
+        for action in ('insert', 'delete', 'update'):
+            op.execute("DROP TRIGGER IF EXISTS {table}_search_{action}".format(table=table, action=action))
+        op.execute("CREATE TRIGGER {table}_search_insert AFTER INSERT ON {table} BEGIN {index_new} END"
+                   .format(table=table, index_new=index_new))
+        op.execute("CREATE TRIGGER {table}_search_delete AFTER DELETE ON {table} BEGIN {remove_old} END"
+                   .format(table=table, remove_old=remove_old))
+        op.execute("CREATE TRIGGER {table}_search_update AFTER UPDATE OF title, description, calendar_id{hide} "
+                   "ON {table} BEGIN {remove_old} {index_new} END"
+                   .format(table=table, hide=', hide' if table == 'event' else '',
+                           remove_old=remove_old, index_new=index_new))
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        _create_triggers(_as_hex)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        _create_triggers(lambda column: column)
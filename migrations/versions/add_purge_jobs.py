@@ -0,0 +1,64 @@
+"""Add purge jobs for deleted calendars and cascading foreign keys
+
+Revision ID: add_purge_jobs
+Revises: add_calendar_change_count
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from crewlog.database import GUID
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_purge_jobs'
+down_revision = 'add_calendar_change_count'
+branch_labels = None
+depends_on = None
+
+# foreign keys removing rows along with their parent row, SQLite is used without foreign key enforcement
+CASCADED = (('event', 'calendar_id', 'calendar'),
+            ('recur_event', 'calendar_id', 'calendar'),
+            ('event_archive', 'calendar_id', 'calendar'),
+            ('role', 'calendar_id', 'calendar'),
+            ('shift', 'event_id', 'event'),
+            ('shift_archive', 'event_id', 'event_archive'))
+
+
+def upgrade():
+    op.add_column('calendar', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    op.create_table('purge_job',
+        sa.Column('id', GUID(), nullable=False),
+        sa.Column('calendar_id', GUID(), nullable=False),
+        sa.Column('requested_by_id', GUID(), nullable=True),
+        sa.Column('status', sa.String(length=16), nullable=False),
+        sa.Column('total_rows', sa.Integer(), nullable=False),
+        sa.Column('deleted_rows', sa.Integer(), nullable=False),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    _set_on_delete('CASCADE')
+
+
+def downgrade():
+    _set_on_delete(None)
+    op.drop_table('purge_job')
+    with op.batch_alter_table('calendar') as batch_op:
+        batch_op.drop_column('deleted_at')
+
+
+def _set_on_delete(ondelete):
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+    inspector = sa.inspect(bind)
+    for table, column, referred_table in CASCADED:
+        # a partitioned shift table is behind a view and cascades already
+        for foreign_key in inspector.get_foreign_keys(table):
+            if foreign_key['constrained_columns'] == [column] and foreign_key['referred_table'] == referred_table:
+                op.drop_constraint(foreign_key['name'], table, type_='foreignkey')
+                op.create_foreign_key(foreign_key['name'], table, referred_table, [column], ['id'],
+                                      ondelete=ondelete)
@@ -0,0 +1,63 @@
+"""Binary GUID storage on SQLite, with ids of copied rows generated by INSERT ... SELECT statements."""
+import os
+import tempfile
+import uuid
+
+# the app reads its settings when it is imported
+os.environ['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'crewlog.db')
+os.environ['GUID_STORAGE'] = 'binary'
+os.environ['APP_URL'] = 'http://localhost'
+
+import pytest  # noqa: E402
+from sqlalchemy import func, select  # noqa: E402
+
+import crewlog.main  # noqa: E402,F401
+from crewlog import application, db  # noqa: E402
+from crewlog.auth import auth_dao  # noqa: E402
+from crewlog.calendar.models import Calendar  # noqa: E402
+from crewlog.event.models import Event, RecurEvent, Shift  # noqa: E402
+
+EVENTS = '/api/v1/calendars/events/'
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(auth_dao, 'prepare_email', lambda *args, **kwargs: None)
+    with application.app_context():
+        db.drop_all()
+        db.create_all()
+        auth_dao.add_user('owner@example.com', 'password', 'Owner', 'Example')
+    client = application.test_client()
+    response = client.post('/api/v1/auth/login', json={'email': 'owner@example.com', 'password': 'password'})
+    assert response.status_code == 200
+    return client
+
+
+def test_cloned_calendar_is_found_by_id(client):
+    source_id = client.get('/api/v1/auth/me').get_json()['calendars'][0]['calendar_id']
+    client.post(EVENTS, json={'eventTitle': 'Orientation', 'description': '', 'start': '2026-10-05T08:00:00Z',
+                              'end': '2026-10-05T09:00:00Z'})
+    client.post(EVENTS, json={'eventTitle': 'Weekly shift', 'description': '', 'start': '2026-10-06T08:00:00Z',
+                              'end': '2026-10-06T09:00:00Z', 'recurrent': 'weekly', 'recurrentInterval': 1,
+                              'timeZone': 'UTC'})
+    event = client.get(EVENTS, query_string={'start': '2026-10-05T00:00:00Z', 'end': '2026-10-06T00:00:00Z'}) \
+        .get_json()[0]
+    client.post(EVENTS + 'shifts', json={'eventId': event['id'], 'start': event['start'], 'end': event['end'],
+                                         'newNameText': 'Volunteer'})
+
+    response = client.post('/api/v1/calendars/{id}/clone'.format(id=source_id), json={'includeShifts': True})
+    assert response.status_code == 201
+    clone_id = uuid.UUID(response.get_json()['calendar']['id'])
+
+    with application.app_context():
+        for model, column in ((Event, Event.id), (RecurEvent, RecurEvent.id), (Shift, Shift.id)):
+            assert set(db.session.scalars(select(func.typeof(column)))) == {'blob'}, model.__name__
+        assert db.session.get(Calendar, clone_id) is not None
+        copies = db.session.scalars(select(Event).where(Event.calendar_id == clone_id)).all()
+        assert [copy.title for copy in copies] == ['Orientation']
+        assert db.session.get(Event, copies[0].id).shifts[0].person == 'Volunteer'
+
+    # the clone is the default calendar now, its events are read by id through the API
+    response = client.get(EVENTS + '{id}/details'.format(id=copies[0].id))
+    assert response.status_code == 200
+    assert response.get_json()['volunteers'][0]['person'] == 'Volunteer'